@@ -0,0 +1,120 @@
+"""
+Encoding time and peak memory of the COPY streams, and optionally the load into a scratch table
+
+    python -m flows.benchmarks.bench_copy --rows 200000
+    python -m flows.benchmarks.bench_copy --rows 200000 --dsn "host=localhost dbname=test user=postgres"
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from flows.postgres.client import get_csv_stream, get_binary_stream
+from flows.postgres.schemas import SIMPLE_CANDLE_SCHEMA
+from flows.util.string_iterator_io import StringIteratorIO
+
+COPY_READ_SIZE = 8192  # psycopg2's copy_expert read size
+
+
+def make_candles(rows: int, seed: int = 0) -> pd.DataFrame:
+    '''
+    Minute candles in SIMPLE_CANDLE_SCHEMA column order
+    '''
+    rng = np.random.default_rng(seed)
+    minutes = pd.date_range('2020-01-02 09:30', periods=rows, freq='min')
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, rows)))
+    return pd.DataFrame({
+        'date': minutes.date,
+        'time': minutes.time,
+        'open': close.round(4),
+        'high': (close * 1.001).round(4),
+        'low': (close * 0.999).round(4),
+        'close': close.round(4),
+        'volume': rng.integers(100, 100000, rows).astype(np.float64),
+        'ticker': np.repeat(['SYM{:04d}'.format(i) for i in range(rows // 1000 + 1)], 1000)[:rows],
+        'timeframe': '1min',
+    })
+
+
+def get_baseline_csv_stream(df: pd.DataFrame):
+    '''
+    The stream upsert_from_df used before chunked COPY: the whole frame rendered to one string
+    '''
+    data = df.to_csv(index=False, header=False)[:-1]
+    return StringIteratorIO(row + '\n' for row in data.split('\n'))
+
+
+def get_streams(chunk_size: int) -> dict:
+    return {
+        'csv-baseline': lambda df: get_baseline_csv_stream(df),
+        'csv-chunked': lambda df: get_csv_stream(df, chunk_size=chunk_size),
+        'binary': lambda df: get_binary_stream(df, SIMPLE_CANDLE_SCHEMA, chunk_size=chunk_size),
+    }
+
+
+def drain(stream):
+    while stream.read(COPY_READ_SIZE):
+        pass
+    stream.close()
+
+
+def run_encode(df: pd.DataFrame, streams: dict) -> list:
+    '''
+    :return: [(stream name, seconds, peak traced MB)] for reading each stream the way COPY does.
+             Time and memory come from separate passes, tracing slows the encoders down.
+    '''
+    results = []
+    for name, make_stream in streams.items():
+        start_time = time.perf_counter()
+        drain(make_stream(df))
+        seconds = time.perf_counter() - start_time
+        tracemalloc.start()
+        drain(make_stream(df))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append((name, seconds, peak / 1e6))
+    return results
+
+
+def run_copy(df: pd.DataFrame, streams: dict, dsn: str) -> list:
+    '''
+    :return: [(stream name, seconds)] for COPY into a temporary table
+    '''
+    import psycopg2
+    results = []
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cursor:
+        cursor.execute('CREATE TEMP TABLE bench_copy ({})'.format(SIMPLE_CANDLE_SCHEMA.sql_string))
+        for name, make_stream in streams.items():
+            cursor.execute('TRUNCATE bench_copy')
+            copy_format = 'BINARY' if name.startswith('binary') else 'CSV'
+            start_time = time.perf_counter()
+            cursor.copy_expert('COPY bench_copy FROM STDIN WITH (FORMAT {})'.format(copy_format), make_stream(df))
+            results.append((name, time.perf_counter() - start_time))
+        conn.rollback()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--dsn', help='libpq connection string, also runs the COPY when given')
+    args = parser.parse_args()
+
+    df = make_candles(args.rows)
+    streams = get_streams(args.chunk_size)
+    print('{} rows'.format(args.rows))
+    print('{:<14} {:>10} {:>14}'.format('stream', 'encode s', 'peak MB'))
+    for name, seconds, peak in run_encode(df, streams):
+        print('{:<14} {:>10.2f} {:>14.1f}'.format(name, seconds, peak))
+    if args.dsn:
+        print('{:<14} {:>10}'.format('stream', 'copy s'))
+        for name, seconds in run_copy(df, streams, args.dsn):
+            print('{:<14} {:>10.2f}'.format(name, seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Size and speed of the parquet encoding profiles on synthetic daily OHLCV data
+
+    python -m flows.benchmarks.bench_parquet_profiles --symbols 500 --days 1260
+"""
+
+import argparse
+import io
+import time
+
+import numpy as np
+import pandas as pd
+
+from flows.util.parquet_profiles import PROFILES
+
+
+def make_prices(symbols: int, days: int, seed: int = 0) -> pd.DataFrame:
+    '''
+    One row per symbol and business day, prices as a random walk per symbol
+    '''
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2016-01-01', periods=days)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, size=(symbols, days)), axis=1))
+    spread = np.abs(rng.normal(0, 0.01, size=(symbols, days))) * close
+    return pd.DataFrame({
+        'date': np.tile(dates.values, symbols),
+        'symbol': np.repeat(['SYM{:04d}'.format(i) for i in range(symbols)], days),
+        'open': (close + spread / 2).ravel().round(2),
+        'high': (close + spread).ravel().round(2),
+        'low': (close - spread).ravel().round(2),
+        'close': close.ravel().round(2),
+        'volume': rng.integers(1e4, 1e7, size=symbols * days),
+    })
+
+
+def run(data_frame: pd.DataFrame, repeat: int = 3) -> list:
+    '''
+    :return: [(profile, bytes, best write seconds, best read seconds, best symbol column read seconds)]
+    '''
+    results = []
+    for name, profile in PROFILES.items():
+        write_seconds, read_seconds, scan_seconds = [], [], []
+        for _ in range(repeat):
+            buffer = io.BytesIO()
+            start_time = time.perf_counter()
+            profile.write(data_frame, buffer, index=False)
+            write_seconds.append(time.perf_counter() - start_time)
+            start_time = time.perf_counter()
+            pd.read_parquet(io.BytesIO(buffer.getvalue()), engine='pyarrow')
+            read_seconds.append(time.perf_counter() - start_time)
+            start_time = time.perf_counter()
+            pd.read_parquet(io.BytesIO(buffer.getvalue()), engine='pyarrow', columns=['symbol'])
+            scan_seconds.append(time.perf_counter() - start_time)
+        results.append((name, len(buffer.getvalue()), min(write_seconds), min(read_seconds), min(scan_seconds)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--days', type=int, default=1260)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    data_frame = make_prices(args.symbols, args.days)
+    print('{} rows, {:.1f}MB in memory'.format(
+        len(data_frame.index), data_frame.memory_usage(deep=True).sum() / 1e6))
+    print('{:<10} {:>10} {:>10} {:>10} {:>12}'.format('profile', 'size MB', 'write s', 'read s', 'symbol s'))
+    for name, size, write_seconds, read_seconds, scan_seconds in run(data_frame, args.repeat):
+        print('{:<10} {:>10.1f} {:>10.2f} {:>10.2f} {:>12.3f}'.format(
+            name, size / 1e6, write_seconds, read_seconds, scan_seconds))
+
+
+if __name__ == '__main__':
+    main()
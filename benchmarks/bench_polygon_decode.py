@@ -0,0 +1,98 @@
+"""
+Decode time and peak memory of Polygon minute aggregates, JSON round trip against the columnar decoder
+
+    python -m flows.benchmarks.bench_polygon_decode --days 252
+"""
+
+import argparse
+import io
+import json
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from flows.datasources.polygon import decode_candles, MARKET_TZ
+
+SESSION_MINUTES = 390
+
+
+def make_results(days: int, seed: int = 0) -> list:
+    '''
+    Regular session minute bars in Polygon's aggregate format, 98,280 bars for 252 days
+    '''
+    rng = np.random.default_rng(seed)
+    sessions = pd.bdate_range('2020-01-02', periods=days)
+    minutes = (sessions.repeat(SESSION_MINUTES) + pd.Timedelta(hours=9, minutes=30)
+               + pd.to_timedelta(np.tile(np.arange(SESSION_MINUTES), days), unit='min'))
+    timestamps = minutes.tz_localize(MARKET_TZ).as_unit('ms').asi8
+    rows = len(timestamps)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, rows)))
+    volume = rng.integers(100, 100000, rows)
+    return [{'v': int(v), 'vw': round(c, 4), 'o': round(c, 4), 'c': round(c, 4), 'h': round(c * 1.001, 4),
+             'l': round(c * 0.999, 4), 't': int(t), 'n': 1}
+            for v, c, t in zip(volume.tolist(), close.tolist(), timestamps.tolist())]
+
+
+def baseline_parse_candle(results: list, daily=True) -> pd.DataFrame:
+    '''
+    parse_candle before the columnar decoder: the decoded results are dumped back to JSON and read again
+    '''
+    df = pd.read_json(io.StringIO(json.dumps(results)))
+    df['date'] = pd.to_datetime(df['t'], unit='ms')
+    if daily:
+        df['date'] = pd.to_datetime(df['date'].dt.date)
+    df = df.drop(columns=['t', 'n'], errors='ignore')
+    df.set_index('date', inplace=True)
+    return df.rename(columns={
+        'v': 'volume', 'vw': 'vwap', 'o': 'open', 'h': 'high', 'l': 'low', 'c': 'close'
+    })
+
+
+def get_decoders(results: list) -> dict:
+    body = json.dumps({'results': results}).encode('utf-8')
+    return {
+        'baseline': lambda: baseline_parse_candle(results, daily=False),
+        'columnar': lambda: decode_candles(results, daily=False),
+        'columnar-bytes': lambda: decode_candles(body, daily=False),
+    }
+
+
+def run(decoders: dict, repeat: int = 3) -> list:
+    '''
+    :return: [(decoder name, best seconds, peak traced MB)]. Time and memory come from separate passes,
+             tracing slows the decoders down.
+    '''
+    results = []
+    for name, decode in decoders.items():
+        seconds = []
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            decode()
+            seconds.append(time.perf_counter() - start_time)
+        tracemalloc.start()
+        decode()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append((name, min(seconds), peak / 1e6))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=int, default=252)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results = make_results(args.days)
+    print('{} minute bars'.format(len(results)))
+    print('{:<16} {:>10} {:>10} {:>10}'.format('decoder', 'decode s', 'speedup', 'peak MB'))
+    timings = run(get_decoders(results), args.repeat)
+    baseline_seconds = timings[0][1]
+    for name, seconds, peak in timings:
+        print('{:<16} {:>10.3f} {:>9.1f}x {:>10.1f}'.format(name, seconds, baseline_seconds / seconds, peak))
+
+
+if __name__ == '__main__':
+    main()
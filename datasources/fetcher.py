@@ -6,18 +6,22 @@ Created on 12/9/2020 by Reno Septa Pradana
 
 import json
 import logging
-import os
+import time
+from datetime import datetime
 import pandas as pd
 
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from flows.util.parquet_util import ParquetUtil
-from namespace.constants import WriteMode
+from flows.util.parquet_dataset import ParquetDataset
 from flows.datasources.iex import IEXClient
-from google.cloud.storage.blob import Blob
+from flows.datasources.sync_index import SymbolWatermarkIndex
+from flows.util.trading_calendar import TradingCalendar
+from flows.util.gcp.gcp_storage_connection import GCPStorageConnection
+from flows.util.gcp.gcp_storage_index import GCPStorageIndex
 from google.cloud import storage
 from flows.util.dataframe_util import parse_dated_dataframe
-from pathlib import Path
+from flows.util.storage import Storage
 
 logging.basicConfig(
     format='%(asctime)-15s [%(name)s] %(message)s',
@@ -28,22 +32,53 @@ logging.basicConfig(
 class ETLFetcher:
 
     DEFAULT_FILENAME = 'data.parquet'
+    WATERMARK_FILENAME = '_metadata/watermarks.parquet'
+    CALENDAR_FILENAME = '_metadata/trading_calendar.json'
 
     def __init__(self):
         self._root_dir = None
         self._root_dir_is_gs = None
         self._gs_client = None
         self._iex_client = None
-
-    def initialize(self, root_dir, root_dir_is_gs=False, iex_token=None, *args, **kwargs):
-        self._root_dir = root_dir
-        self._root_dir_is_gs = root_dir_is_gs
+        self._watermarks = None
+        self._storage_index = None
+        self._storage = None
+
+    def initialize(self, root_dir, root_dir_is_gs=False, iex_token=None, watermark_path=None, calendar_path=None,
+                   *args, **kwargs):
+        '''
+        :param watermark_path: location of the per-symbol watermark index,
+                               defaults to _metadata/watermarks.parquet under root_dir
+        :param calendar_path: cache of the trading calendar, defaults to _metadata/trading_calendar.json
+                              under root_dir
+        '''
+        self._storage = Storage(root_dir)
+        self._root_dir = self._storage.root
+        self._root_dir_is_gs = root_dir_is_gs or self._storage.protocol in ['gs', 'gcs']
         if self._root_dir_is_gs:
             self._gs_client = storage.Client()
+            self._storage_index = GCPStorageIndex.from_uri(self._root_dir, connection=GCPStorageConnection(self._gs_client))
         self._iex_client = IEXClient(token_value=iex_token)
+        self._iex_client.calendar = self._load_calendar(calendar_path or self._storage.url(self.CALENDAR_FILENAME))
+        self._watermarks = SymbolWatermarkIndex(watermark_path or self._storage.url(self.WATERMARK_FILENAME))
         return True
 
+    def _load_calendar(self, calendar_path: str):
+        '''
+        :return: TradingCalendar, or None when it cannot be loaded, in which case trade dates are
+                 asked from IEX per call as before
+        '''
+        try:
+            return TradingCalendar.from_iex(self._iex_client, cache_path=calendar_path)
+        except Exception as e:
+            logging.warning('failed to load the trading calendar, falling back to IEX requests: {}'.format(e))
+            return None
+
     def finalize(self):
+        self._watermarks.save()
+        self._watermarks = None
+        self._storage_index = None
+        self._storage = None
         self._root_dir = None
         self._root_dir_is_gs = None
         self._gs_client = None
@@ -65,16 +100,87 @@ class ETLFetcher:
         year = self._get_year(response)
         data_frame = parse_dated_dataframe(pd.DataFrame.from_dict([response]))
         save_path = self._create_save_path(symbol, year)
-        save_mode = WriteMode.UPSERT if self._is_file_exist(save_path) else WriteMode.OVERWRITE
-        return ParquetUtil.write_parquet(data_frame, save_path, save_mode)
+        # Lands as a delta file next to an existing partition, see ParquetDataset.compact
+        self._append_to_partition(save_path, data_frame)
+        self._watermarks.update_from_frame(symbol, data_frame)
+        return True
+
+    def save_responses_to_storage(self, responses, max_workers: int = 8):
+        '''
+        Batch version of _save_response_to_storage. Responses are grouped by their symbol/year
+        partition so that each partition gets one existence check and one write, and the
+        partitions are written concurrently.
+        :param responses: iterable of (symbol, response json string) pairs
+        :param max_workers: number of partitions written at the same time
+        :return: {save_path: {'rows': int, 'seconds': float, 'success': bool}}
+        '''
+        partitions = {}
+        for symbol, response in responses:
+            try:
+                record = json.loads(response)
+                year = self._get_year(record)
+            except (ValueError, RuntimeError, AttributeError):
+                logging.error('failed to parse response for {}'.format(symbol))
+                continue
+            partitions.setdefault((symbol, year), []).append(record)
+
+        report = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self._save_partition, symbol, year, records)
+                       for (symbol, year), records in partitions.items()]
+            for future in as_completed(futures):
+                save_path, result = future.result()
+                report[save_path] = result
+        logging.info('saved {} responses into {} partitions'.format(
+            sum(len(records) for records in partitions.values()), len(report)))
+        return report
+
+    def _save_partition(self, symbol: str, year: str, records: list):
+        start_time = time.time()
+        save_path = self._create_save_path(symbol, year)
+        data_frame = parse_dated_dataframe(pd.DataFrame.from_dict(records))
+        # Repeated responses for a date keep the latest one, rows on different dates are all kept
+        data_frame = data_frame[~data_frame.index.duplicated(keep='last')]
+        try:
+            self._append_to_partition(save_path, data_frame)
+            self._watermarks.update_from_frame(symbol, data_frame)
+            success = True
+        except Exception as e:
+            logging.error('failed to save {}: {}'.format(save_path, e))
+            success = False
+        return save_path, {
+            'rows': len(data_frame.index),
+            'seconds': time.time() - start_time,
+            'success': success,
+        }
+
+    def _append_to_partition(self, save_path: str, data_frame: pd.DataFrame):
+        base_exists = self._is_file_exist(save_path)
+        ParquetDataset(save_path).append(data_frame, base_exists=base_exists)
+        if not base_exists and self._storage_index is not None:
+            self._storage_index.add(save_path)
+
+    def plan_incremental_sync(self, symbols, last_trade_date=None):
+        '''
+        Work out what each symbol is missing from storage, symbols already holding the last
+        trade date are left out
+        :param symbols: symbols to sync
+        :param last_trade_date: defaults to the last trade date reported by IEX
+        :return: [SyncPlan] with the first missing date and the smallest IEX range covering it
+        '''
+        if last_trade_date is None:
+            last_trade_date = self._iex_client.get_last_trade_date(datetime.now())
+        return self._watermarks.plan(symbols, last_trade_date, calendar=self._iex_client.calendar)
+
+    def compact_partition(self, symbol: str, year: str):
+        '''
+        Merge the delta files of a symbol/year partition back into its base file
+        :return: number of delta files compacted
+        '''
+        return ParquetDataset(self._create_save_path(symbol, year)).compact()
 
     def _create_save_path(self, symbol: str, year: str):
-        path = '{}/{}/{}'.format(self._root_dir, symbol, year)
-        if not self._root_dir_is_gs:
-            path = Path(path)
-            path.mkdir(parents=True, exist_ok=True)
-            path = str(path.absolute())
-        return '/'.join([path, self.DEFAULT_FILENAME])
+        return self._storage.url(symbol, year, self.DEFAULT_FILENAME)
 
     def _get_year(self, response):
         if not isinstance(response, dict):
@@ -83,5 +189,6 @@ class ETLFetcher:
 
     def _is_file_exist(self, file_path):
         if self._root_dir_is_gs:
-            return Blob.from_string(file_path).exists(self._gs_client)
-        return os.path.exists(file_path)
+            # Only used before writing a base file, so a stale miss in the index is checked with GCS
+            return self._storage_index.exists(file_path, confirm_missing=True)
+        return self._storage.exists(file_path)
@@ -6,12 +6,23 @@ import requests
 from requests.packages.urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
 from flows.datasources.base import DataSource, TokenAuth
+from flows.datasources.iex_daily_price import IEXDailyPrice
+from flows.datasources.iex_splits import IEXSplits
+from flows.datasources.iex_dividends import IEXDividends
+from flows.util.response_cache import ResponseCache, CachedResponse
+from flows.util.trading_calendar import TradingCalendar
 from iexfinance.stocks import get_historical_data
 
 from enum import Enum
 
 logger = logging.getLogger('iex')
 BASE_URL = 'https://cloud.iexapis.com/v1'
+BATCH_SYMBOL_LIMIT = 100
+
+BATCH_TYPE_PREVIOUS = 'previous'
+BATCH_TYPE_SPLITS = 'splits'
+BATCH_TYPE_DIVIDENDS = 'dividends'
+BATCH_TYPES = [BATCH_TYPE_PREVIOUS, BATCH_TYPE_SPLITS, BATCH_TYPE_DIVIDENDS]
 
 class eIEXAPIRange(Enum):
     eNext           = "next"
@@ -24,9 +35,16 @@ class eIEXAPIRange(Enum):
     eFiveYear       = "5y"
 
 class IEXClient(TokenAuth):
-    def __init__(self, token_api_key='token', token_env_key='IEX_TOKEN', token_value=None):
+    def __init__(self, token_api_key='token', token_env_key='IEX_TOKEN', token_value=None,
+                 cache: ResponseCache = None, calendar: TradingCalendar = None):
+        '''
+        :param cache: optional ResponseCache, successful responses are served from it until their TTL expires
+        :param calendar: optional TradingCalendar, answers get_last_trade_date locally for the dates it covers
+        '''
         self.logger = logging.getLogger(str(self.__class__))
         super().__init__(token_api_key, token_env_key, token_value)
+        self.cache = cache
+        self.calendar = calendar
         self.session = requests.Session()
         self.session.mount(BASE_URL, HTTPAdapter(max_retries=Retry(
             total=3,
@@ -34,35 +52,104 @@ class IEXClient(TokenAuth):
             allowed_methods=["HEAD", "GET", "OPTIONS"]
         )))
 
+    def _get(self, endpoint: str, cache_endpoint: str, symbol: str = None, range: str = None, params: dict = None):
+        """
+        GET endpoint, going through the response cache when one is configured
+        :param cache_endpoint: endpoint name used for the cache key and TTL rule, e.g. 'previous'
+        :param params: query parameters besides the token, symbol and range must identify them for the cache
+        :return: requests.Response or CachedResponse
+        """
+        url = '/'.join([BASE_URL, endpoint.lstrip('/')])
+        params = dict(self.params, **params) if params else self.params
+        if self.cache is None:
+            return self.session.get(url, params=params)
+        content = self.cache.get(cache_endpoint, symbol, range)
+        if content is not None:
+            return CachedResponse(content, url=url)
+        res = self.session.get(url, params=params)
+        if res.status_code == 200:
+            self.cache.put(cache_endpoint, symbol, range, res.content)
+        return res
+
     def get_last_trade_date(self, from_date: datetime):
         """
         https://iexcloud.io/docs/api/#u-s-holidays-and-trading-dates
         Takes YYYYMMDD format for from_date parameter
         :return: Response
         """
-        endpoint = 'ref-data/us/dates/trade/last/1/{}'.format(from_date.strftime('%Y%m%d'))
-        res = self.session.get('/'.join([BASE_URL, endpoint]), params=self.params)
-        return datetime.strptime(json.loads(res.text)[0]['date'], '%Y-%m-%d').date()
+        if self.calendar is not None and self.calendar.has_previous_trading_day(from_date):
+            return self.calendar.previous_trading_day(from_date)
+        return self.get_trade_dates('last', 1, from_date)[0]
+
+    def get_trade_dates(self, direction: str, count: int, from_date):
+        """
+        https://iexcloud.io/docs/api/#u-s-holidays-and-trading-dates
+        :param direction: 'last' for the dates before from_date, 'next' for the dates after it
+        :param count: number of trade dates
+        :return: [date] sorted ascending, from_date itself excluded
+        """
+        day = from_date.strftime('%Y%m%d')
+        endpoint = 'ref-data/us/dates/trade/{}/{}/{}'.format(direction, count, day)
+        res = self._get(endpoint, 'trade-dates', range='/'.join([direction, str(count), day]))
+        return sorted(datetime.strptime(obj['date'], '%Y-%m-%d').date() for obj in json.loads(res.text))
 
     def get_daily_price(self, symbol: str):
         endpoint = 'stock/{}/previous'.format(symbol)
-        res = self.session.get('/'.join([BASE_URL, endpoint]), params=self.params)
-        return res
+        return self._get(endpoint, 'previous', symbol)
 
     def get_split(self, symbol: str, eRange: eIEXAPIRange = eIEXAPIRange.eOneMonth):
         endpoint = "stock/{}/splits/{}".format(symbol, eRange.value)
-        res = self.session.get('/'.join([BASE_URL, endpoint]), params=self.params)
-        return res
+        return self._get(endpoint, 'splits', symbol, eRange.value)
 
     def get_historical_price(self, symbol: str, range: str = '5y'):
         endpoint = '/stock/{}/chart/{}'.format(symbol, range)
-        res = self.session.get('/'.join([BASE_URL, endpoint]), params=self.params)
-        return res
+        return self._get(endpoint, 'chart', symbol, range)
 
     def get_dividends(self, symbol: str, eRange: eIEXAPIRange = eIEXAPIRange.eOneMonth):
         endpoint = '/stock/{}/dividends/{}'.format(symbol, eRange.value)
-        res = self.session.get('/'.join([BASE_URL, endpoint]), params=self.params)
-        return res
+        return self._get(endpoint, 'dividends', symbol, eRange.value)
+
+    def get_batch_json(self, symbols: list, types: list = BATCH_TYPES, eRange: eIEXAPIRange = eIEXAPIRange.eOneMonth):
+        """
+        https://iexcloud.io/docs/api/#batch-requests
+        One request per BATCH_SYMBOL_LIMIT symbols, covering every type at once
+        :return: {symbol: {type: decoded json}}
+        """
+        results = {}
+        for start in range(0, len(symbols), BATCH_SYMBOL_LIMIT):
+            chunk = symbols[start:start + BATCH_SYMBOL_LIMIT]
+            params = dict(symbols=','.join(chunk), types=','.join(types), range=eRange.value)
+            res = self._get('stock/market/batch', 'batch', params['symbols'],
+                            '/'.join([params['types'], eRange.value]), params=params)
+            res.raise_for_status()
+            results.update(json.loads(res.text))
+        return results
+
+    def get_batch(self, symbols: list, types: list = BATCH_TYPES, eRange: eIEXAPIRange = eIEXAPIRange.eOneMonth):
+        """
+        Batched equivalent of get_daily_price, get_split and get_dividends for many symbols
+        :return: {symbol: {'previous': IEXDailyPrice or None, 'splits': IEXSplits, 'dividends': IEXDividends}},
+                 limited to the requested types
+        """
+        results = {}
+        for symbol, data in self.get_batch_json(symbols, types, eRange).items():
+            result = {}
+            if BATCH_TYPE_PREVIOUS in types:
+                daily_price = IEXDailyPrice()
+                previous = data.get(BATCH_TYPE_PREVIOUS)
+                result[BATCH_TYPE_PREVIOUS] = daily_price if previous and daily_price.initialize_from_dict(previous) else None
+            if BATCH_TYPE_SPLITS in types:
+                splits = IEXSplits()
+                if not splits.initialize_from_dict(data.get(BATCH_TYPE_SPLITS) or [], True):
+                    self.logger.warning("Incomplete split data for {}".format(symbol))
+                result[BATCH_TYPE_SPLITS] = splits
+            if BATCH_TYPE_DIVIDENDS in types:
+                dividends = IEXDividends()
+                if not dividends.initialize_from_dict(data.get(BATCH_TYPE_DIVIDENDS) or [], True):
+                    self.logger.warning("Incomplete dividend data for {}".format(symbol))
+                result[BATCH_TYPE_DIVIDENDS] = dividends
+            results[symbol] = result
+        return results
 
 class IEXPriceHistory(DataSource):
     def __init__(self, start, end, ticker):
@@ -0,0 +1,122 @@
+"""
+Vectorised split and dividend adjustment of daily price columns
+
+Factors are computed once per symbol from the corporate actions and applied to whole
+columns at once, instead of looping over every (split, row) pair.
+"""
+
+import numpy as np
+import pandas as pd
+
+from flows.datasources.iex_splits import IEXSplits
+from flows.datasources.iex_dividends import IEXDividends
+
+
+def _suffix_products(factors: np.ndarray) -> np.ndarray:
+    # suffix[i] is the product of factors[i:], with a trailing 1 for "no event after this row"
+    return np.append(np.cumprod(factors[::-1])[::-1], 1.0)
+
+
+class IEXAdjustmentEngine:
+    def __init__(self, split_dates=(), split_ratios=(), dividend_dates=(), dividend_amounts=()):
+        '''
+        :param split_dates: split execution dates
+        :param split_ratios: from_factor / to_factor of each split, 0.5 means 1 share is split into 2
+        :param dividend_dates: dividend execution (ex) dates
+        :param dividend_amounts: cash amount per share of each dividend
+        '''
+        split_dates = np.asarray(split_dates, dtype='datetime64[D]')
+        split_ratios = np.asarray(split_ratios, dtype='float64')
+        valid = split_ratios > 0
+        order = np.argsort(split_dates[valid], kind='stable')
+        self.split_dates = split_dates[valid][order]
+        self.split_ratios = split_ratios[valid][order]
+
+        dividend_dates = np.asarray(dividend_dates, dtype='datetime64[D]')
+        order = np.argsort(dividend_dates, kind='stable')
+        self.dividend_dates = dividend_dates[order]
+        self.dividend_amounts = np.asarray(dividend_amounts, dtype='float64')[order]
+
+    @classmethod
+    def from_corporate_actions(cls, splits: IEXSplits = None, dividends: IEXDividends = None):
+        split_list = [splits.get_split(i) for i in range(splits.get_count())] if splits else []
+        dividend_list = [dividends.get_dividend(i) for i in range(dividends.get_count())] if dividends else []
+        return cls(split_dates=[split.execution_date for split in split_list],
+                   split_ratios=[split.ratio for split in split_list],
+                   dividend_dates=[dividend.execution_date for dividend in dividend_list],
+                   dividend_amounts=[dividend.amount for dividend in dividend_list])
+
+    def split_factors(self, dates: np.ndarray, date_last_adjusted: np.ndarray = None) -> np.ndarray:
+        '''
+        Cumulative split factor per row. A split applies to a row when it executes after the row's
+        date and after the row's date_last_adjusted, so rows are never adjusted twice for one split.
+        '''
+        threshold = np.asarray(dates, dtype='datetime64[D]')
+        if date_last_adjusted is not None:
+            threshold = np.maximum(threshold, np.asarray(date_last_adjusted, dtype='datetime64[D]'))
+        index = np.searchsorted(self.split_dates, threshold, side='right')
+        return _suffix_products(self.split_ratios)[index]
+
+    def dividend_factors(self, dates: np.ndarray, unadjusted_close: np.ndarray) -> np.ndarray:
+        '''
+        Cumulative dividend factor per row, each dividend scales the rows before its ex date by
+        1 - amount / close, where close is the last unadjusted close before the ex date.
+        '''
+        dates = np.asarray(dates, dtype='datetime64[D]')
+        if not len(self.dividend_dates) or not len(dates):
+            return np.ones(len(dates))
+        order = np.argsort(dates, kind='stable')
+        sorted_dates = dates[order]
+        sorted_close = np.asarray(unadjusted_close, dtype='float64')[order]
+        previous = np.searchsorted(sorted_dates, self.dividend_dates, side='left') - 1
+        has_previous = previous >= 0
+        factors = np.ones(len(self.dividend_dates))
+        close = sorted_close[previous[has_previous]]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            factors[has_previous] = np.where(close > 0, 1 - self.dividend_amounts[has_previous] / close, 1.0)
+        index = np.searchsorted(self.dividend_dates, dates, side='right')
+        return _suffix_products(factors)[index]
+
+    def apply(self, prices):
+        '''
+        Split-adjust an IEXDailyPrices in place and move date_last_adjusted forward on adjusted rows
+        '''
+        columns = prices.columns
+        if not len(self.split_dates) or not prices.get_count():
+            return
+        factors = self.split_factors(columns['date'], columns['date_last_adjusted'])
+        adjusted = np.maximum(columns['date'], columns['date_last_adjusted']) < self.split_dates[-1]
+        factors = factors[adjusted]
+        for attr in ['open', 'close', 'high', 'low']:
+            columns[attr][adjusted] = np.round(columns[attr][adjusted] * factors, 2)
+        # Divide rather than multiply by int(1 / ratio), which truncated reverse splits to zero volume
+        columns['volume'][adjusted] = np.rint(columns['volume'][adjusted] / factors).astype('int64')
+        columns['date_last_adjusted'][adjusted] = self.split_dates[-1]
+
+    def adjust(self, prices, include_dividends=True) -> pd.DataFrame:
+        '''
+        Adjusted and unadjusted series side by side, without modifying prices
+        :param prices: IEXDailyPrices
+        :param include_dividends: also apply dividend factors to the adjusted series
+        :return: DataFrame indexed by date
+        '''
+        columns = prices.columns
+        factors = self.split_factors(columns['date'], columns['date_last_adjusted'])
+        if include_dividends:
+            price_factors = factors * self.dividend_factors(columns['date'], columns['unadjusted_close'])
+        else:
+            price_factors = factors
+        df = pd.DataFrame({
+            'symbol': columns['symbol'],
+            'open': columns['unadjusted_open'],
+            'high': columns['unadjusted_high'],
+            'low': columns['unadjusted_low'],
+            'close': columns['unadjusted_close'],
+            'volume': columns['unadjusted_volume'],
+            'adj_open': np.round(columns['open'] * price_factors, 2),
+            'adj_high': np.round(columns['high'] * price_factors, 2),
+            'adj_low': np.round(columns['low'] * price_factors, 2),
+            'adj_close': np.round(columns['close'] * price_factors, 2),
+            'adj_volume': np.rint(columns['volume'] / factors).astype('int64'),
+        }, index=pd.DatetimeIndex(columns['date'], name='date'))
+        return df
@@ -0,0 +1,191 @@
+"""
+asyncio counterpart of IEXClient for pulling the whole symbol universe concurrently,
+throttled by a token bucket sized to the IEX request quota
+"""
+
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+
+from flows.datasources.base import TokenAuth
+from flows.datasources.iex import BASE_URL, eIEXAPIRange
+
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+
+class TokenBucket:
+    '''
+    Allows `rate` acquisitions per second on average with bursts of up to `capacity`.
+    pause() stops all acquisitions for a while, e.g. when the server answers 429.
+    '''
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = None
+
+    async def acquire(self, tokens: float = 1):
+        if self._lock is None:
+            # Created lazily so the lock belongs to the running event loop
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+def parse_retry_after(value):
+    '''
+    Retry-After is either a number of seconds or an HTTP date
+    :return: seconds to wait or None
+    '''
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class AsyncIEXClient(TokenAuth):
+    '''
+    Usage:
+        async with AsyncIEXClient() as client:
+            async for symbol, text, error in client.get_many(symbols, 'get_daily_price'):
+                ...
+    '''
+    def __init__(self, token_api_key='token', token_env_key='IEX_TOKEN', token_value=None,
+                 max_in_flight: int = 16, requests_per_second: float = 100, burst: float = None,
+                 max_retries: int = 3, backoff_seconds: float = 0.5, timeout_seconds: float = 30):
+        '''
+        :param max_in_flight: maximum number of concurrent HTTP requests
+        :param requests_per_second: sustained request rate, IEX Cloud allows 100 per second
+        :param burst: token bucket capacity, defaults to requests_per_second
+        :param max_retries: retries on 429 and 5xx responses
+        :param backoff_seconds: base of the exponential backoff when no Retry-After header is sent
+        :param timeout_seconds: total timeout of a single request
+        '''
+        self.logger = logging.getLogger(str(self.__class__))
+        super().__init__(token_api_key, token_env_key, token_value)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout_seconds = timeout_seconds
+        self.rate_limiter = TokenBucket(requests_per_second, burst)
+        self.session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def open(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout_seconds))
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _get(self, endpoint: str) -> str:
+        await self.open()
+        url = '/'.join([BASE_URL, endpoint.lstrip('/')])
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire()
+            async with self._semaphore:
+                async with self.session.get(url, params=self.params) as res:
+                    if res.status not in RETRY_STATUSES or attempt == self.max_retries:
+                        res.raise_for_status()
+                        return await res.text()
+                    delay = parse_retry_after(res.headers.get('Retry-After'))
+                    if delay is None:
+                        delay = self.backoff_seconds * (2 ** attempt)
+                    if res.status == 429:
+                        # Quota exceeded: hold every request back, not only this one
+                        self.rate_limiter.pause(delay)
+            self.logger.warning("{} returned {}, retrying in {:.2f}s".format(endpoint, res.status, delay))
+            await asyncio.sleep(delay)
+
+    async def get_last_trade_date(self, from_date: datetime):
+        endpoint = 'ref-data/us/dates/trade/last/1/{}'.format(from_date.strftime('%Y%m%d'))
+        text = await self._get(endpoint)
+        return datetime.strptime(json.loads(text)[0]['date'], '%Y-%m-%d').date()
+
+    async def get_daily_price(self, symbol: str):
+        return await self._get('stock/{}/previous'.format(symbol))
+
+    async def get_split(self, symbol: str, eRange: eIEXAPIRange = eIEXAPIRange.eOneMonth):
+        return await self._get('stock/{}/splits/{}'.format(symbol, eRange.value))
+
+    async def get_historical_price(self, symbol: str, range: str = '5y'):
+        return await self._get('stock/{}/chart/{}'.format(symbol, range))
+
+    async def get_dividends(self, symbol: str, eRange: eIEXAPIRange = eIEXAPIRange.eOneMonth):
+        return await self._get('stock/{}/dividends/{}'.format(symbol, eRange.value))
+
+    async def get_many(self, symbols, endpoint: str, **kwargs):
+        '''
+        Call one endpoint method for every symbol, yielding results in completion order
+        :param symbols: iterable of symbols
+        :param endpoint: name of the endpoint method, e.g. 'get_daily_price'
+        :param kwargs: extra arguments for the endpoint method
+        :return: async generator of (symbol, response text, exception or None)
+        '''
+        method = getattr(self, endpoint)
+
+        async def fetch(symbol):
+            try:
+                return symbol, await method(symbol, **kwargs), None
+            except Exception as e:
+                self.logger.error("Failed to fetch {} for {}: {}".format(endpoint, symbol, e))
+                return symbol, None, e
+
+        tasks = [asyncio.ensure_future(fetch(symbol)) for symbol in symbols]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def fetch_many(symbols, endpoint: str, token_value=None, client_kwargs: dict = None, **kwargs):
+    '''
+    Blocking helper around AsyncIEXClient.get_many for synchronous callers
+    :return: list of (symbol, response text, exception or None)
+    '''
+    async def run():
+        async with AsyncIEXClient(token_value=token_value, **(client_kwargs or {})) as client:
+            return [result async for result in client.get_many(symbols, endpoint, **kwargs)]
+    return asyncio.run(run())
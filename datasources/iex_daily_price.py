@@ -3,7 +3,6 @@ Simple data struct to save daily price structure on iex data
 Created by Kenneth Nursalim on 12/6/2020
 """
 
-from pathlib import Path
 import pandas as pd
 import datetime as dt
 import dateutil as dateutil
@@ -11,6 +10,7 @@ import numpy as np
 import pytz
 
 from flows.util.util import IEXUtil
+from flows.util.parquet_util import ParquetUtil
 
 utc = pytz.UTC
 
@@ -102,17 +102,13 @@ class IEXDailyPrice:
         }
         return data
 
-    def to_parquet(self, save_path: str = "", is_local_disk_directory: bool = True):
+    def to_parquet(self, save_path: str = "", is_local_disk_directory: bool = True, profile=None):
         df = pd.DataFrame(self.to_dict(), index=[0])
-        if is_local_disk_directory:
-            save_path = Path(save_path)
-            save_path.parent.mkdir(parents=True, exist_ok=True)
-            save_path = save_path.absolute()
-        df.to_parquet(save_path, engine='fastparquet', compression='gzip')
+        ParquetUtil.to_parquet(df, save_path, profile=profile)
         return True
 
     def from_parquet(self, parquet_path: str = ""):
-        df = pd.read_parquet(parquet_path, engine='fastparquet')
+        df = ParquetUtil.read_parquet(parquet_path)
         data = df.to_dict('records')[0]
         return self.initialize_from_dict(data)
 
@@ -3,75 +3,191 @@ This is the class to store 1 year worth of parquet
 Created by Kenneth Nursalim on 12/7/2020
 """
 
-from pathlib import Path
 import pandas as pd
+import numpy as np
 import datetime as dt
-import dateutil as dateutil
 
+from flows.util.util import IEXUtil
+from flows.util.parquet_util import ParquetUtil
 from .iex_daily_price import IEXDailyPrice
 from .iex_splits import IEXSplits
+from .iex_adjustments import IEXAdjustmentEngine
+
+# (attribute on IEXDailyPrice, key in the IEX dict / parquet column, numpy dtype)
+COLUMNS = [
+    ("date",                "date",                 "datetime64[D]"),
+    ("date_last_adjusted",  "date_last_adjusted",   "datetime64[D]"),
+    ("symbol",              "symbol",               "object"),
+    ("open",                "open",                 "float64"),
+    ("close",               "close",                "float64"),
+    ("high",                "high",                 "float64"),
+    ("low",                 "low",                  "float64"),
+    ("volume",              "volume",               "int64"),
+    ("unadjusted_open",     "uOpen",                "float64"),
+    ("unadjusted_close",    "uClose",               "float64"),
+    ("unadjusted_high",     "uHigh",                "float64"),
+    ("unadjusted_low",      "uLow",                 "float64"),
+    ("unadjusted_volume",   "uVolume",              "int64"),
+]
+REQUIRED_KEYS = [key for _, key, _ in COLUMNS if key != "date_last_adjusted"]
+DATE_COLUMNS = ["date", "date_last_adjusted"]
+
+
+def _to_column(values, dtype) -> np.ndarray:
+    if dtype == "int64":
+        # IEX occasionally sends null volumes
+        return np.nan_to_num(np.asarray(values, dtype="float64")).astype("int64")
+    if dtype == "object":
+        return np.asarray(values, dtype="object")
+    return np.asarray(values, dtype=dtype)
+
 
 class IEXDailyPrices:
+    '''
+    Columnar store of daily prices: one NumPy array per IEXDailyPrice attribute.
+    IEXDailyPrice objects are only materialised on access through get_daily_price/data.
+    '''
     def __init__(self):
-        self.data = []
+        self._count = 0
+        self._arrays = {attr: np.empty(0, dtype=dtype) for attr, _, dtype in COLUMNS}
+
+    @property
+    def columns(self) -> dict:
+        '''
+        Views over the stored arrays, keyed by IEXDailyPrice attribute name
+        '''
+        return {attr: array[:self._count] for attr, array in self._arrays.items()}
+
+    @property
+    def data(self) -> list:
+        '''
+        Materialised copy of every row as IEXDailyPrice objects, changes to them are not stored back
+        '''
+        return [self.get_daily_price(i) for i in range(self._count)]
+
+    def _reserve(self, count):
+        capacity = len(self._arrays["date"])
+        if count <= capacity:
+            return
+        capacity = max(count, capacity * 2, 16)
+        for attr, _, dtype in COLUMNS:
+            array = np.empty(capacity, dtype=dtype)
+            array[:self._count] = self._arrays[attr][:self._count]
+            self._arrays[attr] = array
+
+    def _append_columns(self, columns: dict):
+        count = len(columns["date"])
+        self._reserve(self._count + count)
+        for attr, _, dtype in COLUMNS:
+            self._arrays[attr][self._count:self._count + count] = columns[attr]
+        self._count += count
 
     def initialize_from_dict(self, data_dict: list = []):
-        for obj in data_dict:
-            daily_price = IEXDailyPrice()
-            if not daily_price.initialize_from_dict(obj):
-                return False
-            self.add_daily_price(daily_price)
-        return True
+        valid_count = len(data_dict)
+        for i, obj in enumerate(data_dict):
+            if any(key not in obj for key in REQUIRED_KEYS):
+                valid_count = i
+                break
+        records = data_dict[:valid_count]
+        if records:
+            dates = [obj["date"] for obj in records]
+            last_adjusted = [obj.get("date_last_adjusted", obj["date"]) for obj in records]
+            columns = {"date": IEXUtil.convert_to_datetime64(dates, "D"),
+                       "date_last_adjusted": IEXUtil.convert_to_datetime64(last_adjusted, "D")}
+            for attr, key, dtype in COLUMNS:
+                if attr not in columns:
+                    columns[attr] = _to_column([obj[key] for obj in records], dtype)
+            self._append_columns(columns)
+        return valid_count == len(data_dict)
 
     def get_count(self):
-        return len(self.data)
+        return self._count
 
     def get_daily_price(self, index):
         if index >= self.get_count():
             return None
-        return self.data[index]
+        if index < 0:
+            index += self.get_count()
+            if index < 0:
+                raise IndexError("daily price index out of range")
+        row = {attr: self._arrays[attr][index] for attr, _, _ in COLUMNS}
+        return IEXDailyPrice(
+            date=row["date"].item(), date_last_adjusted=row["date_last_adjusted"].item(),
+            symbol=row["symbol"], open=float(row["open"]), close=float(row["close"]), high=float(row["high"]),
+            low=float(row["low"]), volume=int(row["volume"]), unadjusted_open=float(row["unadjusted_open"]),
+            unadjusted_close=float(row["unadjusted_close"]), unadjusted_high=float(row["unadjusted_high"]),
+            unadjusted_low=float(row["unadjusted_low"]), unadjusted_volume=int(row["unadjusted_volume"]))
 
     def add_daily_price(self, daily_price: IEXDailyPrice):
-        self.data.append(daily_price)
+        self._append_columns({attr: [getattr(daily_price, attr)] for attr, _, _ in COLUMNS})
 
-    def apply_split(self, ratio: float, split_date:dt.date):
-        for daily_price in self.data:
-            daily_price.apply_split(ratio, split_date)
+    def apply_split(self, ratio: float, split_date: dt.date):
+        IEXAdjustmentEngine(split_dates=[split_date], split_ratios=[ratio]).apply(self)
 
     def apply_splits(self, splits: IEXSplits):
-        count_splits = splits.get_count()
-        for i in range(count_splits):
-            split = splits.get_split(i)
-            self.apply_split(split.ratio, split.execution_date)
+        IEXAdjustmentEngine.from_corporate_actions(splits=splits).apply(self)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        '''
+        DataFrame keyed by the IEX field names, dates as datetime64
+        '''
+        columns = self.columns
+        return pd.DataFrame({key: columns[attr] for attr, key, _ in COLUMNS}, copy=False)
+
+    def from_dataframe(self, df: pd.DataFrame):
+        '''
+        Append rows from a DataFrame keyed by the IEX field names, the inverse of to_dataframe
+        '''
+        if any(key not in df.columns for key in REQUIRED_KEYS):
+            return False
+        columns = {}
+        for attr, key, dtype in COLUMNS:
+            source = key if key in df.columns else "date"
+            if key in DATE_COLUMNS:
+                columns[attr] = pd.to_datetime(df[source]).values.astype(dtype)
+            else:
+                columns[attr] = _to_column(df[source].values, dtype)
+        self._append_columns(columns)
+        return True
+
+    def to_arrow(self):
+        import pyarrow as pa
+        columns = self.columns
+        return pa.table({key: pa.array(columns[attr]) for attr, key, _ in COLUMNS})
+
+    def from_arrow(self, table):
+        return self.from_dataframe(table.to_pandas())
 
     def to_dict(self):
-        data_dict = []
-        for daily_price in self.data:
-            data_dict.append(daily_price.to_dict())
-        return data_dict
-
-    def to_parquet(self, save_path: str = "", is_local_disk_directory: bool = True):
-        df = pd.DataFrame(self.to_dict())
-        if is_local_disk_directory:
-            save_path = Path(save_path)
-            save_path.parent.mkdir(parents=True, exist_ok=True)
-            save_path = save_path.absolute()
-        df.to_parquet(save_path, engine='fastparquet', compression='gzip')
+        columns = {}
+        for attr, key, _ in COLUMNS:
+            array = self.columns[attr]
+            columns[key] = np.datetime_as_string(array, unit="D").tolist() if key in DATE_COLUMNS else array.tolist()
+        keys = list(columns.keys())
+        return [dict(zip(keys, values)) for values in zip(*columns.values())]
+
+    def to_parquet(self, save_path: str = "", is_local_disk_directory: bool = True, profile=None):
+        df = self.to_dataframe()
+        for key in DATE_COLUMNS:
+            df[key] = np.datetime_as_string(df[key].values, unit="D")
+        ParquetUtil.to_parquet(df, save_path, profile=profile)
         return True
 
     def from_parquet(self, parquet_path: str = ""):
-        df = pd.read_parquet(parquet_path, engine='fastparquet')
-        data = df.to_dict('records')
-        return self.initialize_from_dict(data)
+        '''
+        Append the rows of a parquet file and its delta files, either written by to_parquet
+        or a date indexed partition written by the fetcher
+        '''
+        df = ParquetUtil.read_dataset(parquet_path)
+        if "date" not in df.columns and df.index.name == "date":
+            df = df.reset_index()
+        return self.from_dataframe(df)
 
     def __eq__(self, other):
         if not isinstance(other, IEXDailyPrices):
             return False
         if self.get_count() != other.get_count():
             return False
-
-        data_count = self.get_count()
-        for i in range(data_count):
-            if self.data[i] != other.data[i]:
-                return False
-        return True
+        columns = self.columns
+        other_columns = other.columns
+        return all(np.array_equal(columns[attr], other_columns[attr]) for attr, _, _ in COLUMNS)
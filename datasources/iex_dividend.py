@@ -85,8 +85,9 @@ class IEXDividend:
         data_dict = ParquetUtil.load_dict_from_parquet(parquet_path)[0]
         return self.initialize_from_dict(data_dict)
 
-    def to_parquet(self, save_path, save_to_local_folder: bool = True):
-        return ParquetUtil.save_dict_to_parquet(self.to_dict(), save_path, save_to_local_folder, index=[0])
+    def to_parquet(self, save_path, save_to_local_folder: bool = True, profile=None):
+        return ParquetUtil.save_dict_to_parquet(self.to_dict(), save_path, save_to_local_folder, index=[0],
+                                                profile=profile)
 
     def get_unique_key(self):
         return "{}.{}".format(self.key, self.subkey)
@@ -7,28 +7,42 @@ Created by Kenneth Nursalim on 12/15/2020
 import json
 
 import bisect
+import heapq
+import datetime as dt
 from typing import List
 
 from flows.datasources.iex_dividend import IEXDividend
 from flows.util.parquet_util import ParquetUtil
+from flows.util.util import IEXUtil
+
+DATE_KEYS = ["declaredDate", "exDate", "paymentDate", "recordDate"]
 
 class IEXDividends:
+    '''
+    Dividends sorted by execution (ex) date, with a hash index on IEXDividend.get_unique_key()
+    to detect duplicates and a parallel list of dates for range queries.
+    '''
     def __init__(self):
         self.dividends: list = []
+        self._dates: List[dt.date] = []
+        self._index: dict = {}
 
     def initialize_from_iex_response(self, response_text: str):
         response_json = json.loads(response_text)
         return self.initialize_from_dict(response_json, True)
 
     def initialize_from_dict(self, data_dict: list, epoch_in_ms=False):
-        count = len(data_dict)
-        for i in range(count):
-            data = data_dict[i]
+        data_dict = IEXUtil.convert_dict_dates(data_dict, DATE_KEYS)
+        new_dividends = []
+        success = True
+        for data in data_dict:
             dividend: IEXDividend = IEXDividend()
             if not dividend.initialize_from_dict(data, epoch_in_ms):
-                return False
-            self.add_dividend_if_not_exist(dividend)
-        return True
+                success = False
+                break
+            new_dividends.append(dividend)
+        self._merge_dividends(new_dividends)
+        return success
 
     def to_dict(self):
         data_dict: list = []
@@ -40,20 +54,42 @@ class IEXDividends:
         return data_dict
 
     def add_dividends(self, dividends):
-        count = dividends.get_count()
-        for i in range(count):
-            dividend: IEXDividend = dividends.get_dividend(i)
-            self.add_dividend_if_not_exist(dividend)
+        self.merge(dividends)
+
+    def merge(self, other):
+        '''
+        Add every dividend of other that is not in this collection yet, in O(n + m)
+        :return: number of dividends added
+        '''
+        return self._merge_dividends(other.dividends, presorted=True)
+
+    def _merge_dividends(self, dividends: List[IEXDividend], presorted=False):
+        new_dividends = []
+        for dividend in dividends:
+            key = dividend.get_unique_key()
+            if key in self._index:
+                continue
+            self._index[key] = dividend
+            new_dividends.append(dividend)
+        if not new_dividends:
+            return 0
+        if not presorted:
+            new_dividends.sort(key=lambda dividend: dividend.execution_date)
+        self.dividends = list(heapq.merge(self.dividends, new_dividends, key=lambda dividend: dividend.execution_date))
+        self._dates = [dividend.execution_date for dividend in self.dividends]
+        return len(new_dividends)
 
     def add_dividend_if_not_exist(self, dividend: IEXDividend):
         if self.contains_dividend(dividend):
             return False
-        bisect.insort(self.dividends, dividend)
+        self._index[dividend.get_unique_key()] = dividend
+        position = bisect.bisect_right(self._dates, dividend.execution_date)
+        self.dividends.insert(position, dividend)
+        self._dates.insert(position, dividend.execution_date)
         return True
 
     def contains_dividend(self, dividend: IEXDividend):
-        index = bisect.bisect_left(self.dividends, dividend)
-        return index != self.get_count() and self.get_dividend(index) == dividend
+        return dividend.get_unique_key() in self._index
 
     def get_count(self):
         return len(self.dividends)
@@ -62,9 +98,17 @@ class IEXDividends:
         if index >= self.get_count():
             return None
         return self.dividends[index]
+
+    def get_dividends_between(self, start: dt.date, end: dt.date) -> List[IEXDividend]:
+        '''
+        Dividends with an ex date from start to end, both inclusive
+        '''
+        lo = bisect.bisect_left(self._dates, start)
+        hi = bisect.bisect_right(self._dates, end)
+        return self.dividends[lo:hi]
     
-    def to_parquet(self, save_path: str = "", is_local_disk_directory: bool = True):
-        return ParquetUtil.save_dict_to_parquet(self.to_dict(), save_path, is_local_disk_directory)
+    def to_parquet(self, save_path: str = "", is_local_disk_directory: bool = True, profile=None):
+        return ParquetUtil.save_dict_to_parquet(self.to_dict(), save_path, is_local_disk_directory, profile=profile)
 
     def from_parquet(self, parquet_path: str = ""):
         dividends_dict = ParquetUtil.load_dict_from_parquet(parquet_path)
@@ -67,6 +67,9 @@ class IEXSplit:
         }
         return data_dict
 
+    def get_unique_key(self):
+        return "{}.{}".format(self.key, self.subkey)
+
     def __eq__(self, other):
         if not isinstance(other, IEXSplit):
             return False
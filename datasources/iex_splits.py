@@ -5,28 +5,42 @@ Created by Kenneth Nursalim on 12/9/2020
 
 import json
 import bisect
+import heapq
+import datetime as dt
 
 from typing import List
 from flows.datasources.iex_split import IEXSplit
 from flows.util.parquet_util import ParquetUtil
+from flows.util.util import IEXUtil
+
+DATE_KEYS = ["declaredDate", "exDate"]
 
 class IEXSplits:
+    '''
+    Splits sorted by execution date, with a hash index on IEXSplit.get_unique_key()
+    to detect duplicates and a parallel list of dates for range queries.
+    '''
     def __init__(self):
         self.splits: List[IEXSplit] = []
+        self._dates: List[dt.date] = []
+        self._index: dict = {}
 
     def initialize_from_iex_response(self, response_text):
         response_json = json.loads(response_text)
         return self.initialize_from_dict(response_json, True)
 
     def initialize_from_dict(self, data_dict: list, epoch_in_ms=False):
-        count = len(data_dict)
-        for i in range(count):
-            data = data_dict[i]
+        data_dict = IEXUtil.convert_dict_dates(data_dict, DATE_KEYS)
+        new_splits = []
+        success = True
+        for data in data_dict:
             split: IEXSplit = IEXSplit()
             if not split.initialize_from_dict(data, epoch_in_ms):
-                return False
-            self.add_split_if_not_exist(split)
-        return True
+                success = False
+                break
+            new_splits.append(split)
+        self._merge_splits(new_splits)
+        return success
 
     def to_dict(self):
         data: list = []
@@ -38,10 +52,30 @@ class IEXSplits:
         return data
 
     def add_splits(self, splits):
-        count = splits.get_count()
-        for i in range(count):
-            split: IEXSplit = splits.get_split(i)
-            self.add_split_if_not_exist(split)
+        self.merge(splits)
+
+    def merge(self, other):
+        '''
+        Add every split of other that is not in this collection yet, in O(n + m)
+        :return: number of splits added
+        '''
+        return self._merge_splits(other.splits, presorted=True)
+
+    def _merge_splits(self, splits: List[IEXSplit], presorted=False):
+        new_splits = []
+        for split in splits:
+            key = split.get_unique_key()
+            if key in self._index:
+                continue
+            self._index[key] = split
+            new_splits.append(split)
+        if not new_splits:
+            return 0
+        if not presorted:
+            new_splits.sort(key=lambda split: split.execution_date)
+        self.splits = list(heapq.merge(self.splits, new_splits, key=lambda split: split.execution_date))
+        self._dates = [split.execution_date for split in self.splits]
+        return len(new_splits)
 
     def get_count(self):
         return len(self.splits)
@@ -51,18 +85,28 @@ class IEXSplits:
             return None
         return self.splits[index]
 
+    def get_splits_between(self, start: dt.date, end: dt.date) -> List[IEXSplit]:
+        '''
+        Splits executed from start to end, both inclusive
+        '''
+        lo = bisect.bisect_left(self._dates, start)
+        hi = bisect.bisect_right(self._dates, end)
+        return self.splits[lo:hi]
+
     def add_split_if_not_exist(self, split: IEXSplit):
         if self.contains_split(split):
             return False
-        bisect.insort(self.splits, split)
+        self._index[split.get_unique_key()] = split
+        position = bisect.bisect_right(self._dates, split.execution_date)
+        self.splits.insert(position, split)
+        self._dates.insert(position, split.execution_date)
         return True
 
     def contains_split(self, split: IEXSplit):
-        index = bisect.bisect_left(self.splits, split)
-        return index != self.get_count() and self.get_split(index) == split
+        return split.get_unique_key() in self._index
 
-    def to_parquet(self, save_path: str = "", is_local_disk_directory: bool = True):
-        return ParquetUtil.save_dict_to_parquet(self.to_dict(), save_path, is_local_disk_directory)
+    def to_parquet(self, save_path: str = "", is_local_disk_directory: bool = True, profile=None):
+        return ParquetUtil.save_dict_to_parquet(self.to_dict(), save_path, is_local_disk_directory, profile=profile)
 
     def from_parquet(self, parquet_path: str = ""):
         splits_dict = ParquetUtil.load_dict_from_parquet(parquet_path)
@@ -1,15 +1,36 @@
 import json
 import logging
+import numpy as np
 import pandas as pd
+from types import SimpleNamespace
 from polygon import RESTClient
 
+from flows.util.response_cache import ResponseCache, IMMUTABLE
+from flows.util.util import IEXUtil
+from flows.util.calendar_util import get_date_today
+
 
 BASE_URL = 'https://api.polygon.io/v2'
+MARKET_TZ = 'America/New_York'
+
+# (key in the Polygon aggregate, column name, dtype)
+CANDLE_FIELDS = [
+    ('o', 'open', 'float64'),
+    ('h', 'high', 'float64'),
+    ('l', 'low', 'float64'),
+    ('c', 'close', 'float64'),
+    ('v', 'volume', 'int64'),
+    ('vw', 'vwap', 'float64'),
+]
 
 
 class PolygonRESTClientWrapper:
-    def __init__(self, api_key=None, client=None):
+    def __init__(self, api_key=None, client=None, cache: ResponseCache = None):
+        '''
+        :param cache: optional ResponseCache for aggregate responses, ranges that ended before today never expire
+        '''
         self.logger = logging.getLogger(str(self.__class__))
+        self.cache = cache
         if api_key:
             self.client = RESTClient(api_key)
         elif client:
@@ -18,23 +39,69 @@ class PolygonRESTClientWrapper:
             raise ValueError("PolyRESTClient requires either an 'api_key' or 'client' object to be passed in")
 
     def get_daily_data(self, symbol, start_date, end_date):
-        resp = self.client.stocks_equities_aggregates(symbol, 1, 'day', start_date, end_date)
+        resp = self._get_aggregates(symbol, 1, 'day', start_date, end_date)
         if not resp.results or len(resp.results) == 0:
             raise RuntimeError("No price history data return for {}".format(symbol))
         return parse_candle(resp)
 
+    def get_history(self, symbol, start_date, end_date, multiplier=1, timespan='day', max_workers=4):
+        '''
+        Any bar size over a long range, fetched month by month and following pagination
+        :return: DataFrame indexed by date, empty when Polygon has no bars
+        '''
+        from flows.datasources.polygon_history import PolygonHistoryDownloader
+        downloader = PolygonHistoryDownloader(self, max_workers=max_workers)
+        return downloader.download(symbol, start_date, end_date, multiplier, timespan)
 
-def parse_candle(resp, daily=True):
-    df = pd.read_json(json.dumps(resp.results))
+    def _get_aggregates(self, symbol, multiplier, timespan, start_date, end_date, end=None, **kwargs):
+        '''
+        :param start_date: first date, or a millisecond timestamp when continuing a paged request
+        :param end: last date of the range when start_date is a timestamp, decides whether it is closed
+        :param kwargs: extra request parameters, e.g. limit and sort, part of the cache key
+        '''
+        if self.cache is None:
+            return self.client.stocks_equities_aggregates(symbol, multiplier, timespan, start_date, end_date, **kwargs)
+        end = end or IEXUtil.convert_to_date(end_date)
+        start = start_date if isinstance(start_date, int) else IEXUtil.convert_to_date(start_date).isoformat()
+        cache_range = '{}/{}/{}/{}'.format(multiplier, timespan, start, end.isoformat())
+        if kwargs:
+            cache_range += '?' + '&'.join('{}={}'.format(key, kwargs[key]) for key in sorted(kwargs))
+        ttl = IMMUTABLE if end < get_date_today(MARKET_TZ) else self.cache.get_ttl('aggs')
+        content = self.cache.get('aggs', symbol, cache_range, ttl=ttl)
+        if content is not None:
+            return SimpleNamespace(results=json.loads(content))
+        resp = self.client.stocks_equities_aggregates(symbol, multiplier, timespan, start_date, end_date, **kwargs)
+        if resp.results:
+            self.cache.put('aggs', symbol, cache_range, json.dumps(resp.results).encode('utf-8'))
+        return resp
 
-    df['date'] = pd.to_datetime(df['t'], unit='ms')
-    # df['date'] = df['date'].dt.localize('America/New_York')
+
+def decode_candles(results, daily=True, tz=MARKET_TZ) -> pd.DataFrame:
+    '''
+    Build the candle frame column by column straight from the aggregate results
+    :param results: list of Polygon aggregate dicts, or the raw response body as bytes/str
+    :param daily: index by session date instead of bar timestamp
+    :param tz: timezone of the intraday index and of the session dates
+    :return: DataFrame of float64 prices and vwap and int64 volume, indexed by date
+    '''
+    if isinstance(results, (bytes, bytearray, str)):
+        results = json.loads(results).get('results') or []
+    count = len(results)
+    columns = {}
+    for key, name, dtype in CANDLE_FIELDS:
+        values = np.fromiter((row.get(key, np.nan) for row in results), dtype='float64', count=count)
+        if dtype == 'int64':
+            values = np.rint(np.nan_to_num(values)).astype('int64')
+        columns[name] = values
+    timestamps = np.fromiter((row['t'] for row in results), dtype='int64', count=count)
+    index = pd.DatetimeIndex(timestamps.astype('datetime64[ms]'), name='date').tz_localize('UTC').tz_convert(tz)
     if daily:
-        df['date'] = pd.to_datetime(df['date'].dt.date)
-    df = df.drop(columns=['t', 'n'], errors='ignore')
-    df.set_index('date', inplace=True)
-    df = df.rename(columns={
-        'v': 'volume', 'vw': 'vwap', 'o': 'open', 'h': 'high', 'l': 'low', 'c': 'close'
-    })
-    return df
+        index = index.tz_localize(None).normalize()
+    return pd.DataFrame(columns, index=index, copy=False)
+
 
+def parse_candle(resp, daily=True, tz=MARKET_TZ):
+    '''
+    :param resp: Polygon aggregates response, result list or raw response body
+    '''
+    return decode_candles(getattr(resp, 'results', resp), daily, tz)
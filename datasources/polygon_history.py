@@ -0,0 +1,160 @@
+"""
+Chunked Polygon aggregate downloads: a range is split into calendar months, the months are fetched
+concurrently and every completed month is written as its own parquet part, so a failed run resumes
+from the parts already on disk
+"""
+
+import logging
+import posixpath
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime
+
+import pandas as pd
+
+from flows.datasources.polygon import PolygonRESTClientWrapper, decode_candles, MARKET_TZ
+from flows.util.storage import resolve, is_local
+from flows.util.parquet_profiles import get_profile
+from flows.util.calendar_util import DateTimeRange, get_date_today, get_month_range
+from flows.util.util import IEXUtil
+
+RESULT_LIMIT = 50000  # Polygon's maximum number of bars per aggregates response
+DAILY_TIMESPANS = ['day', 'week', 'month', 'quarter', 'year']
+
+
+class PolygonHistoryChunk:
+    def __init__(self, start: date, end: date):
+        self.start = start
+        self.end = end
+
+    @property
+    def name(self):
+        # Chunks are clipped to the requested range, so a part only stands for the exact days it covers
+        return '{:%Y-%m-%d}_{:%Y-%m-%d}'.format(self.start, self.end)
+
+    def is_closed(self, today: date):
+        '''
+        A chunk that ended before today will not receive new bars
+        '''
+        return self.end < today
+
+
+class PolygonHistoryDownloader:
+    def __init__(self, polygon: PolygonRESTClientWrapper, root_path: str = None, max_workers: int = 4,
+                 limit: int = RESULT_LIMIT, storage_options: dict = None, profile=None):
+        '''
+        :param polygon: client wrapper used for the aggregate requests
+        :param root_path: parquet sink, parts are written to {root_path}/{symbol}/{multiplier}{timespan}/,
+                          local path or gs:// url. Nothing is written when None.
+        :param max_workers: number of chunks fetched concurrently
+        :param limit: bars requested per page
+        :param storage_options: extra arguments for the fsspec filesystem
+        :param profile: encoding profile of the parts, see parquet_profiles
+        '''
+        self.logger = logging.getLogger(str(self.__class__))
+        self.polygon = polygon
+        self.root_path = root_path
+        self.max_workers = max_workers
+        self.limit = limit
+        self.profile = get_profile(profile)
+        self._fs = None
+        if root_path:
+            self._fs, self._root = resolve(root_path, storage_options)
+
+    @staticmethod
+    def split_range(start_date, end_date) -> list:
+        '''
+        :return: [PolygonHistoryChunk] covering start_date to end_date, one per calendar month
+        '''
+        start, end = IEXUtil.convert_to_date(start_date), IEXUtil.convert_to_date(end_date)
+        months = DateTimeRange(datetime(start.year, start.month, 1), datetime(end.year, end.month, 1))
+        chunks = []
+        for month in months.get_all_months_between():
+            month_end = date(month.year, month.month, get_month_range(month.year, month.month)[1])
+            chunks.append(PolygonHistoryChunk(max(start, month.date()), min(end, month_end)))
+        return chunks
+
+    def get_part_path(self, symbol: str, multiplier: int, timespan: str, chunk: PolygonHistoryChunk):
+        return posixpath.join(self._root, symbol, '{}{}'.format(multiplier, timespan),
+                              'part-{}.parquet'.format(chunk.name))
+
+    def fetch_chunk(self, symbol: str, multiplier: int, timespan: str, chunk: PolygonHistoryChunk) -> pd.DataFrame:
+        '''
+        Fetch every page of one chunk. Polygon caps each response at `limit` bars, so full pages and
+        pages carrying a next_url are continued from one millisecond after the last bar received.
+        '''
+        results = []
+        cursor = chunk.start.isoformat()
+        while True:
+            resp = self.polygon._get_aggregates(
+                symbol, multiplier, timespan, cursor, chunk.end.isoformat(), end=chunk.end, limit=self.limit, sort='asc')
+            page = getattr(resp, 'results', None) or []
+            results.extend(page)
+            if not page or (len(page) < self.limit and not getattr(resp, 'next_url', None)):
+                break
+            cursor = page[-1]['t'] + 1
+        frame = decode_candles(results, daily=timespan in DAILY_TIMESPANS, tz=MARKET_TZ)
+        # Pages can overlap on the cursor bar
+        return frame[~frame.index.duplicated(keep='last')]
+
+    def download(self, symbol: str, start_date, end_date, multiplier: int = 1, timespan: str = 'day') -> pd.DataFrame:
+        '''
+        Fetch the range chunk by chunk. With a parquet sink, closed chunks that already have a part
+        for the same days are read back instead of fetched, and every fetched chunk is written as soon
+        as it completes.
+        :return: concatenated DataFrame indexed by date, limited to start_date to end_date
+        '''
+        chunks = self.split_range(start_date, end_date)
+        today = get_date_today(MARKET_TZ)
+        frames = {}
+        pending = []
+        for chunk in chunks:
+            if self._fs is not None and chunk.is_closed(today) and \
+                    self._fs.exists(self.get_part_path(symbol, multiplier, timespan, chunk)):
+                frames[chunk.name] = self._read_part(self.get_part_path(symbol, multiplier, timespan, chunk))
+            else:
+                pending.append(chunk)
+        if len(chunks) > len(pending):
+            self.logger.info("Resuming {}: {} of {} chunks already downloaded".format(
+                symbol, len(chunks) - len(pending), len(chunks)))
+
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.fetch_chunk, symbol, multiplier, timespan, chunk): chunk
+                       for chunk in pending}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                frames[chunk.name] = future.result()
+                if self._fs is not None:
+                    self._write_part(frames[chunk.name], self.get_part_path(symbol, multiplier, timespan, chunk))
+        self.logger.info("Fetched {} chunks of {}{} bars for {} in {:.2f}s".format(
+            len(pending), multiplier, timespan, symbol, time.time() - start_time))
+
+        frames = [frames[chunk.name] for chunk in chunks if len(frames[chunk.name].index)]
+        if not frames:
+            return decode_candles([], daily=timespan in DAILY_TIMESPANS, tz=MARKET_TZ)
+        return self.filter_range(pd.concat(frames), chunks[0].start, chunks[-1].end)
+
+    @staticmethod
+    def filter_range(data_frame: pd.DataFrame, start: date, end: date) -> pd.DataFrame:
+        '''
+        Rows whose market date lies within start to end, inclusive
+        '''
+        dates = data_frame.index
+        if dates.tz is not None:
+            dates = dates.tz_convert(MARKET_TZ).tz_localize(None)
+        dates = dates.normalize()
+        return data_frame[(dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end))]
+
+    def _read_part(self, path):
+        with self._fs.open(path, 'rb') as f:
+            return pd.read_parquet(f, engine='pyarrow')
+
+    def _write_part(self, data_frame, path):
+        if is_local(self._fs):
+            self._fs.makedirs(posixpath.dirname(path), exist_ok=True)
+        # Write then rename, so a part on disk is always complete and safe to resume from
+        temp_path = '{}.tmp'.format(path)
+        with self._fs.open(temp_path, 'wb') as f:
+            self.profile.write(data_frame, f)
+        self._fs.mv(temp_path, path)
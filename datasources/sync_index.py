@@ -0,0 +1,182 @@
+"""
+Per-symbol high-watermarks of what is already in storage, used to plan incremental syncs
+instead of re-pulling the full history of every symbol
+"""
+
+import datetime as dt
+import logging
+import posixpath
+import threading
+
+import pandas as pd
+
+from flows.datasources.iex import eIEXAPIRange
+from flows.util.storage import resolve, is_local
+from flows.util.parquet_profiles import get_profile, PROFILE_FAST
+from flows.util.trading_calendar import TradingCalendar
+from flows.util.util import IEXUtil
+
+# Smallest chart range first, with the number of calendar days it is guaranteed to cover
+RANGE_COVERAGE = [
+    (eIEXAPIRange.eOneMonth, 28),
+    (eIEXAPIRange.eThreeMonth, 89),
+    (eIEXAPIRange.eSixMonth, 181),
+    (eIEXAPIRange.eOneYear, 365),
+    (eIEXAPIRange.eTwoYear, 730),
+    (eIEXAPIRange.eFiveYear, 1826),
+]
+FULL_RANGE = eIEXAPIRange.eFiveYear
+
+
+class SyncPlan:
+    def __init__(self, symbol: str, start_date: dt.date, end_date: dt.date, eRange: eIEXAPIRange):
+        '''
+        :param start_date: first missing date, None when nothing is stored yet
+        :param end_date: last trade date to sync up to
+        :param eRange: smallest IEX chart range covering start_date to end_date
+        '''
+        self.symbol = symbol
+        self.start_date = start_date
+        self.end_date = end_date
+        self.eRange = eRange
+
+    def __repr__(self):
+        return 'SyncPlan({}, {}, {}, {})'.format(self.symbol, self.start_date, self.end_date, self.eRange.value)
+
+
+def get_minimal_range(start_date: dt.date, today: dt.date) -> eIEXAPIRange:
+    '''
+    Smallest IEX chart range, counted back from today, that still includes start_date
+    '''
+    if start_date is None:
+        return FULL_RANGE
+    days = (today - start_date).days
+    for eRange, coverage in RANGE_COVERAGE:
+        if days <= coverage:
+            return eRange
+    return FULL_RANGE
+
+
+class SymbolWatermarkIndex:
+    '''
+    Last stored date and last adjusted date per symbol, persisted as a small metadata parquet
+    '''
+    COLUMNS = ['symbol', 'last_date', 'last_adjusted']
+
+    def __init__(self, path: str, storage_options: dict = None):
+        '''
+        :param path: location of the metadata parquet, local path or gs:// url
+        '''
+        self.logger = logging.getLogger(str(self.__class__))
+        self.path = path
+        self._fs, self._fs_path = resolve(path, storage_options)
+        self._watermarks = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def load(self):
+        watermarks = {}
+        if self._fs.exists(self._fs_path):
+            with self._fs.open(self._fs_path, 'rb') as f:
+                df = pd.read_parquet(f, engine='pyarrow')
+            for symbol, last_date, last_adjusted in zip(
+                    df['symbol'], IEXUtil.convert_to_dates(df['last_date']),
+                    IEXUtil.convert_to_dates(df['last_adjusted'])):
+                watermarks[symbol] = (last_date, last_adjusted)
+        with self._lock:
+            self._watermarks = watermarks
+            self._dirty = False
+        self.logger.info('loaded {} watermarks from {}'.format(len(watermarks), self.path))
+        return self
+
+    def _ensure_loaded(self):
+        # Writers call update() from several threads, only the first one loads
+        with self._load_lock:
+            if self._watermarks is None:
+                self.load()
+
+    def get(self, symbol: str):
+        '''
+        :return: (last_date, last_adjusted) or None when nothing is stored for symbol
+        '''
+        self._ensure_loaded()
+        return self._watermarks.get(symbol)
+
+    def update(self, symbol: str, last_date, last_adjusted=None):
+        '''
+        Move the watermarks of symbol forward, never backward
+        '''
+        self._ensure_loaded()
+        last_date = IEXUtil.convert_to_date(last_date)
+        last_adjusted = IEXUtil.convert_to_date(last_adjusted) if last_adjusted is not None else last_date
+        with self._lock:
+            current = self._watermarks.get(symbol)
+            if current is not None:
+                last_date, last_adjusted = max(current[0], last_date), max(current[1], last_adjusted)
+                if (last_date, last_adjusted) == current:
+                    return
+            self._watermarks[symbol] = (last_date, last_adjusted)
+            self._dirty = True
+
+    def update_from_frame(self, symbol: str, data_frame: pd.DataFrame):
+        '''
+        :param data_frame: stored rows, with date as a column or as the index (see parse_dated_dataframe)
+        '''
+        if 'date' in data_frame.columns:
+            dates = data_frame['date']
+        elif data_frame.index.name == 'date':
+            dates = data_frame.index.to_series()
+        else:
+            return
+        last_date = pd.to_datetime(dates).max()
+        if pd.isnull(last_date):
+            return
+        last_adjusted = pd.to_datetime(data_frame['date_last_adjusted']).max() \
+            if 'date_last_adjusted' in data_frame.columns else None
+        self.update(symbol, last_date.date(), None if pd.isnull(last_adjusted) else last_adjusted.date())
+
+    def plan(self, symbols, last_trade_date: dt.date, today: dt.date = None, calendar: TradingCalendar = None) -> list:
+        '''
+        :param symbols: symbols to sync
+        :param last_trade_date: date every symbol should be synced up to
+        :param today: reference date of the IEX chart ranges, defaults to today
+        :param calendar: TradingCalendar, makes start_date the first missing trading day rather than the next day
+        :return: [SyncPlan] for the symbols that are behind last_trade_date
+        '''
+        self._ensure_loaded()
+        today = today or dt.date.today()
+        plans = []
+        for symbol in symbols:
+            watermark = self._watermarks.get(symbol)
+            if watermark is not None and watermark[0] >= last_trade_date:
+                continue
+            start_date = watermark[0] + dt.timedelta(days=1) if watermark is not None else None
+            if start_date is not None and calendar is not None and calendar.has_next_trading_day(watermark[0]):
+                start_date = calendar.next_trading_day(watermark[0])
+            plans.append(SyncPlan(symbol, start_date, last_trade_date, get_minimal_range(start_date, today)))
+        self.logger.info('{} of {} symbols need syncing up to {}'.format(len(plans), len(symbols), last_trade_date))
+        return plans
+
+    def save(self, force: bool = False):
+        '''
+        Persist the index, written to a temporary file first and then moved over the old one
+        '''
+        self._ensure_loaded()
+        with self._lock:
+            if not self._dirty and not force:
+                return False
+            items = sorted(self._watermarks.items())
+            self._dirty = False
+        df = pd.DataFrame({
+            'symbol': [symbol for symbol, _ in items],
+            'last_date': pd.to_datetime([watermark[0] for _, watermark in items]),
+            'last_adjusted': pd.to_datetime([watermark[1] for _, watermark in items]),
+        }, columns=self.COLUMNS)
+        if is_local(self._fs):
+            self._fs.makedirs(posixpath.dirname(self._fs_path), exist_ok=True)
+        temp_path = '{}.tmp'.format(self._fs_path)
+        with self._fs.open(temp_path, 'wb') as f:
+            get_profile(PROFILE_FAST).write(df, f, index=False)
+        self._fs.mv(temp_path, self._fs_path)
+        return True
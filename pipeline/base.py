@@ -28,3 +28,31 @@ class DataLoader:
     @abstractmethod
     def load(self, df, **kwargs) -> None:
         pass
+
+    def flush(self) -> None:
+        '''
+        Write out anything the loader is still buffering. No-op for unbuffered loaders.
+        '''
+        pass
+
+    def flush_if_due(self) -> None:
+        '''
+        Flush only when a buffering limit has been reached, called while the loader is idle.
+        No-op for unbuffered loaders.
+        '''
+        pass
+
+    def has_pending_data(self) -> bool:
+        '''
+        True while data accepted by load() has not been written yet
+        '''
+        return False
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -1,42 +1,142 @@
 import logging
 import os
+import threading
+import time
 import pandas as pd
-from flows.util.parquet_util import ParquetUtil
+from flows.util.parquet_dataset import ParquetDataset
 from google.cloud import storage
-from google.cloud.storage.blob import Blob
+from flows.util.gcp.gcp_storage_connection import GCPStorageConnection
+from flows.util.gcp.gcp_storage_index import GCPStorageIndex, DEFAULT_TTL_SECONDS
 from flows.postgres.client import PostgresClient
 from flows.pipeline.base import DataLoader
-from namespace.constants import WriteMode
 
 
 class PostgresDataLoader(DataLoader):
+    '''
+    Upserts each frame into Postgres, or with any of the batch_max_* limits set, buffers frames and
+    upserts them together once a limit is reached. The time limit is checked by load() and
+    flush_if_due(), PipelineRunner calls the latter while the loader is idle. A failed upsert keeps
+    the buffer for the next flush.
+    '''
 
     TABLE_SCHEMA = 'table_schema'
     DB_SCHEMA = 'db_schema'
     TABLE = 'table'
     KEYS = 'keys'
     VALUES = 'values'
+    COPY_BINARY = 'copy_binary'
+    # Use INSERT ... ON CONFLICT through a reused staging table, needs a unique constraint on the keys
+    MERGE = 'merge'
+    # Optional micro-batching thresholds; a flush happens as soon as any of them is reached
+    BATCH_MAX_ROWS = 'batch_max_rows'
+    BATCH_MAX_BYTES = 'batch_max_bytes'
+    BATCH_MAX_SECONDS = 'batch_max_seconds'
 
     def __init__(self, context, client=None):
         super().__init__(context)
+        self.logger = logging.getLogger(str(self.__class__))
         if not client:
             self.postgres_client = PostgresClient(
                 host=context[PostgresClient.CFG_HOST],
                 database=context[PostgresClient.CFG_DATABASE],
                 user=context[PostgresClient.CFG_USER],
                 password=context[PostgresClient.CFG_PASSWORD],
+                min_connections=context.get(PostgresClient.CFG_MIN_CONNECTIONS),
+                max_connections=context.get(PostgresClient.CFG_MAX_CONNECTIONS),
             )
         else:
             self.postgres_client = client
+        self._batch_max_rows = context.get(PostgresDataLoader.BATCH_MAX_ROWS)
+        self._batch_max_bytes = context.get(PostgresDataLoader.BATCH_MAX_BYTES)
+        self._batch_max_seconds = context.get(PostgresDataLoader.BATCH_MAX_SECONDS)
+        self._buffer = []
+        self._buffered_rows = 0
+        self._buffered_bytes = 0
+        self._buffer_started_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_batching(self):
+        return bool(self._batch_max_rows or self._batch_max_bytes or self._batch_max_seconds)
 
     def load(self, df, **kwargs):
+        if not self.is_batching:
+            return self._upsert(df)
+        with self._lock:
+            if self._buffer_started_at is None:
+                self._buffer_started_at = time.time()
+            size = int(df.memory_usage(index=True, deep=True).sum()) if self._batch_max_bytes else 0
+            self._buffer.append(df)
+            self._buffered_rows += len(df.index)
+            self._buffered_bytes += size
+            if self._is_batch_full():
+                try:
+                    self._flush_buffer()
+                except Exception:
+                    # This load fails, so its frame leaves the buffer; earlier frames wait for the next flush
+                    self._buffer.pop()
+                    self._buffered_rows -= len(df.index)
+                    self._buffered_bytes -= size
+                    if not self._buffer:
+                        self._buffer_started_at = None
+                    raise
+
+    def flush(self):
+        with self._lock:
+            self._flush_buffer()
+
+    def flush_if_due(self):
+        with self._lock:
+            if self._buffer and self._is_batch_full():
+                self._flush_buffer()
+
+    def has_pending_data(self):
+        with self._lock:
+            return bool(self._buffer)
+
+    def _is_batch_full(self):
+        if self._batch_max_rows and self._buffered_rows >= self._batch_max_rows:
+            return True
+        if self._batch_max_bytes and self._buffered_bytes >= self._batch_max_bytes:
+            return True
+        if self._batch_max_seconds and time.time() - self._buffer_started_at >= self._batch_max_seconds:
+            return True
+        return False
+
+    def _flush_buffer(self):
+        if not self._buffer:
+            return
+        frames = self._buffer
+        df = frames[0] if len(frames) == 1 else pd.concat(frames)
+        # A single staging table cannot hold two rows for the same key, the last frame wins
+        df = df.drop_duplicates(subset=self.context[PostgresDataLoader.KEYS], keep='last')
+        self.logger.info("Flushing {} buffered frames ({} rows)".format(len(frames), len(df.index)))
+        self._upsert(df)
+        # Only cleared once the rows are written, a failed upsert leaves them for the next flush
+        self._buffer = []
+        self._buffered_rows = 0
+        self._buffered_bytes = 0
+        self._buffer_started_at = None
+
+    def _upsert(self, df):
+        if self.context.get(PostgresDataLoader.MERGE, False):
+            return self.postgres_client.merge_from_df(
+                df,
+                self.context[PostgresDataLoader.TABLE_SCHEMA],
+                self.context[PostgresDataLoader.DB_SCHEMA],
+                self.context[PostgresDataLoader.TABLE],
+                self.context[PostgresDataLoader.KEYS],
+                self.context[PostgresDataLoader.VALUES],
+                binary=self.context.get(PostgresDataLoader.COPY_BINARY, False)
+            )
         self.postgres_client.upsert_from_df(
             df,
             self.context[PostgresDataLoader.TABLE_SCHEMA],
             self.context[PostgresDataLoader.DB_SCHEMA],
             self.context[PostgresDataLoader.TABLE],
             self.context[PostgresDataLoader.KEYS],
-            self.context[PostgresDataLoader.VALUES]
+            self.context[PostgresDataLoader.VALUES],
+            binary=self.context.get(PostgresDataLoader.COPY_BINARY, False)
         )
 
 
@@ -45,10 +145,18 @@ class GStorageDataLoader(DataLoader):
     NAME_FOLDER = 'folder'
     NAME_PARTITION = 'partition'
     WRITE_MODE = 'write_mode'
+    # Seconds before the listing of the folder used for existence checks is refreshed
+    INDEX_TTL_SECONDS = 'index_ttl_seconds'
 
     def __init__(self, context):
         super().__init__(context)
         self._gs_client = storage.Client()
+        self._index = GCPStorageIndex(
+            self.context[GStorageDataLoader.NAME_BUCKET],
+            self.context[GStorageDataLoader.NAME_FOLDER],
+            ttl_seconds=self.context.get(GStorageDataLoader.INDEX_TTL_SECONDS, DEFAULT_TTL_SECONDS),
+            connection=GCPStorageConnection(self._gs_client),
+        )
 
     def load(self, df: pd.DataFrame, **kwargs):
         path = 'gs://{bucket}/{folder}/{partition}/data.parquet'.format(
@@ -56,8 +164,9 @@ class GStorageDataLoader(DataLoader):
             folder=self.context[GStorageDataLoader.NAME_FOLDER],
             partition=self.context[GStorageDataLoader.NAME_PARTITION],
         )
-        if Blob.from_string(path).exists(self._gs_client):
-            mode = WriteMode.UPSERT
-        else:
-            mode = WriteMode.OVERWRITE
-        return ParquetUtil.write_parquet(df, path, mode=mode)
+        # A miss is confirmed with GCS, the base may have been written by another worker since the listing
+        base_exists = self._index.exists(path, confirm_missing=True)
+        ParquetDataset(path).append(df, base_exists=base_exists)
+        if not base_exists:
+            self._index.add(path)
+        return True
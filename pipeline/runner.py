@@ -0,0 +1,291 @@
+"""
+Concurrent executor for TickerProvider -> DataProvider -> DataTransformer -> DataLoader pipelines
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import pandas as pd
+
+from flows.pipeline.base import TickerProvider, DataProvider, DataTransformer, DataLoader
+
+STAGE_FETCH = 'fetch'
+STAGE_TRANSFORM = 'transform'
+STAGE_LOAD = 'load'
+
+_END_OF_STREAM = object()
+# How often an idle load stage gives the loader a chance to flush on its time limit
+LOAD_POLL_SECONDS = 1.0
+
+
+def _timed_call(func, *args, **kwargs):
+    # Module level so it can be shipped to a ProcessPoolExecutor
+    start_time = time.time()
+    result = func(*args, **kwargs)
+    return result, time.time() - start_time
+
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, succeeded: int = 0, failed: int = 0, skipped: int = 0):
+        with self._lock:
+            self.busy_seconds += seconds
+            self.succeeded += succeeded
+            self.failed += failed
+            self.skipped += skipped
+
+    def to_dict(self):
+        return {
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'busy_seconds': self.busy_seconds,
+        }
+
+
+class PipelineRunSummary:
+    def __init__(self):
+        self.stages = {name: StageStats(name) for name in [STAGE_FETCH, STAGE_TRANSFORM, STAGE_LOAD]}
+        self.loaded_tickers = []
+        self.failures = {}
+        self.started_at = time.time()
+        self.elapsed_seconds = None
+        self._lock = threading.Lock()
+
+    def add_failure(self, ticker, stage: str, error: Exception):
+        with self._lock:
+            self.failures[ticker] = (stage, error)
+
+    def add_loaded(self, tickers: list):
+        with self._lock:
+            self.loaded_tickers.extend(tickers)
+
+    def finish(self):
+        self.elapsed_seconds = time.time() - self.started_at
+
+    def to_dict(self):
+        return {
+            'elapsed_seconds': self.elapsed_seconds,
+            'loaded': len(self.loaded_tickers),
+            'failed': len(self.failures),
+            'stages': {name: stats.to_dict() for name, stats in self.stages.items()},
+        }
+
+    def __str__(self):
+        lines = ['Pipeline finished in {:.2f}s: {} loaded, {} failed'.format(
+            self.elapsed_seconds or 0.0, len(self.loaded_tickers), len(self.failures))]
+        for name, stats in self.stages.items():
+            lines.append('  {:<10} ok={} failed={} skipped={} busy={:.2f}s'.format(
+                name, stats.succeeded, stats.failed, stats.skipped, stats.busy_seconds))
+        return '\n'.join(lines)
+
+
+class PipelineRunner:
+    '''
+    Fans tickers out to a bounded worker pool for DataProvider.get_dataframe, then streams the
+    frames through bounded queues into the transformer workers and a single batching loader.
+    A failure on one ticker is recorded in the run summary and never stops the rest of the run.
+    '''
+
+    def __init__(self,
+                 ticker_provider: TickerProvider,
+                 data_provider: DataProvider,
+                 loader: DataLoader,
+                 transformer: DataTransformer = None,
+                 fetch_workers: int = 8,
+                 transform_workers: int = 1,
+                 queue_size: int = 32,
+                 load_batch_size: int = 1,
+                 use_processes: bool = False):
+        '''
+        :param ticker_provider: source of the ticker universe
+        :param data_provider: called as get_dataframe(ticker=..., **kwargs) for each ticker
+        :param loader: called as load(df, tickers=[...], **kwargs) for each batch
+        :param transformer: optional, called as transform(df, ticker=..., **kwargs)
+        :param fetch_workers: size of the fetch pool
+        :param transform_workers: number of transformer threads
+        :param queue_size: capacity of each inter-stage queue, bounds memory held between stages
+        :param load_batch_size: number of ticker frames concatenated into one load call
+        :param use_processes: run the fetch stage on a process pool instead of threads
+        '''
+        if fetch_workers < 1 or transform_workers < 1 or queue_size < 1 or load_batch_size < 1:
+            raise ValueError("Pipeline worker counts, queue size and batch size must be positive")
+        self.logger = logging.getLogger(str(self.__class__))
+        self.ticker_provider = ticker_provider
+        self.data_provider = data_provider
+        self.transformer = transformer
+        self.loader = loader
+        self.fetch_workers = fetch_workers
+        self.transform_workers = transform_workers
+        self.queue_size = queue_size
+        self.load_batch_size = load_batch_size
+        self.use_processes = use_processes
+
+    def run(self, **kwargs) -> PipelineRunSummary:
+        summary = PipelineRunSummary()
+        tickers = self.ticker_provider.get_tickers()
+        self.logger.info("Starting pipeline for {} tickers".format(len(tickers)))
+
+        fetched = queue.Queue(maxsize=self.queue_size)
+        transformed = queue.Queue(maxsize=self.queue_size)
+        transform_threads = [
+            threading.Thread(target=self._transform_worker, args=(fetched, transformed, summary, kwargs),
+                             name='pipeline-transform-%d' % i, daemon=True)
+            for i in range(self.transform_workers)
+        ]
+        load_thread = threading.Thread(target=self._load_worker, args=(transformed, summary, kwargs),
+                                       name='pipeline-load', daemon=True)
+        for thread in transform_threads:
+            thread.start()
+        load_thread.start()
+
+        try:
+            self._fetch_all(tickers, fetched, summary, kwargs)
+        finally:
+            for _ in transform_threads:
+                fetched.put(_END_OF_STREAM)
+            for thread in transform_threads:
+                thread.join()
+            transformed.put(_END_OF_STREAM)
+            load_thread.join()
+
+        summary.finish()
+        self.logger.info(str(summary))
+        return summary
+
+    def _create_executor(self):
+        if self.use_processes:
+            return ProcessPoolExecutor(max_workers=self.fetch_workers)
+        return ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix='pipeline-fetch')
+
+    def _fetch_all(self, tickers, output: queue.Queue, summary: PipelineRunSummary, kwargs):
+        # Never keep more than one pool's worth of fetches in flight beyond what the queue can hold,
+        # so a slow transformer or loader throttles the fetch stage instead of buffering the universe.
+        max_in_flight = self.fetch_workers + self.queue_size
+        pending = {}
+        with self._create_executor() as executor:
+            for ticker in tickers:
+                while len(pending) >= max_in_flight:
+                    self._drain_fetches(pending, output, summary, FIRST_COMPLETED)
+                future = executor.submit(_timed_call, self.data_provider.get_dataframe, ticker=ticker, **kwargs)
+                pending[future] = ticker
+            while pending:
+                self._drain_fetches(pending, output, summary, FIRST_COMPLETED)
+
+    def _drain_fetches(self, pending: dict, output: queue.Queue, summary: PipelineRunSummary, return_when):
+        stats = summary.stages[STAGE_FETCH]
+        done, _ = wait(list(pending.keys()), return_when=return_when)
+        for future in done:
+            ticker = pending.pop(future)
+            try:
+                df, seconds = future.result()
+            except Exception as e:
+                self.logger.error("Failed to fetch {}: {}".format(ticker, e))
+                stats.record(0.0, failed=1)
+                summary.add_failure(ticker, STAGE_FETCH, e)
+                continue
+            if df is None or len(df.index) == 0:
+                stats.record(seconds, skipped=1)
+                continue
+            stats.record(seconds, succeeded=1)
+            output.put((ticker, df))
+
+    def _transform_worker(self, source: queue.Queue, output: queue.Queue, summary: PipelineRunSummary, kwargs):
+        stats = summary.stages[STAGE_TRANSFORM]
+        while True:
+            item = source.get()
+            if item is _END_OF_STREAM:
+                return
+            ticker, df = item
+            if not self.transformer:
+                output.put(item)
+                continue
+            start_time = time.time()
+            try:
+                df = self.transformer.transform(df, ticker=ticker, **kwargs)
+            except Exception as e:
+                self.logger.error("Failed to transform {}: {}".format(ticker, e))
+                stats.record(time.time() - start_time, failed=1)
+                summary.add_failure(ticker, STAGE_TRANSFORM, e)
+                continue
+            stats.record(time.time() - start_time, succeeded=1)
+            output.put((ticker, df))
+
+    def _load_worker(self, source: queue.Queue, summary: PipelineRunSummary, kwargs):
+        batch = []
+        # Tickers whose rows the loader has accepted but not written yet
+        buffered = []
+        while True:
+            try:
+                item = source.get(timeout=LOAD_POLL_SECONDS)
+            except queue.Empty:
+                self._flush_loader_if_due(buffered, summary)
+                continue
+            if item is _END_OF_STREAM:
+                break
+            batch.append(item)
+            if len(batch) >= self.load_batch_size:
+                self._load_batch(batch, buffered, summary, kwargs)
+                batch = []
+        if batch:
+            self._load_batch(batch, buffered, summary, kwargs)
+        self._flush_loader(buffered, summary)
+
+    def _load_batch(self, batch: list, buffered: list, summary: PipelineRunSummary, kwargs):
+        stats = summary.stages[STAGE_LOAD]
+        tickers = [ticker for ticker, _ in batch]
+        start_time = time.time()
+        try:
+            df = batch[0][1] if len(batch) == 1 else pd.concat([df for _, df in batch])
+            self.loader.load(df, tickers=tickers, **kwargs)
+        except Exception as e:
+            self.logger.error("Failed to load batch {}: {}".format(tickers, e))
+            stats.record(time.time() - start_time, failed=len(tickers))
+            for ticker in tickers:
+                summary.add_failure(ticker, STAGE_LOAD, e)
+            return
+        stats.record(time.time() - start_time)
+        buffered.extend(tickers)
+        self._mark_written(buffered, summary)
+
+    def _mark_written(self, buffered: list, summary: PipelineRunSummary):
+        # Buffered tickers only count as loaded once the loader has written everything it holds
+        if buffered and not self.loader.has_pending_data():
+            summary.stages[STAGE_LOAD].record(0.0, succeeded=len(buffered))
+            summary.add_loaded(list(buffered))
+            del buffered[:]
+
+    def _flush_loader_if_due(self, buffered: list, summary: PipelineRunSummary):
+        if not buffered:
+            return
+        try:
+            self.loader.flush_if_due()
+        except Exception as e:
+            self.logger.error("Failed to flush loader, the rows stay buffered for the next flush: {}".format(e))
+            return
+        self._mark_written(buffered, summary)
+
+    def _flush_loader(self, buffered: list, summary: PipelineRunSummary):
+        stats = summary.stages[STAGE_LOAD]
+        start_time = time.time()
+        try:
+            self.loader.flush()
+        except Exception as e:
+            self.logger.error("Failed to flush loader: {}".format(e))
+            stats.record(time.time() - start_time, failed=len(buffered) or 1)
+            for ticker in buffered:
+                summary.add_failure(ticker, STAGE_LOAD, e)
+            del buffered[:]
+            return
+        stats.record(time.time() - start_time)
+        self._mark_written(buffered, summary)
@@ -0,0 +1,124 @@
+"""
+Encoder for the PostgreSQL binary COPY format (PGCOPY), driven by a Schema's column types
+"""
+
+import struct
+import numpy as np
+import pandas as pd
+
+from flows.postgres.schemas import Schema, DataTypes
+
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+PGCOPY_TRAILER = struct.pack('>h', -1)
+
+# Postgres stores dates and timestamps relative to 2000-01-01
+_PG_EPOCH_DAYS = 10957
+_PG_EPOCH_MICROS = _PG_EPOCH_DAYS * 86400 * 1000000
+
+_FIXED_WIDTH_TYPES = {
+    DataTypes.INTEGER: '>i4',
+    DataTypes.BIGINT: '>i8',
+    DataTypes.FLOAT: '>f8',
+    DataTypes.DOUBLE: '>f8',
+    DataTypes.DATE: '>i4',
+    DataTypes.TIME: '>i8',
+    DataTypes.TIMESTAMP: '>i8',
+}
+
+
+def _is_text_type(pg_type: str):
+    return pg_type == DataTypes.TEXT or pg_type.startswith('VARCHAR')
+
+
+def _encode_fixed_values(series: pd.Series, pg_type: str, nulls: np.ndarray) -> np.ndarray:
+    if pg_type == DataTypes.DATE:
+        days = pd.to_datetime(series).values.astype('datetime64[D]').astype(np.int64)
+        values = days - _PG_EPOCH_DAYS
+    elif pg_type == DataTypes.TIMESTAMP:
+        micros = pd.to_datetime(series).values.astype('datetime64[us]').astype(np.int64)
+        values = micros - _PG_EPOCH_MICROS
+    elif pg_type == DataTypes.TIME:
+        if not pd.api.types.is_timedelta64_dtype(series):
+            series = pd.to_timedelta(series.astype(str).where(~nulls, None))
+        values = series.values.astype('timedelta64[us]').astype(np.int64)
+    else:
+        values = series.values
+    if nulls.any():
+        # Null slots are never written, any placeholder that survives the cast will do
+        values = np.where(nulls, 0, values)
+    return np.ascontiguousarray(values.astype(_FIXED_WIDTH_TYPES[pg_type]))
+
+
+def _scatter_field(buffer: np.ndarray, offsets: np.ndarray, width: int, field: np.ndarray):
+    buffer[offsets[:, None] + np.arange(width)] = field.view(np.uint8).reshape(-1, width)
+
+
+def encode_binary_copy(df: pd.DataFrame, schema: Schema, header=True, trailer=True) -> bytes:
+    '''
+    Encode df into PGCOPY tuples, the DataFrame columns must follow the Schema column order
+    :param df: data to encode
+    :param schema: Schema used to pick the wire type of each column
+    :param header: prepend the PGCOPY signature and header
+    :param trailer: append the end-of-data marker
+    :return: bytes
+    '''
+    types = [schema.columns[column] for column in df.columns]
+    row_count = len(df.index)
+    # Per column: (null mask, payload length per row, joined text payload, fixed-width values)
+    columns = []
+    for column, pg_type in zip(df.columns, types):
+        series = df[column]
+        nulls = pd.isna(series).values
+        if _is_text_type(pg_type):
+            payloads = [b'' if null else str(value).encode('utf-8') for value, null in zip(series.values, nulls)]
+            lengths = np.fromiter((len(p) for p in payloads), dtype=np.int64, count=row_count)
+            columns.append((nulls, lengths, b''.join(payloads), None))
+        elif pg_type in _FIXED_WIDTH_TYPES:
+            values = _encode_fixed_values(series, pg_type, nulls)
+            lengths = np.where(nulls, 0, values.itemsize).astype(np.int64)
+            columns.append((nulls, lengths, None, values))
+        else:
+            raise ValueError("Binary COPY does not support column '{}' of type {}".format(column, pg_type))
+
+    row_lengths = np.full(row_count, 2, dtype=np.int64)
+    for _, lengths, _, _ in columns:
+        row_lengths += 4 + lengths
+    row_offsets = np.zeros(row_count, dtype=np.int64)
+    np.cumsum(row_lengths[:-1], out=row_offsets[1:])
+    buffer = np.empty(int(row_lengths.sum()), dtype=np.uint8)
+
+    field_count = np.full(row_count, len(columns), dtype='>i2')
+    _scatter_field(buffer, row_offsets, 2, field_count)
+    field_offsets = row_offsets + 2
+    for nulls, lengths, text_payload, values in columns:
+        length_words = np.where(nulls, -1, lengths).astype('>i4')
+        _scatter_field(buffer, field_offsets, 4, length_words)
+        data_offsets = field_offsets + 4
+        if values is not None:
+            present = ~nulls
+            _scatter_field(buffer, data_offsets[present], values.itemsize, values[present])
+        elif text_payload:
+            # Each byte of the joined payload goes to its row's data offset plus its position in the value
+            starts = np.zeros(row_count, dtype=np.int64)
+            np.cumsum(lengths[:-1], out=starts[1:])
+            shift = np.repeat(data_offsets - starts, lengths)
+            buffer[shift + np.arange(len(text_payload))] = np.frombuffer(text_payload, dtype=np.uint8)
+        field_offsets = data_offsets + lengths
+
+    parts = [buffer.tobytes()]
+    if header:
+        parts.insert(0, PGCOPY_HEADER)
+    if trailer:
+        parts.append(PGCOPY_TRAILER)
+    return b''.join(parts)
+
+
+def iter_binary_copy_chunks(df: pd.DataFrame, schema: Schema, chunk_size: int = 10000):
+    '''
+    Encode df as a PGCOPY stream, chunk_size rows at a time
+    :return: generator of bytes
+    '''
+    yield PGCOPY_HEADER
+    for start in range(0, len(df.index), chunk_size):
+        yield encode_binary_copy(df.iloc[start:start + chunk_size], schema, header=False, trailer=False)
+    yield PGCOPY_TRAILER
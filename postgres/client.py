@@ -1,12 +1,18 @@
 import logging
 import os
+import threading
 import psycopg2
 import pandas as pd
+from contextlib import contextmanager
 from functools import wraps
+from psycopg2.pool import ThreadedConnectionPool
 from flows.postgres.schemas import Schema
 from flows.postgres.queries import *
-from flows.util.dataframe_util import rearrange_columns
-from flows.util.string_iterator_io import StringIteratorIO
+from flows.postgres.binary_copy import iter_binary_copy_chunks
+from flows.util.dataframe_util import rearrange_columns, iter_csv_chunks
+from flows.util.string_iterator_io import StringIteratorIO, BytesIteratorIO
+
+DEFAULT_COPY_CHUNK_SIZE = 10000
 
 
 def get_postgres_destination(schema, table):
@@ -14,46 +20,241 @@ def get_postgres_destination(schema, table):
 
 
 def get_data_stream(data):
-    gen = (row + '\n' for row in data.split('\n'))
-    return StringIteratorIO(gen)
+    return StringIteratorIO(iter([data]))
+
+
+def get_csv_stream(df: pd.DataFrame, with_index=False, chunk_size=DEFAULT_COPY_CHUNK_SIZE):
+    return BytesIteratorIO(iter_csv_chunks(df, chunk_size=chunk_size, index=with_index))
+
+
+def get_binary_stream(df: pd.DataFrame, table_schema: Schema, with_index=False, chunk_size=DEFAULT_COPY_CHUNK_SIZE):
+    if with_index:
+        df = df.reset_index()
+    df = rearrange_columns(df, table_schema)
+    return BytesIteratorIO(iter_binary_copy_chunks(df, table_schema, chunk_size=chunk_size))
+
+
+def get_copy_format(binary=False):
+    return 'BINARY' if binary else 'CSV'
 
 
 def transaction(method):
     @wraps(method)
     def _impl(self, *args, **kwargs):
-        method(self, *args, **kwargs)
-        self.conn.commit()
+        with self.connection() as conn:
+            try:
+                result = method(self, *args, **kwargs)
+                conn.commit()
+            except Exception:
+                if not conn.closed:
+                    conn.rollback()
+                raise
         self.logger.info("Transaction successfully completed!")
+        return result
     return _impl
 
 
+class UpsertResult:
+    def __init__(self, inserted=0, updated=0, unchanged=0):
+        self.inserted = inserted
+        self.updated = updated
+        self.unchanged = unchanged
+
+    def __repr__(self):
+        return 'UpsertResult(inserted={}, updated={}, unchanged={})'.format(self.inserted, self.updated, self.unchanged)
+
+
 class PostgresClient:
     CFG_HOST = 'db_host'
     CFG_DATABASE = 'db_name'
     CFG_USER = 'db_user'
     CFG_PASSWORD = 'db_password'
+    CFG_MIN_CONNECTIONS = 'db_min_connections'
+    CFG_MAX_CONNECTIONS = 'db_max_connections'
 
-    def __init__(self, host, database, user, password):
+    def __init__(self, host, database, user, password, min_connections=None, max_connections=None, health_check=True):
+        '''
+        :param min_connections: connections opened up front in pooled mode
+        :param max_connections: enables pooled mode, each thread or operation leases its own connection
+        :param health_check: ping pooled connections with SELECT 1 before handing them out
+        '''
         self.logger = logging.getLogger('{}@{}'.format(user, host))
         self.logger.setLevel(logging.INFO)
         self._dsn = "host=%s dbname=%s user=%s password=%s" % (host, database, user, password)
-        self.conn = psycopg2.connect(self._dsn)
-        self.cursor = self.conn.cursor()
+        self._health_check = health_check
+        self._local = threading.local()
+        self._pool = None
+        self._pool_slots = None
+        # Leased connections by thread, so close() and exited threads can give them back
+        self._leases = {}
+        self._leases_lock = threading.Lock()
+        self._conn = None
+        self._cursor = None
+        if max_connections:
+            self._pool = ThreadedConnectionPool(min_connections or 1, max_connections, self._dsn)
+            # ThreadedConnectionPool raises when exhausted, make callers wait for a free connection instead
+            self._pool_slots = threading.BoundedSemaphore(max_connections)
+        else:
+            self._conn = psycopg2.connect(self._dsn)
+            self._cursor = self._conn.cursor()
+
+    @property
+    def is_pooled(self):
+        return self._pool is not None
+
+    # Outside connection() the pooled properties lease a connection that stays with the calling thread
+    # until release(), close() or, once the pool runs dry, the thread's exit
+    @property
+    def conn(self):
+        if not self.is_pooled:
+            return self._conn
+        if getattr(self._local, 'conn', None) is None:
+            self._lease()
+        return self._local.conn
+
+    @property
+    def cursor(self):
+        if not self.is_pooled:
+            return self._cursor
+        if getattr(self._local, 'conn', None) is None:
+            self._lease()
+        return self._local.cursor
+
+    @contextmanager
+    def connection(self):
+        '''
+        Scope an operation to one connection. In pooled mode the calling thread leases a healthy
+        connection for the duration of the block unless it already holds one; broken connections
+        are discarded instead of being returned to the pool.
+        '''
+        if not self.is_pooled:
+            self.reconnect()
+            yield self._conn
+            return
+        if getattr(self._local, 'conn', None) is not None:
+            yield self._local.conn
+            return
+        conn = self._lease()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.release(close=broken)
+
+    def _lease(self):
+        if not self._pool_slots.acquire(blocking=False):
+            self._reclaim_abandoned()
+            self._pool_slots.acquire()
+        try:
+            conn = self._pool.getconn()
+            while not self._is_healthy(conn):
+                self.logger.warning("Discarding broken pooled connection")
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        except Exception:
+            self._pool_slots.release()
+            raise
+        self._local.conn = conn
+        self._local.cursor = conn.cursor()
+        with self._leases_lock:
+            self._leases[threading.current_thread()] = conn
+        return conn
+
+    def _reclaim_abandoned(self):
+        '''
+        Return the connections of threads that exited without calling release(). Their transaction
+        state is unknown, so the connections are closed rather than reused.
+        :return: number of connections reclaimed
+        '''
+        with self._leases_lock:
+            abandoned = [thread for thread in self._leases if not thread.is_alive()]
+            connections = [self._leases.pop(thread) for thread in abandoned]
+        for conn in connections:
+            self.logger.warning("Reclaiming a connection leased by a thread that exited without release()")
+            self._pool.putconn(conn, close=True)
+            self._pool_slots.release()
+        return len(connections)
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if not self._health_check:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def release(self, close=False):
+        '''
+        Return the calling thread's leased connection to the pool. No-op outside pooled mode.
+        '''
+        conn = getattr(self._local, 'conn', None)
+        if not self.is_pooled or conn is None:
+            return
+        cursor = self._local.cursor
+        self._local.conn = None
+        self._local.cursor = None
+        with self._leases_lock:
+            if self._leases.pop(threading.current_thread(), None) is None:
+                # Already returned by close()
+                return
+        try:
+            if not cursor.closed and not conn.closed:
+                cursor.close()
+        finally:
+            self._pool.putconn(conn, close=close or bool(conn.closed))
+            self._pool_slots.release()
 
     def reconnect(self):
-        if not self.conn.closed:
+        if self.is_pooled:
+            conn = getattr(self._local, 'conn', None)
+            if conn is None or not conn.closed:
+                return False
+            self.release(close=True)
+            return True
+        if not self._conn.closed:
             return False
-        self.conn = psycopg2.connect(self._dsn)
-        self.cursor = self.conn.cursor()
+        self._conn = psycopg2.connect(self._dsn)
+        self._cursor = self._conn.cursor()
         return True
 
+    def close(self):
+        '''
+        Close every connection. In pooled mode this includes connections still leased by threads
+        that never called release().
+        '''
+        if self.is_pooled:
+            with self._leases_lock:
+                connections = list(self._leases.values())
+                self._leases.clear()
+            for conn in connections:
+                self._pool.putconn(conn, close=True)
+                self._pool_slots.release()
+            self._pool.closeall()
+        elif not self._conn.closed:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
     def _run_query(self, query):
         self.logger.info("Executing query: \n%s" % query)
         self.cursor.execute(query)
 
-    def query(self, query):
-        self.cursor.execute(query)
-        return self.cursor.fetchall()
+    def query(self, query, params=None):
+        with self.connection():
+            self.cursor.execute(query, params)
+            return self.cursor.fetchall()
 
     def create_staging_table(self, schema: Schema, table_name):
         staging_table_name = table_name + '_staging'
@@ -61,10 +262,20 @@ class PostgresClient:
         self.cursor.execute(query)
         return staging_table_name
 
+    def prepare_persistent_staging_table(self, schema: Schema, table_name):
+        '''
+        Session-scoped staging table that is created once per connection and emptied with TRUNCATE
+        on reuse, instead of being dropped and recreated on every load.
+        '''
+        staging_table_name = table_name + '_merge_staging'
+        self.cursor.execute(create_temp_table_if_not_exists_query(schema, staging_table_name))
+        self.cursor.execute('TRUNCATE %s' % staging_table_name)
+        return staging_table_name
+
+    @transaction
     def create_table_if_not_exists(self, table_schema: Schema, db_schema: str, table_name):
         query = create_table_if_not_exists_query(table_schema, get_postgres_destination(db_schema, table_name))
         self._run_query(query)
-        self.logger.info("Query successful")
 
     @transaction
     def truncate_load(self, df: pd.DataFrame, schema, table):
@@ -77,11 +288,34 @@ class PostgresClient:
     def bulk_load_from_file(self, data, schema, table):
         self.cursor.copy_from(data, get_postgres_destination(schema, table), sep=',')
 
-    def bulk_load_from_df(self, df: pd.DataFrame, schema, table, with_index=False):
-        data = df.to_csv(index=with_index, header=False)[:-1]  # remove last newline character
+    def bulk_load_from_df(self,
+                          df: pd.DataFrame,
+                          schema,
+                          table,
+                          with_index=False,
+                          chunk_size=DEFAULT_COPY_CHUNK_SIZE,
+                          binary=False,
+                          table_schema: Schema = None):
+        '''
+        Load Pandas DF into target table.
+        :param df:
+        :param schema: target schema
+        :param table: target table
+        :param with_index: Flag for using Pandas DF index or not
+        :param chunk_size: Number of rows encoded at a time while streaming to the server
+        :param binary: Use COPY FORMAT BINARY, requires table_schema for the column types
+        :param table_schema: Schema object of the target table
+        :return:
+        '''
         size = len(df.index)
         self.logger.info("Initializing bulk load {} rows to {}.{}".format(size, schema, table))
-        self.bulk_load_from_string(data, schema, table)
+        if binary:
+            if table_schema is None:
+                raise ValueError("Binary COPY requires the table_schema of {}.{}".format(schema, table))
+            data_stream = get_binary_stream(df, table_schema, with_index, chunk_size)
+        else:
+            data_stream = get_csv_stream(df, with_index, chunk_size)
+        self.bulk_load_from_stream(data_stream, schema, table, binary=binary)
 
     def bulk_load_from_string(self, data, schema, table):
         '''
@@ -91,10 +325,22 @@ class PostgresClient:
         :param table: target table
         :return:
         '''
-        data_iterator = get_data_stream(data)
-        self.cursor.copy_expert("COPY {}.{} FROM STDIN WITH (FORMAT CSV)".format(schema, table), data_iterator)
-        self.conn.commit()
-        data_iterator.close()
+        self.bulk_load_from_stream(get_data_stream(data), schema, table)
+
+    def bulk_load_from_stream(self, data_stream, schema, table, binary=False):
+        '''
+        Load a CSV or PGCOPY file-like object into Postgres DB, the stream is consumed and closed
+        :param data_stream: readable text or bytes stream
+        :param schema: target schema
+        :param table: target table
+        :param binary: data_stream is in PGCOPY binary format rather than CSV
+        :return:
+        '''
+        with self.connection():
+            self.cursor.copy_expert(
+                "COPY {}.{} FROM STDIN WITH (FORMAT {})".format(schema, table, get_copy_format(binary)), data_stream)
+            self.conn.commit()
+            data_stream.close()
 
     @transaction
     def upsert_from_df(self,
@@ -104,7 +350,9 @@ class PostgresClient:
                        table,
                        keys,
                        values,
-                       with_index=False):
+                       with_index=False,
+                       chunk_size=DEFAULT_COPY_CHUNK_SIZE,
+                       binary=False):
         '''
         Upsert Pandas DF into target table.
         :param df:
@@ -114,13 +362,17 @@ class PostgresClient:
         :param keys: Upsert Key column names list
         :param values: Upsert value names list
         :param with_index: Flag for using Pandas DF index or not
+        :param chunk_size: Number of rows encoded at a time while streaming to the server
+        :param binary: Use COPY FORMAT BINARY to populate the staging table
         :return:
         '''
-        df = rearrange_columns(df, table_schema)
-        data = df.to_csv(index=with_index, header=False)[:-1]  # remove last newline character
         size = len(df.index)
         self.logger.info("Initializing bulk upsert {} rows to {}.{}".format(size, db_schema, table))
-        self.upsert_from_string(data, table_schema, db_schema, table, keys, values)
+        if binary:
+            data_stream = get_binary_stream(df, table_schema, with_index, chunk_size)
+        else:
+            data_stream = get_csv_stream(rearrange_columns(df, table_schema), with_index, chunk_size)
+        self.upsert_from_stream(data_stream, table_schema, db_schema, table, keys, values, binary=binary)
 
     def upsert_from_string(self,
                            data: str,
@@ -129,20 +381,98 @@ class PostgresClient:
                            table,
                            keys,
                            values):
-        data_iterator = get_data_stream(data)
-        target_table_name = get_postgres_destination(db_schema, table)
-        staging_table_name = self.create_staging_table(table_schema, table)
-        query = upsert_query(
-            staging_table_name,
-            target_table_name,
-            selector_fields=keys,
-            setter_fields=values)
-        self.logger.info("Populating staging table: %s ..." % staging_table_name)
-        self.cursor.copy_from(data_iterator, staging_table_name, sep=',')
-        self.logger.info("Executing upsert query: %s ...: \n%s" % (staging_table_name, query))
-        self.cursor.execute(query)
-        self.cursor.execute('DROP TABLE %s' % staging_table_name)
-        self.conn.commit()
-        self.logger.info("Upsert successful!")
+        self.upsert_from_stream(get_data_stream(data), table_schema, db_schema, table, keys, values)
+
+    def upsert_from_stream(self,
+                           data_stream,
+                           table_schema: Schema,
+                           db_schema,
+                           table,
+                           keys,
+                           values,
+                           binary=False):
+        with self.connection():
+            target_table_name = get_postgres_destination(db_schema, table)
+            staging_table_name = self.create_staging_table(table_schema, table)
+            query = upsert_query(
+                staging_table_name,
+                target_table_name,
+                selector_fields=keys,
+                setter_fields=values)
+            self.logger.info("Populating staging table: %s ..." % staging_table_name)
+            self.cursor.copy_expert(
+                "COPY {} FROM STDIN WITH (FORMAT {})".format(staging_table_name, get_copy_format(binary)), data_stream)
+            self.logger.info("Executing upsert query: %s ...: \n%s" % (staging_table_name, query))
+            self.cursor.execute(query)
+            self.cursor.execute('DROP TABLE %s' % staging_table_name)
+            self.conn.commit()
+            self.logger.info("Upsert successful!")
+
+            data_stream.close()
+
+    @transaction
+    def merge_from_df(self,
+                      df: pd.DataFrame,
+                      table_schema: Schema,
+                      db_schema,
+                      table,
+                      keys,
+                      values,
+                      with_index=False,
+                      chunk_size=DEFAULT_COPY_CHUNK_SIZE,
+                      binary=False,
+                      skip_unchanged=True) -> UpsertResult:
+        '''
+        Upsert Pandas DF into target table with INSERT ... ON CONFLICT through a reused staging table.
+        The target table needs a unique constraint over the key columns.
+        :param df:
+        :param table_schema: Schema object
+        :param db_schema: Database schema name
+        :param table: Database table name
+        :param keys: Upsert Key column names list
+        :param values: Upsert value names list
+        :param with_index: Flag for using Pandas DF index or not
+        :param chunk_size: Number of rows encoded at a time while streaming to the server
+        :param binary: Use COPY FORMAT BINARY to populate the staging table
+        :param skip_unchanged: Leave rows whose value columns did not change untouched
+        :return: UpsertResult
+        '''
+        size = len(df.index)
+        self.logger.info("Initializing merge {} rows to {}.{}".format(size, db_schema, table))
+        if binary:
+            data_stream = get_binary_stream(df, table_schema, with_index, chunk_size)
+        else:
+            data_stream = get_csv_stream(rearrange_columns(df, table_schema), with_index, chunk_size)
+        return self.merge_from_stream(data_stream, table_schema, db_schema, table, keys, values,
+                                      binary=binary, skip_unchanged=skip_unchanged)
+
+    def merge_from_stream(self,
+                          data_stream,
+                          table_schema: Schema,
+                          db_schema,
+                          table,
+                          keys,
+                          values,
+                          binary=False,
+                          skip_unchanged=True) -> UpsertResult:
+        with self.connection():
+            target_table_name = get_postgres_destination(db_schema, table)
+            staging_table_name = self.prepare_persistent_staging_table(table_schema, table)
+            query = merge_query(
+                staging_table_name,
+                target_table_name,
+                selector_fields=keys,
+                setter_fields=values,
+                skip_unchanged=skip_unchanged)
+            self.logger.info("Populating staging table: %s ..." % staging_table_name)
+            self.cursor.copy_expert(
+                "COPY {} FROM STDIN WITH (FORMAT {})".format(staging_table_name, get_copy_format(binary)), data_stream)
+            self.logger.info("Executing merge query: %s ...: \n%s" % (staging_table_name, query))
+            self.cursor.execute(query)
+            staged, inserted, updated = self.cursor.fetchone()
+            self.conn.commit()
+            data_stream.close()
 
-        data_iterator.close()
+        result = UpsertResult(inserted=inserted, updated=updated, unchanged=staged - inserted - updated)
+        self.logger.info("Merge successful! %s" % result)
+        return result
@@ -50,4 +50,53 @@ def upsert_query(source_table_name, target_table_name, selector_fields, setter_f
         pk=','.join(selector_fields),
         where_t_pk_is_null=' AND '.join(["t.%s IS NULL" % x for x in selector_fields]),
         t_pk=','.join(["t.%s" % x for x in selector_fields]))
-    return dedent(statement).strip()
\ No newline at end of file
+    return dedent(statement).strip()
+
+
+def create_temp_table_if_not_exists_query(schema, staging_table_name):
+    schema_str = indent(schema.sql_string, '    ')
+    return '\n'.join([
+        dedent("""
+        CREATE TEMP TABLE IF NOT EXISTS {staging_table_name} (
+        """).strip().format(staging_table_name=staging_table_name),
+        schema_str,
+        ")"])
+
+
+def merge_query(source_table_name, target_table_name, selector_fields, setter_fields, skip_unchanged=True):
+    '''
+    INSERT ... ON CONFLICT upsert of source into target, returning one row of
+    (staged, inserted, updated) counts. Requires a unique constraint on selector_fields in target.
+    With skip_unchanged, rows whose value columns are all equal are not rewritten.
+    Staged rows repeating a key are reduced to the last one copied, since ON CONFLICT cannot
+    update the same target row twice in one statement, so staged counts distinct keys.
+    '''
+    if not setter_fields:
+        on_conflict = 'DO NOTHING'
+    else:
+        on_conflict = 'DO UPDATE\n    SET %s' % ',\n        '.join(["%s = EXCLUDED.%s" % (x, x) for x in setter_fields])
+        if skip_unchanged:
+            on_conflict += '\n    WHERE (%s) IS DISTINCT FROM (%s)' % (
+                ', '.join(['t.%s' % x for x in setter_fields]),
+                ', '.join(['EXCLUDED.%s' % x for x in setter_fields]))
+    sql_template = dedent("""
+            WITH upserted AS (
+                INSERT INTO %(target)s AS t (%(columns)s)
+                    SELECT DISTINCT ON (%(pk)s) %(columns)s
+                    FROM %(source)s
+                    ORDER BY %(pk)s, ctid DESC
+                ON CONFLICT (%(pk)s) %(on_conflict)s
+                RETURNING (xmax = 0) AS inserted
+            )
+            SELECT
+                (SELECT count(*) FROM (SELECT DISTINCT %(pk)s FROM %(source)s) AS staged_keys) AS staged,
+                count(*) FILTER (WHERE inserted) AS inserted,
+                count(*) FILTER (WHERE NOT inserted) AS updated
+            FROM upserted""")
+    statement = sql_template % dict(
+        target=target_table_name,
+        source=source_table_name,
+        columns=','.join(selector_fields + setter_fields),
+        pk=','.join(selector_fields),
+        on_conflict=indent(on_conflict, '    ').strip())
+    return dedent(statement).strip()
@@ -0,0 +1,48 @@
+import json
+from types import SimpleNamespace
+
+import pandas as pd
+
+from flows.datasources.polygon import MARKET_TZ
+
+
+class FakeAggregatesClient:
+    '''
+    Daily bars for every business day, starting from the first of the month like a monthly-aligned API
+    '''
+    def __init__(self):
+        self.requests = []
+
+    def stocks_equities_aggregates(self, symbol, multiplier, timespan, start, end, **kwargs):
+        self.requests.append((start, end))
+        days = pd.bdate_range(pd.Timestamp(start).replace(day=1), end)
+        results = [{'o': 1.0, 'h': 1.0, 'l': 1.0, 'c': 1.0, 'v': 100, 'vw': 1.0,
+                    't': pd.Timestamp(day, tz=MARKET_TZ).value // 10 ** 6} for day in days]
+        return SimpleNamespace(results=results)
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.status_code = 200
+        self.content = json.dumps(body).encode('utf-8')
+        self.text = self.content.decode('utf-8')
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    '''
+    Answers IEX batch requests with payloads[type] for every requested symbol and type
+    '''
+    def __init__(self, payloads=None):
+        self.payloads = payloads or {}
+        self.requests = []
+
+    def get(self, url, params=None):
+        self.requests.append((url, params))
+        types = params['types'].split(',')
+        return FakeResponse({symbol: {t: self.payloads.get(t) for t in types} for symbol in params['symbols'].split(',')})
+
+    def close(self):
+        pass
@@ -0,0 +1,63 @@
+import datetime as dt
+import json
+
+import pandas as pd
+
+from flows.datasources.fetcher import ETLFetcher
+from flows.datasources.sync_index import SymbolWatermarkIndex
+from flows.util.parquet_dataset import ParquetDataset
+from flows.util.storage import Storage
+from flows.util.trading_calendar import TradingCalendar
+
+
+def make_fetcher(root):
+    fetcher = ETLFetcher()
+    fetcher._storage = Storage(str(root))
+    fetcher._root_dir = fetcher._storage.root
+    fetcher._root_dir_is_gs = False
+    fetcher._watermarks = SymbolWatermarkIndex(fetcher._storage.url(ETLFetcher.WATERMARK_FILENAME))
+    return fetcher
+
+
+def make_response(date, close=300.0):
+    return json.dumps({'date': date, 'open': close, 'close': close, 'volume': 1000})
+
+
+def test_save_responses_keeps_equal_rows_on_different_dates(tmp_path):
+    fetcher = make_fetcher(tmp_path)
+
+    report = fetcher.save_responses_to_storage([
+        ('AAPL', make_response('2020-01-03')),
+        ('AAPL', make_response('2020-01-06')),
+        ('MSFT', make_response('2020-01-03', close=150.0)),
+    ])
+
+    rows = {path.split('/')[-3]: result['rows'] for path, result in report.items()}
+    assert rows == {'AAPL': 2, 'MSFT': 1}
+    assert all(result['success'] for result in report.values())
+    stored = ParquetDataset(fetcher._create_save_path('AAPL', '2020')).read()
+    assert sorted(stored.index) == list(pd.to_datetime(['2020-01-03', '2020-01-06']))
+    assert fetcher._watermarks.get('AAPL')[0] == dt.date(2020, 1, 6)
+
+
+def test_save_responses_keeps_latest_response_per_date(tmp_path):
+    fetcher = make_fetcher(tmp_path)
+
+    report = fetcher.save_responses_to_storage([
+        ('AAPL', make_response('2020-01-03', close=300.0)),
+        ('AAPL', make_response('2020-01-03', close=301.0)),
+    ])
+
+    assert [result['rows'] for result in report.values()] == [1]
+    stored = ParquetDataset(fetcher._create_save_path('AAPL', '2020')).read()
+    assert stored['close'].tolist() == [301.0]
+
+
+def test_initialize_works_without_the_trading_calendar(tmp_path, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise ConnectionError('IEX unavailable')
+    monkeypatch.setattr(TradingCalendar, 'from_iex', unavailable)
+    fetcher = ETLFetcher()
+
+    assert fetcher.initialize(str(tmp_path), iex_token='test-token')
+    assert fetcher._iex_client.calendar is None
@@ -0,0 +1,137 @@
+import gzip
+import json
+import queue
+import threading
+import time
+
+from flows.util.gcp.gcp_publisher_connection import GCPPublisherConnection, CONTENT_ENCODING_GZIP, CONTENT_TYPE_NDJSON
+
+
+class FakeFuture:
+    def __init__(self):
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._done = False
+        self._exception = None
+
+    def add_done_callback(self, callback):
+        with self._lock:
+            if not self._done:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def result(self):
+        if self._exception is not None:
+            raise self._exception
+        return 'message-id'
+
+    def complete(self, exception=None):
+        with self._lock:
+            self._exception = exception
+            self._done = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+class FakePublisherClient:
+    '''
+    Acknowledges messages in order on a worker thread, like the batcher's commit threads
+    :param fail_publish: publish call numbers that raise straight away
+    :param fail_future: publish call numbers whose future fails
+    '''
+    def __init__(self, fail_publish=(), fail_future=(), delay=0.001):
+        self.fail_publish = set(fail_publish)
+        self.fail_future = set(fail_future)
+        self.delay = delay
+        self.messages = []
+        self.outstanding = 0
+        self.max_outstanding = 0
+        self._lock = threading.Lock()
+        self._pending = queue.Queue()
+        threading.Thread(target=self._acknowledge, daemon=True).start()
+
+    def topic_path(self, project_id, topic_id):
+        return 'projects/{}/topics/{}'.format(project_id, topic_id)
+
+    def publish(self, topic, data, **attributes):
+        call = len(self.messages)
+        self.messages.append((data, attributes))
+        if call in self.fail_publish:
+            raise RuntimeError('publish {} rejected'.format(call))
+        future = FakeFuture()
+        with self._lock:
+            self.outstanding += 1
+            self.max_outstanding = max(self.max_outstanding, self.outstanding)
+        self._pending.put((call, future))
+        return future
+
+    def _acknowledge(self):
+        while True:
+            call, future = self._pending.get()
+            time.sleep(self.delay)
+            with self._lock:
+                self.outstanding -= 1
+            future.complete(RuntimeError('publish {} failed'.format(call)) if call in self.fail_future else None)
+
+
+def make_connection(client, max_outstanding=1000):
+    return GCPPublisherConnection('project', 'topic', max_outstanding=max_outstanding, client=client)
+
+
+def make_dicts(count):
+    return [{'symbol': 'S{}'.format(i), 'close': float(i)} for i in range(count)]
+
+
+def test_results_per_message_with_failures():
+    client = FakePublisherClient(fail_publish=[1], fail_future=[3])
+
+    results = make_connection(client).publish_messages(make_dicts(5))
+
+    assert results == [True, False, True, False, True]
+    assert [json.loads(data) for data, _ in client.messages] == make_dicts(5)
+
+
+def test_max_outstanding_applies_back_pressure():
+    client = FakePublisherClient()
+
+    results = make_connection(client, max_outstanding=2).publish_messages(make_dicts(20))
+
+    assert results == [True] * 20
+    assert client.max_outstanding == 2
+    assert client.outstanding == 0
+
+
+def test_gzip_payloads():
+    client = FakePublisherClient()
+
+    assert make_connection(client).publish_messages(make_dicts(2), compress=True) == [True, True]
+
+    data, attributes = client.messages[0]
+    assert attributes == {'content_encoding': CONTENT_ENCODING_GZIP}
+    assert json.loads(gzip.decompress(data)) == make_dicts(1)[0]
+
+
+def test_ndjson_payloads_map_results_back_to_each_dict():
+    client = FakePublisherClient(fail_future=[2])
+
+    # 3 messages of 2 dicts and a final partial one, the third message fails
+    results = make_connection(client).publish_messages(make_dicts(7), compress=True, ndjson_batch_size=2)
+
+    assert results == [True, True, True, True, False, False, True]
+    assert len(client.messages) == 4
+    data, attributes = client.messages[3]
+    assert attributes == {'content_encoding': CONTENT_ENCODING_GZIP, 'content_type': CONTENT_TYPE_NDJSON}
+    assert [json.loads(line) for line in gzip.decompress(data).decode('utf-8').split('\n')] == make_dicts(7)[6:]
+    first = client.messages[0][0]
+    assert [json.loads(line) for line in gzip.decompress(first).decode('utf-8').split('\n')] == make_dicts(2)
+
+
+def test_ndjson_partial_batch_after_a_rejected_publish():
+    client = FakePublisherClient(fail_publish=[2])
+
+    results = make_connection(client).publish_messages(make_dicts(5), ndjson_batch_size=2)
+
+    assert results == [True, True, True, True, False]
+    assert client.messages[2][0].decode('utf-8') == json.dumps(make_dicts(5)[4])
@@ -0,0 +1,52 @@
+from flows.util.gcp.gcp_storage_index import GCPStorageIndex
+
+
+class FakeConnection:
+    def __init__(self, names):
+        self.names = set(names)
+        self.exists_calls = 0
+        self.list_calls = 0
+
+    def list_objects_sharded(self, bucket, prefix, max_workers=8):
+        self.list_calls += 1
+        return [name for name in self.names if name.startswith(prefix)]
+
+    def blob_exists(self, bucket, blob_name):
+        self.exists_calls += 1
+        return blob_name in self.names
+
+
+def test_stale_miss_is_confirmed_with_a_request():
+    connection = FakeConnection(['prices/AAPL/2020/data.parquet'])
+    index = GCPStorageIndex('bucket', 'prices', ttl_seconds=None, connection=connection)
+    assert index.exists('gs://bucket/prices/AAPL/2020/data.parquet')
+
+    # Written by another worker after the listing
+    connection.names.add('prices/MSFT/2020/data.parquet')
+
+    assert not index.exists('gs://bucket/prices/MSFT/2020/data.parquet')
+    assert index.exists('gs://bucket/prices/MSFT/2020/data.parquet', confirm_missing=True)
+    assert index.exists('gs://bucket/prices/MSFT/2020/data.parquet')
+    assert not index.exists('gs://bucket/prices/TSLA/2020/data.parquet', confirm_missing=True)
+    assert connection.exists_calls == 2
+
+
+class InvalidatedIndex(GCPStorageIndex):
+    '''
+    Invalidated by another thread right after its first listing
+    '''
+    def refresh(self):
+        super().refresh()
+        if self.connection.list_calls == 1:
+            self.invalidate()
+
+
+def test_invalidate_between_refresh_and_lookup():
+    names = ['prices/AAPL/2020/data.parquet', 'prices/MSFT/2020/data.parquet']
+    connection = FakeConnection(names)
+    assert InvalidatedIndex('bucket', 'prices', connection=connection).exists('prices/AAPL/2020/data.parquet')
+    assert connection.list_calls == 2
+
+    connection = FakeConnection(names)
+    assert InvalidatedIndex('bucket', 'prices', connection=connection).list('prices/MSFT') == names[1:]
+    assert connection.list_calls == 2
@@ -0,0 +1,53 @@
+import datetime as dt
+import math
+
+import pytest
+
+from flows.datasources.iex import IEXClient, BATCH_SYMBOL_LIMIT
+from flows.tests.fakes import FakeSession
+
+PREVIOUS = {'date': '2020-01-02', 'symbol': 'AAPL', 'open': 1.0, 'close': 1.0, 'high': 1.0, 'low': 1.0,
+            'volume': 100, 'uOpen': 1.0, 'uClose': 1.0, 'uHigh': 1.0, 'uLow': 1.0, 'uVolume': 100}
+SPLIT = {'declaredDate': '2020-01-02', 'description': '2-for-1', 'exDate': '2020-01-10', 'fromFactor': 1,
+         'refid': 1, 'symbol': 'AAPL', 'toFactor': 2, 'id': 'SPLITS', 'key': 'AAPL', 'subkey': '1',
+         'updated': 1577923200000}
+
+
+def make_client(session):
+    client = IEXClient(token_value='test-token')
+    client.session = session
+    return client
+
+
+@pytest.mark.parametrize('count', [1, BATCH_SYMBOL_LIMIT, BATCH_SYMBOL_LIMIT + 1, 250])
+def test_batch_json_costs_one_request_per_hundred_symbols(count):
+    symbols = ['S{}'.format(i) for i in range(count)]
+    session = FakeSession({'previous': PREVIOUS})
+
+    results = make_client(session).get_batch_json(symbols, types=['previous'])
+
+    assert len(session.requests) == math.ceil(count / BATCH_SYMBOL_LIMIT)
+    assert all(len(params['symbols'].split(',')) <= BATCH_SYMBOL_LIMIT for _, params in session.requests)
+    assert sorted(results) == sorted(symbols)
+
+
+def test_batch_parses_every_type_per_symbol():
+    symbols = ['S{}'.format(i) for i in range(150)]
+    session = FakeSession({'previous': PREVIOUS, 'splits': [SPLIT], 'dividends': []})
+
+    results = make_client(session).get_batch(symbols)
+
+    assert len(session.requests) == 2
+    assert session.requests[0][1]['types'] == 'previous,splits,dividends'
+    assert len(results) == 150
+    result = results['S149']
+    assert result['previous'].date == dt.date(2020, 1, 2)
+    assert result['splits'].get_count() == 1
+    assert result['splits'].get_split(0).ratio == 0.5
+    assert result['dividends'].get_count() == 0
+
+
+def test_batch_without_previous_data():
+    results = make_client(FakeSession()).get_batch(['AAPL'], types=['previous'])
+
+    assert results == {'AAPL': {'previous': None}}
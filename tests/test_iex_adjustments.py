@@ -0,0 +1,122 @@
+import datetime as dt
+
+import numpy as np
+
+from flows.datasources.iex_adjustments import IEXAdjustmentEngine
+from flows.datasources.iex_daily_price import IEXDailyPrice
+from flows.datasources.iex_daily_prices import IEXDailyPrices
+from flows.datasources.iex_dividend import IEXDividend
+from flows.datasources.iex_dividends import IEXDividends
+from flows.datasources.iex_split import IEXSplit
+from flows.datasources.iex_splits import IEXSplits
+
+START = dt.date(2020, 1, 1)
+
+
+def day(offset):
+    return START + dt.timedelta(days=offset)
+
+
+def make_prices(count=10):
+    prices = IEXDailyPrices()
+    for i in range(count):
+        # Multiples of 0.08 stay exact under the 1/2 and 1/4 splits below, so per-split rounding
+        # of the baseline loop and the single rounding of the engine agree
+        price = 80.0 + 8 * i
+        prices.add_daily_price(IEXDailyPrice(
+            date=day(i), date_last_adjusted=day(i), symbol='AAPL', open=price, close=price + 8, high=price + 16,
+            low=price - 8, volume=1000 + i, unadjusted_open=price, unadjusted_close=price + 8,
+            unadjusted_high=price + 16, unadjusted_low=price - 8, unadjusted_volume=1000 + i))
+    return prices
+
+
+def make_splits(*splits):
+    collection = IEXSplits()
+    for i, (execution_date, from_factor, to_factor) in enumerate(splits):
+        collection.add_split_if_not_exist(IEXSplit(execution_date=execution_date, from_factor=from_factor,
+                                                   to_factor=to_factor, key='AAPL', subkey=str(i)))
+    return collection
+
+
+def baseline_adjust(prices, splits):
+    '''
+    The per-row, per-split loop the engine replaced
+    '''
+    data = prices.data
+    for i in range(splits.get_count()):
+        split = splits.get_split(i)
+        for daily_price in data:
+            daily_price.apply_split(split.ratio, split.execution_date)
+    return data
+
+
+def test_split_factors_are_cumulative():
+    engine = IEXAdjustmentEngine(split_dates=[day(7), day(3)], split_ratios=[0.25, 0.5])
+    dates = np.array([day(i) for i in range(10)], dtype='datetime64[D]')
+
+    factors = engine.split_factors(dates)
+
+    # Rows on a split's execution date already trade at the new price
+    assert factors.tolist() == [0.125] * 3 + [0.25] * 4 + [1.0] * 3
+
+
+def test_reverse_split_volume_is_not_truncated():
+    prices = make_prices(3)
+    # 4 shares become 1, int(1 / 4) used to turn the volume into 0
+    prices.apply_splits(make_splits((day(2), 4, 1)))
+
+    assert prices.columns['volume'].tolist() == [250, 250, 1002]
+    assert prices.columns['close'].tolist() == [352.0, 384.0, 104.0]
+
+
+def test_second_run_is_a_no_op():
+    splits = make_splits((day(3), 1, 2), (day(7), 1, 4))
+    prices = make_prices()
+    prices.apply_splits(splits)
+    adjusted_once = prices.to_dict()
+
+    prices.apply_splits(splits)
+
+    assert prices.to_dict() == adjusted_once
+    assert prices.columns['date_last_adjusted'][:7].tolist() == [day(7)] * 7
+
+
+def test_dividend_factors():
+    dividends = IEXDividends()
+    dividends.add_dividend_if_not_exist(IEXDividend(amount=1.0, execution_date=day(2), key='AAPL', subkey='1'))
+    dividends.add_dividend_if_not_exist(IEXDividend(amount=2.0, execution_date=day(4), key='AAPL', subkey='2'))
+    engine = IEXAdjustmentEngine.from_corporate_actions(dividends=dividends)
+    dates = np.array([day(i) for i in range(5)], dtype='datetime64[D]')
+
+    # Each dividend is scaled by the last close before its ex date
+    factors = engine.dividend_factors(dates, np.array([100.0, 100.0, 200.0, 100.0, 100.0]))
+
+    np.testing.assert_allclose(factors, [0.99 * 0.98, 0.99 * 0.98, 0.98, 0.98, 1.0])
+
+
+def test_apply_matches_baseline_loop():
+    splits = make_splits((day(3), 1, 2), (day(7), 1, 4))
+    prices = make_prices()
+    expected = baseline_adjust(make_prices(), splits)
+
+    prices.apply_splits(splits)
+
+    for price, baseline in zip(prices.data, expected):
+        assert price.to_dict() == baseline.to_dict()
+
+
+def test_adjust_matches_baseline_loop_and_keeps_unadjusted():
+    splits = make_splits((day(3), 1, 2), (day(7), 1, 4))
+    prices = make_prices()
+    unadjusted = prices.to_dict()
+    expected = baseline_adjust(make_prices(), splits)
+
+    df = IEXAdjustmentEngine.from_corporate_actions(splits=splits).adjust(prices, include_dividends=False)
+
+    assert df['adj_close'].tolist() == [price.close for price in expected]
+    assert df['adj_open'].tolist() == [price.open for price in expected]
+    assert df['adj_volume'].tolist() == [price.volume for price in expected]
+    assert df['close'].tolist() == [row['uClose'] for row in unadjusted]
+    assert df['volume'].tolist() == [row['uVolume'] for row in unadjusted]
+    # adjust() leaves the store untouched
+    assert prices.to_dict() == unadjusted
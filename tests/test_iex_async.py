@@ -0,0 +1,156 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from flows.datasources import iex_async
+from flows.datasources.iex_async import AsyncIEXClient, TokenBucket, parse_retry_after
+
+
+class FakeIEXServer:
+    '''
+    Answers stock/{symbol}/previous depending on the symbol:
+    SLOW after a delay, HANG only after the test is over, FAIL with 404, DOWN always with 503,
+    LIMIT with 429 and a Retry-After on the first call. Every other symbol succeeds straight away.
+    '''
+    def __init__(self, retry_after='0.2'):
+        self.retry_after = retry_after
+        self.requests = []
+        app = web.Application()
+        app.router.add_get('/stock/{symbol}/previous', self.previous)
+        self.server = TestServer(app)
+
+    @property
+    def base_url(self):
+        return str(self.server.make_url('')).rstrip('/')
+
+    def calls(self, symbol):
+        return [at for requested, at in self.requests if requested == symbol]
+
+    async def previous(self, request):
+        symbol = request.match_info['symbol']
+        self.requests.append((symbol, time.monotonic()))
+        if symbol == 'SLOW':
+            await asyncio.sleep(0.2)
+        elif symbol == 'HANG':
+            await asyncio.sleep(0.5)
+        elif symbol == 'FAIL':
+            return web.Response(status=404)
+        elif symbol == 'DOWN':
+            return web.Response(status=503)
+        elif symbol == 'LIMIT' and len(self.calls(symbol)) == 1:
+            return web.Response(status=429, headers={'Retry-After': self.retry_after})
+        return web.Response(text='{{"symbol": "{}"}}'.format(symbol))
+
+
+def run(monkeypatch, test, **client_kwargs):
+    '''
+    Run test(client, server) against a local FakeIEXServer
+    '''
+    async def main():
+        server = FakeIEXServer()
+        await server.server.start_server()
+        monkeypatch.setattr(iex_async, 'BASE_URL', server.base_url)
+        try:
+            async with AsyncIEXClient(token_value='test-token', **client_kwargs) as client:
+                return await test(client, server)
+        finally:
+            await server.server.close()
+    return asyncio.run(main())
+
+
+def test_token_bucket_allows_bursts_then_throttles():
+    async def acquire(bucket, count):
+        start_time = time.monotonic()
+        for _ in range(count):
+            await bucket.acquire()
+        return time.monotonic() - start_time
+
+    bucket = TokenBucket(rate=50, capacity=5)
+
+    assert asyncio.run(acquire(bucket, 5)) < 0.05
+    # The bucket is empty, 10 more tokens take 10 / 50 seconds
+    assert asyncio.run(acquire(bucket, 10)) >= 0.18
+
+
+def test_token_bucket_pause():
+    async def acquire_after_pause():
+        bucket = TokenBucket(rate=100)
+        bucket.pause(0.2)
+        start_time = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - start_time
+
+    assert asyncio.run(acquire_after_pause()) >= 0.19
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('2') == 2.0
+    assert parse_retry_after('-1') == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 28 <= parse_retry_after(format_datetime(retry_at, usegmt=True)) <= 30
+    assert parse_retry_after(format_datetime(retry_at - timedelta(minutes=5), usegmt=True)) == 0.0
+
+
+def test_429_pauses_later_requests(monkeypatch):
+    async def test(client, server):
+        limited = asyncio.ensure_future(client.get_daily_price('LIMIT'))
+        while not server.calls('LIMIT'):
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        assert await client.get_daily_price('AAPL') == '{"symbol": "AAPL"}'
+        assert await limited == '{"symbol": "LIMIT"}'
+        return server.calls('LIMIT')[0], server.calls('AAPL')[0]
+
+    limited_at, other_at = run(monkeypatch, test)
+
+    # AAPL was requested after the 429 but had to wait out the Retry-After as well
+    assert other_at - limited_at >= 0.18
+
+
+def test_retries_stop_at_max_retries(monkeypatch):
+    async def test(client, server):
+        with pytest.raises(aiohttp.ClientResponseError) as error:
+            await client.get_daily_price('DOWN')
+        assert error.value.status == 503
+        return len(server.calls('DOWN'))
+
+    assert run(monkeypatch, test, max_retries=2, backoff_seconds=0.01) == 3
+
+
+def test_get_many_yields_in_completion_order_with_errors(monkeypatch):
+    async def test(client, server):
+        return [result async for result in client.get_many(['SLOW', 'AAPL', 'FAIL'], 'get_daily_price')]
+
+    results = run(monkeypatch, test)
+
+    assert [symbol for symbol, _, _ in results][-1] == 'SLOW'
+    by_symbol = {symbol: (text, error) for symbol, text, error in results}
+    assert by_symbol['AAPL'] == ('{"symbol": "AAPL"}', None)
+    assert by_symbol['SLOW'] == ('{"symbol": "SLOW"}', None)
+    text, error = by_symbol['FAIL']
+    assert text is None and error.status == 404
+
+
+def test_closing_get_many_cancels_pending_requests(monkeypatch):
+    async def test(client, server):
+        results = client.get_many(['AAPL', 'HANG', 'HANG'], 'get_daily_price')
+        first = await results.__anext__()
+        await results.aclose()
+        await asyncio.sleep(0.05)
+        pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()
+                   and 'fetch' in repr(task.get_coro())]
+        return first, pending, client._semaphore._value
+
+    first, pending, free_slots = run(monkeypatch, test, max_in_flight=4)
+
+    assert first == ('AAPL', '{"symbol": "AAPL"}', None)
+    assert pending == []
+    assert free_slots == 4
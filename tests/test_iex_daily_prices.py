@@ -0,0 +1,101 @@
+import datetime as dt
+
+import pandas as pd
+import pytest
+
+from flows.datasources.iex_daily_price import IEXDailyPrice
+from flows.datasources.iex_daily_prices import IEXDailyPrices
+from flows.util.dataframe_util import parse_dated_dataframe
+from flows.util.parquet_dataset import ParquetDataset
+
+
+def make_records(count, symbol='AAPL'):
+    start = dt.date(2020, 1, 1)
+    records = []
+    for i in range(count):
+        price = 100.0 + i
+        records.append({'date': (start + dt.timedelta(days=i)).isoformat(), 'symbol': symbol,
+                        'open': price, 'close': price + 0.5, 'high': price + 1, 'low': price - 1, 'volume': 1000 + i,
+                        'uOpen': price * 2, 'uClose': price * 2 + 1, 'uHigh': price * 2 + 2, 'uLow': price * 2 - 2,
+                        'uVolume': 500 + i})
+    return records
+
+
+def make_prices(count, symbol='AAPL'):
+    prices = IEXDailyPrices()
+    assert prices.initialize_from_dict(make_records(count, symbol))
+    return prices
+
+
+def test_dataframe_round_trip():
+    prices = make_prices(5)
+
+    copy = IEXDailyPrices()
+    assert copy.from_dataframe(prices.to_dataframe())
+
+    assert copy == prices
+
+
+def test_arrow_round_trip():
+    prices = make_prices(5)
+
+    copy = IEXDailyPrices()
+    assert copy.from_arrow(prices.to_arrow())
+
+    assert copy == prices
+    assert copy.to_dict() == prices.to_dict()
+
+
+def test_parquet_round_trip(tmp_path):
+    prices = make_prices(5)
+    path = str(tmp_path / 'AAPL' / '2020.parquet')
+    prices.to_parquet(path)
+
+    copy = IEXDailyPrices()
+    assert copy.from_parquet(path)
+
+    assert copy == prices
+
+
+def test_from_parquet_merges_fetcher_deltas(tmp_path):
+    records = make_records(3)
+    # Date indexed partition with a delta file, the way the fetcher appends responses
+    dataset = ParquetDataset(str(tmp_path / 'AAPL' / '2020' / 'data.parquet'))
+    dataset.append(parse_dated_dataframe(pd.DataFrame(records[:2])))
+    dataset.append(parse_dated_dataframe(pd.DataFrame([dict(records[1], close=200.0), records[2]])))
+
+    prices = IEXDailyPrices()
+    assert prices.from_parquet(dataset.base_path)
+
+    closes = {price.date: price.close for price in prices.data}
+    assert closes == {dt.date(2020, 1, 1): 100.5, dt.date(2020, 1, 2): 200.0, dt.date(2020, 1, 3): 102.5}
+
+
+def test_eq_compares_every_column():
+    prices = make_prices(3)
+
+    assert prices == make_prices(3)
+    assert prices != make_prices(4)
+    assert prices != make_prices(3, symbol='MSFT')
+    assert prices != prices.to_dict()
+
+
+def test_add_daily_price_grows_past_capacity():
+    prices = IEXDailyPrices()
+    for i in range(40):
+        prices.add_daily_price(IEXDailyPrice(date=dt.date(2020, 1, 1) + dt.timedelta(days=i), symbol='AAPL',
+                                             close=float(i), volume=i))
+
+    assert prices.get_count() == 40
+    assert [price.close for price in prices.data] == [float(i) for i in range(40)]
+    assert prices.get_daily_price(39).date == dt.date(2020, 2, 9)
+
+
+def test_negative_and_out_of_range_indices():
+    prices = make_prices(3)
+
+    assert prices.get_daily_price(-1).date == dt.date(2020, 1, 3)
+    assert prices.get_daily_price(-3).date == dt.date(2020, 1, 1)
+    assert prices.get_daily_price(3) is None
+    with pytest.raises(IndexError):
+        prices.get_daily_price(-4)
@@ -0,0 +1,57 @@
+import datetime as dt
+
+from flows.datasources.iex_dividend import IEXDividend
+from flows.datasources.iex_dividends import IEXDividends
+
+
+def make_dividend(execution_date, subkey, amount=0.5, date=dt.datetime(2020, 1, 1)):
+    return IEXDividend(amount=amount, execution_date=execution_date, symbol='AAPL', key='AAPL', subkey=subkey,
+                       date=date)
+
+
+def make_dividends(*dividends):
+    collection = IEXDividends()
+    for dividend in dividends:
+        collection.add_dividend_if_not_exist(dividend)
+    return collection
+
+
+def execution_dates(dividends: IEXDividends):
+    return [dividends.get_dividend(i).execution_date for i in range(dividends.get_count())]
+
+
+def test_duplicates_are_detected_by_key_and_subkey():
+    dividends = make_dividends(make_dividend(dt.date(2020, 2, 7), '1'))
+
+    assert dividends.contains_dividend(make_dividend(dt.date(2020, 2, 7), '1', amount=0.77))
+    assert not dividends.add_dividend_if_not_exist(make_dividend(dt.date(2020, 2, 7), '1'))
+    assert dividends.add_dividend_if_not_exist(make_dividend(dt.date(2020, 2, 7), '2'))
+    assert dividends.get_count() == 2
+
+
+def test_dividends_are_ordered_by_ex_date():
+    # Announcement dates in the opposite order of the ex dates, they used to decide the order
+    dividends = make_dividends(make_dividend(dt.date(2020, 5, 8), '2', date=dt.datetime(2020, 1, 1)),
+                               make_dividend(dt.date(2020, 2, 7), '1', date=dt.datetime(2020, 4, 30)))
+
+    assert execution_dates(dividends) == [dt.date(2020, 2, 7), dt.date(2020, 5, 8)]
+
+
+def test_merge_interleaves_and_skips_duplicates():
+    dividends = make_dividends(make_dividend(dt.date(2020, 2, 7), '1'), make_dividend(dt.date(2020, 8, 7), '3'))
+    other = make_dividends(make_dividend(dt.date(2020, 5, 8), '2'), make_dividend(dt.date(2020, 8, 7), '3'),
+                           make_dividend(dt.date(2020, 11, 6), '4'))
+
+    assert dividends.merge(other) == 2
+    assert execution_dates(dividends) == [dt.date(2020, 2, 7), dt.date(2020, 5, 8), dt.date(2020, 8, 7),
+                                          dt.date(2020, 11, 6)]
+    assert dividends.merge(other) == 0
+
+
+def test_get_dividends_between_is_inclusive():
+    dividends = make_dividends(*[make_dividend(dt.date(2020, month, 1), str(month)) for month in range(1, 7)])
+
+    between = dividends.get_dividends_between(dt.date(2020, 2, 1), dt.date(2020, 4, 1))
+
+    assert [dividend.subkey for dividend in between] == ['2', '3', '4']
+    assert dividends.get_dividends_between(dt.date(2020, 2, 2), dt.date(2020, 2, 28)) == []
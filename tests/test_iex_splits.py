@@ -0,0 +1,59 @@
+import datetime as dt
+
+from flows.datasources.iex_split import IEXSplit
+from flows.datasources.iex_splits import IEXSplits
+
+
+def make_split(execution_date, subkey, to_factor=2):
+    return IEXSplit(execution_date=execution_date, to_factor=to_factor, symbol='AAPL', key='AAPL', subkey=subkey)
+
+
+def make_splits(*splits):
+    collection = IEXSplits()
+    for split in splits:
+        collection.add_split_if_not_exist(split)
+    return collection
+
+
+def execution_dates(splits: IEXSplits):
+    return [splits.get_split(i).execution_date for i in range(splits.get_count())]
+
+
+def test_duplicates_are_detected_by_key_and_subkey():
+    splits = make_splits(make_split(dt.date(2020, 8, 31), '1'))
+
+    assert splits.contains_split(make_split(dt.date(2020, 8, 31), '1', to_factor=4))
+    assert not splits.add_split_if_not_exist(make_split(dt.date(2020, 8, 31), '1'))
+    assert splits.add_split_if_not_exist(make_split(dt.date(2020, 8, 31), '2'))
+    assert splits.get_count() == 2
+
+
+def test_add_keeps_execution_date_order():
+    splits = make_splits(make_split(dt.date(2020, 8, 31), '3'), make_split(dt.date(2014, 6, 9), '1'),
+                         make_split(dt.date(2015, 1, 2), '2'))
+
+    assert execution_dates(splits) == [dt.date(2014, 6, 9), dt.date(2015, 1, 2), dt.date(2020, 8, 31)]
+
+
+def test_merge_interleaves_and_skips_duplicates():
+    splits = make_splits(make_split(dt.date(2014, 6, 9), '1'), make_split(dt.date(2020, 8, 31), '3'))
+    other = make_splits(make_split(dt.date(2015, 1, 2), '2'), make_split(dt.date(2020, 8, 31), '3'),
+                        make_split(dt.date(2021, 1, 4), '4'))
+
+    assert splits.merge(other) == 2
+    assert execution_dates(splits) == [dt.date(2014, 6, 9), dt.date(2015, 1, 2), dt.date(2020, 8, 31),
+                                       dt.date(2021, 1, 4)]
+    assert splits.merge(other) == 0
+    # Inserts after a merge still land in order
+    assert splits.add_split_if_not_exist(make_split(dt.date(2016, 1, 4), '5'))
+    assert execution_dates(splits)[2] == dt.date(2016, 1, 4)
+
+
+def test_get_splits_between_is_inclusive():
+    splits = make_splits(*[make_split(dt.date(2020, month, 1), str(month)) for month in range(1, 7)])
+
+    between = splits.get_splits_between(dt.date(2020, 2, 1), dt.date(2020, 4, 1))
+
+    assert [split.subkey for split in between] == ['2', '3', '4']
+    assert splits.get_splits_between(dt.date(2020, 2, 2), dt.date(2020, 2, 28)) == []
+    assert len(splits.get_splits_between(dt.date(2019, 1, 1), dt.date(2021, 1, 1))) == 6
@@ -0,0 +1,45 @@
+import pandas as pd
+
+from flows.util.parquet_dataset import ParquetDataset
+from flows.util.parquet_util import ParquetUtil
+
+
+def make_frame(dates, close=100.0, volume=1000):
+    return pd.DataFrame({'close': close, 'volume': volume},
+                        index=pd.DatetimeIndex(pd.to_datetime(dates), name='date'))
+
+
+def test_read_projected_columns_across_base_and_delta(tmp_path):
+    dataset = ParquetDataset(str(tmp_path / 'AAPL' / '2020' / 'data.parquet'))
+    dataset.append(make_frame(['2020-01-02', '2020-01-03']))
+    # Same values as the base on a new date, and a correction of an existing date
+    dataset.append(make_frame(['2020-01-06']))
+    dataset.append(make_frame(['2020-01-03'], close=101.0))
+
+    df = dataset.read(columns=['close'])
+
+    assert sorted(df.index) == list(pd.to_datetime(['2020-01-02', '2020-01-03', '2020-01-06']))
+    assert df.loc['2020-01-03', 'close'] == 101.0
+
+
+def test_compact_keeps_rows_with_equal_values(tmp_path):
+    dataset = ParquetDataset(str(tmp_path / 'data.parquet'))
+    dataset.append(make_frame(['2020-01-02', '2020-01-03']))
+    dataset.append(make_frame(['2020-01-06']))
+
+    assert dataset.compact() == 1
+    assert dataset.delta_paths() == []
+    assert len(dataset.read().index) == 3
+
+
+def test_read_parquet_merges_delta_files(tmp_path):
+    path = str(tmp_path / 'data.parquet')
+    dataset = ParquetDataset(path)
+    dataset.append(make_frame(['2020-01-02', '2020-01-03']))
+    dataset.append(make_frame(['2020-01-03', '2020-01-06'], close=101.0))
+
+    df = ParquetUtil.read_parquet(path, columns=['close'])
+
+    assert sorted(df.index) == list(pd.to_datetime(['2020-01-02', '2020-01-03', '2020-01-06']))
+    assert df.loc['2020-01-03', 'close'] == 101.0
+    assert list(df.columns) == ['close']
@@ -0,0 +1,48 @@
+import pandas as pd
+
+from flows.util.calendar_util import DateTimeRange
+from flows.util.parquet_dataset import ParquetDataset
+from flows.util.parquet_reader import PartitionedParquetReader
+
+
+def make_frame(dates, close=100.0, volume=1000):
+    return pd.DataFrame({'close': close, 'volume': volume},
+                        index=pd.DatetimeIndex(pd.to_datetime(dates), name='date'))
+
+
+def write_partition(root, symbol, year, frames):
+    dataset = ParquetDataset(str(root / symbol / year / 'data.parquet'))
+    for frame in frames:
+        dataset.append(frame)
+
+
+def test_read_symbol_projects_columns_over_deltas(tmp_path):
+    base_dates = pd.bdate_range('2020-01-01', '2020-06-30')
+    delta_dates = pd.bdate_range('2020-07-01', '2020-07-31')
+    # Constant values, so every projected row is equal apart from its date
+    write_partition(tmp_path, 'AAPL', '2020', [
+        make_frame(base_dates),
+        make_frame(delta_dates),
+        make_frame(delta_dates[:1], close=101.0),
+    ])
+
+    df = PartitionedParquetReader(str(tmp_path)).read_symbol('AAPL', columns=['close'])
+
+    assert len(df.index) == len(base_dates) + len(delta_dates)
+    assert not df.index.duplicated().any()
+    assert df.loc[delta_dates[0], 'close'] == 101.0
+    assert set(df['symbol']) == {'AAPL'}
+
+
+def test_read_symbol_with_date_range_and_date_column(tmp_path):
+    dates = pd.bdate_range('2020-01-01', '2020-03-31')
+    base = make_frame(dates).reset_index()
+    delta = make_frame(dates[-5:]).reset_index()
+    dataset = ParquetDataset(str(tmp_path / 'MSFT' / '2020' / 'data.parquet'))
+    dataset.append(base, index=False)
+    dataset.append(delta, index=False)
+
+    date_range = DateTimeRange(pd.Timestamp('2020-03-01'), pd.Timestamp('2020-03-01'))
+    df = PartitionedParquetReader(str(tmp_path)).read_symbol('MSFT', date_range, columns=['close'])
+
+    assert len(df.index) == len([date for date in dates if date.month == 3])
@@ -0,0 +1,111 @@
+import time
+
+import pandas as pd
+import pytest
+
+from flows.pipeline.base import TickerProvider, DataProvider
+from flows.pipeline.loaders import PostgresDataLoader
+from flows.pipeline.runner import PipelineRunner
+
+
+class FakePostgresClient:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.upserts = []
+
+    def upsert_from_df(self, df, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('connection lost')
+        self.upserts.append(df)
+
+
+class ListTickerProvider(TickerProvider):
+    def __init__(self, tickers):
+        self.tickers = tickers
+
+    def get_tickers(self):
+        return list(self.tickers)
+
+
+class FrameProvider(DataProvider):
+    def get_dataframe(self, ticker=None, **kwargs):
+        return pd.DataFrame({'symbol': [ticker], 'close': [1.0]})
+
+
+def make_loader(client, **batching):
+    context = {
+        PostgresDataLoader.TABLE_SCHEMA: None,
+        PostgresDataLoader.DB_SCHEMA: 'public',
+        PostgresDataLoader.TABLE: 'prices',
+        PostgresDataLoader.KEYS: ['symbol'],
+        PostgresDataLoader.VALUES: ['close'],
+    }
+    context.update(batching)
+    return PostgresDataLoader(context, client=client)
+
+
+def frame(symbol):
+    return pd.DataFrame({'symbol': [symbol], 'close': [1.0]})
+
+
+def test_failed_flush_keeps_the_buffer():
+    client = FakePostgresClient(failures=1)
+    loader = make_loader(client, **{PostgresDataLoader.BATCH_MAX_ROWS: 10})
+    loader.load(frame('AAPL'))
+    loader.load(frame('MSFT'))
+
+    with pytest.raises(RuntimeError):
+        loader.flush()
+    assert loader.has_pending_data()
+
+    loader.flush()
+    assert sorted(client.upserts[0]['symbol']) == ['AAPL', 'MSFT']
+    assert not loader.has_pending_data()
+
+
+def test_failed_load_drops_only_its_own_frame():
+    client = FakePostgresClient(failures=1)
+    loader = make_loader(client, **{PostgresDataLoader.BATCH_MAX_ROWS: 2})
+    loader.load(frame('AAPL'))
+
+    with pytest.raises(RuntimeError):
+        loader.load(frame('MSFT'))
+
+    loader.flush()
+    assert client.upserts[0]['symbol'].tolist() == ['AAPL']
+
+
+def test_flush_if_due_applies_the_time_limit():
+    client = FakePostgresClient()
+    loader = make_loader(client, **{PostgresDataLoader.BATCH_MAX_SECONDS: 0.05})
+    loader.load(frame('AAPL'))
+    loader.flush_if_due()
+    assert loader.has_pending_data()
+
+    time.sleep(0.06)
+    loader.flush_if_due()
+    assert not loader.has_pending_data()
+    assert len(client.upserts) == 1
+
+
+def test_runner_reports_buffered_tickers_failed_when_the_flush_fails():
+    client = FakePostgresClient(failures=1)
+    loader = make_loader(client, **{PostgresDataLoader.BATCH_MAX_ROWS: 100})
+
+    summary = PipelineRunner(ListTickerProvider(['AAPL', 'MSFT']), FrameProvider(), loader).run()
+
+    assert summary.loaded_tickers == []
+    assert sorted(summary.failures) == ['AAPL', 'MSFT']
+    assert summary.stages['load'].failed == 2
+
+
+def test_runner_reports_buffered_tickers_loaded_after_the_flush():
+    client = FakePostgresClient()
+    loader = make_loader(client, **{PostgresDataLoader.BATCH_MAX_ROWS: 100})
+
+    summary = PipelineRunner(ListTickerProvider(['AAPL', 'MSFT']), FrameProvider(), loader).run()
+
+    assert sorted(summary.loaded_tickers) == ['AAPL', 'MSFT']
+    assert summary.stages['load'].succeeded == 2
+    assert len(client.upserts) == 1
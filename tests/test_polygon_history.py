@@ -0,0 +1,40 @@
+import pandas as pd
+
+from flows.datasources.polygon import PolygonRESTClientWrapper
+from flows.datasources.polygon_history import PolygonHistoryDownloader
+from flows.tests.fakes import FakeAggregatesClient
+
+
+def make_downloader(root=None):
+    client = FakeAggregatesClient()
+    return PolygonHistoryDownloader(PolygonRESTClientWrapper(client=client), root_path=root), client
+
+
+def test_partial_month_part_is_not_reused_for_the_full_month(tmp_path):
+    downloader, client = make_downloader(str(tmp_path))
+
+    downloader.download('AAPL', '2020-03-20', '2020-03-31')
+    df = downloader.download('AAPL', '2020-03-01', '2020-03-31')
+
+    assert len(df.index) == len(pd.bdate_range('2020-03-01', '2020-03-31'))
+    assert len(client.requests) == 2
+
+
+def test_download_is_limited_to_the_requested_range():
+    downloader, _ = make_downloader()
+
+    df = downloader.download('AAPL', '2020-05-20', '2020-06-10')
+
+    assert df.index.min() == pd.Timestamp('2020-05-20')
+    assert df.index.max() == pd.Timestamp('2020-06-10')
+    assert len(df.index) == len(pd.bdate_range('2020-05-20', '2020-06-10'))
+
+
+def test_closed_parts_are_resumed_from_storage(tmp_path):
+    downloader, client = make_downloader(str(tmp_path))
+
+    first = downloader.download('AAPL', '2020-01-01', '2020-03-31')
+    second = downloader.download('AAPL', '2020-01-01', '2020-03-31')
+
+    assert len(client.requests) == 3
+    pd.testing.assert_frame_equal(first, second, check_freq=False)
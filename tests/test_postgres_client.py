@@ -0,0 +1,120 @@
+import threading
+
+import pytest
+
+from flows.postgres import client as client_module
+from flows.postgres.client import PostgresClient
+from flows.postgres.schemas import SIMPLE_CANDLE_SCHEMA
+
+
+class FakeConnection:
+    def __init__(self, database):
+        self.closed = 0
+        self.database = database
+        self.pending = []
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.database.extend(self.pending)
+        self.pending = []
+        self.commits += 1
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeCursor:
+    closed = False
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = None
+
+    def execute(self, query):
+        if query.startswith('SELECT'):
+            # Only committed statements are visible to other connections
+            self.result = [statement for statement in self.conn.database if query.split()[-1] in statement]
+        else:
+            self.conn.pending.append(query)
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool:
+    def __init__(self, min_connections, max_connections, dsn):
+        self.leased = set()
+        self.closed = []
+        self.database = []
+
+    def getconn(self):
+        conn = FakeConnection(self.database)
+        self.leased.add(conn)
+        return conn
+
+    def putconn(self, conn, close=False):
+        # Like psycopg2's pool, uncommitted work is rolled back when a connection is returned
+        conn.rollback()
+        self.leased.discard(conn)
+        if close:
+            conn.close()
+            self.closed.append(conn)
+
+    def closeall(self):
+        pass
+
+
+@pytest.fixture
+def pooled_client(monkeypatch):
+    monkeypatch.setattr(client_module, 'ThreadedConnectionPool', FakePool)
+    return PostgresClient('host', 'db', 'user', 'password', max_connections=2, health_check=False)
+
+
+def lease_without_release(client):
+    thread = threading.Thread(target=lambda: client.cursor)
+    thread.start()
+    thread.join()
+
+
+def test_leases_of_exited_threads_are_reclaimed(pooled_client):
+    lease_without_release(pooled_client)
+    lease_without_release(pooled_client)
+
+    # Both slots are held by exited threads, a third lease must not block
+    with pooled_client.connection() as conn:
+        assert conn in pooled_client._pool.leased
+    assert len(pooled_client._pool.closed) == 2
+    assert pooled_client._pool.leased == set()
+
+
+def test_close_returns_sticky_leases(pooled_client):
+    assert pooled_client.cursor is not None
+    pool = pooled_client._pool
+
+    with pooled_client:
+        pass
+
+    assert pool.leased == set()
+    # release() after close() is a no-op instead of returning the connection twice
+    pooled_client.release()
+    assert len(pool.closed) == 1
+
+
+def test_create_table_is_committed_in_pooled_mode(pooled_client):
+    pooled_client.create_table_if_not_exists(SIMPLE_CANDLE_SCHEMA, 'public', 'candles')
+
+    # A fresh lease only sees the table if the DDL was committed before the connection went back
+    with pooled_client.connection():
+        pooled_client.cursor.execute('SELECT * FROM public.candles')
+        statements = pooled_client.cursor.fetchall()
+    assert len(statements) == 1
+    assert statements[0].startswith('CREATE TABLE IF NOT EXISTS public.candles')
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from flows.postgres.queries import merge_query
+
+# Runs the generated SQL against a real server, e.g. POSTGRES_TEST_DSN="host=localhost dbname=test user=test"
+POSTGRES_TEST_DSN = os.environ.get('POSTGRES_TEST_DSN', '')
+
+pytestmark = pytest.mark.skipif(not POSTGRES_TEST_DSN, reason='POSTGRES_TEST_DSN is not set')
+
+
+@pytest.fixture
+def cursor():
+    import psycopg2
+    conn = psycopg2.connect(POSTGRES_TEST_DSN)
+    cursor = conn.cursor()
+    # Temp tables keep the test away from anything already in the database
+    cursor.execute('CREATE TEMP TABLE target (symbol TEXT, date DATE, close DOUBLE PRECISION, PRIMARY KEY (symbol, date))')
+    cursor.execute('CREATE TEMP TABLE source (symbol TEXT, date DATE, close DOUBLE PRECISION)')
+    cursor.execute("INSERT INTO target VALUES ('AAPL', '2020-01-02', 1.0), ('AAPL', '2020-01-03', 2.0)")
+    yield cursor
+    conn.rollback()
+    conn.close()
+
+
+def merge(cursor, rows, skip_unchanged=True):
+    cursor.executemany('INSERT INTO source VALUES (%s, %s, %s)', rows)
+    cursor.execute(merge_query('source', 'target', ['symbol', 'date'], ['close'], skip_unchanged=skip_unchanged))
+    staged, inserted, updated = cursor.fetchone()
+    return inserted, updated, staged - inserted - updated
+
+
+def read_close(cursor):
+    cursor.execute("SELECT to_char(date, 'YYYY-MM-DD'), close FROM target ORDER BY date")
+    return dict(cursor.fetchall())
+
+
+def test_merge_counts_duplicate_keys_once(cursor):
+    rows = [('AAPL', '2020-01-02', 1.0),
+            ('AAPL', '2020-01-03', 3.0), ('AAPL', '2020-01-03', 4.0),
+            ('AAPL', '2020-01-06', 5.0), ('AAPL', '2020-01-06', 6.0)]
+
+    assert merge(cursor, rows) == (1, 1, 1)
+    # The last staged row of each key wins
+    assert read_close(cursor) == {'2020-01-02': 1.0, '2020-01-03': 4.0, '2020-01-06': 6.0}
+
+
+def test_merge_rewrites_unchanged_rows_without_skip_unchanged(cursor):
+    rows = [('AAPL', '2020-01-02', 1.0), ('AAPL', '2020-01-03', 2.0), ('AAPL', '2020-01-03', 2.0)]
+
+    assert merge(cursor, rows, skip_unchanged=True) == (0, 0, 2)
+    cursor.execute('TRUNCATE source')
+    assert merge(cursor, rows, skip_unchanged=False) == (0, 2, 0)
@@ -0,0 +1,47 @@
+import datetime as dt
+
+from flows.util.postgres_util import SymbolUniverseCache
+
+
+class FakeClient:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def query(self, query, params=None):
+        self.queries.append((query, params))
+        if params:
+            return [row for row in self.rows if row[1] > params[0]]
+        return list(self.rows)
+
+
+def make_cache(client, snapshot_path, ttl_seconds=3600):
+    return SymbolUniverseCache(client_factory=lambda: client, schema='public', table='symbols',
+                               ttl_seconds=ttl_seconds, watermark_column='updated_at',
+                               snapshot_path=str(snapshot_path))
+
+
+def test_snapshot_watermark_round_trip_and_refresh(tmp_path):
+    snapshot_path = tmp_path / 'symbols.json'
+    updated_at = dt.datetime(2020, 1, 2, 10, 30, tzinfo=dt.timezone.utc)
+    client = FakeClient([('AAPL', updated_at), ('MSFT', updated_at)])
+    assert make_cache(client, snapshot_path).get_symbols() == ['AAPL', 'MSFT']
+
+    client.rows.append(('TSLA', updated_at + dt.timedelta(days=1)))
+    client.queries.clear()
+    # A zero TTL makes loading the snapshot refresh straight away
+    cache = make_cache(client, snapshot_path, ttl_seconds=0)
+
+    assert cache.get_symbols() == ['AAPL', 'MSFT', 'TSLA']
+    assert client.queries[0][1] == (updated_at,)
+    assert cache._watermark == updated_at + dt.timedelta(days=1)
+
+
+def test_snapshot_without_typed_watermark_falls_back_to_full_load(tmp_path):
+    snapshot_path = tmp_path / 'symbols.json'
+    snapshot_path.write_text('{"table": "public.symbols", "symbols": ["AAPL"], '
+                             '"watermark": "2020-01-02 10:30:00+00:00", "loaded_at": 0}')
+    client = FakeClient([('AAPL', dt.datetime(2020, 1, 2)), ('MSFT', dt.datetime(2020, 1, 3))])
+
+    assert make_cache(client, snapshot_path).get_symbols() == ['AAPL', 'MSFT']
+    assert client.queries[0][1] is None
@@ -0,0 +1,35 @@
+from flows.datasources.iex import IEXClient
+from flows.datasources.polygon import PolygonRESTClientWrapper
+from flows.datasources.polygon_history import PolygonHistoryDownloader
+from flows.util.response_cache import ResponseCache, LocalDiskCacheBackend
+from flows.tests.fakes import FakeAggregatesClient, FakeSession
+
+
+def make_cache(tmp_path):
+    return ResponseCache(LocalDiskCacheBackend(str(tmp_path / 'cache')))
+
+
+def test_batch_requests_go_through_the_cache(tmp_path):
+    client = IEXClient(token_value='test-token', cache=make_cache(tmp_path))
+    client.session = FakeSession()
+
+    first = client.get_batch_json(['AAPL', 'MSFT'], types=['previous'])
+    second = client.get_batch_json(['AAPL', 'MSFT'], types=['previous'])
+    client.get_batch_json(['AAPL', 'TSLA'], types=['previous'])
+
+    assert first == second == {'AAPL': {'previous': None}, 'MSFT': {'previous': None}}
+    assert len(client.session.requests) == 2
+    assert client.session.requests[0][1]['token'] == 'test-token'
+
+
+def test_history_chunks_go_through_the_cache(tmp_path):
+    client = FakeAggregatesClient()
+    polygon = PolygonRESTClientWrapper(client=client, cache=make_cache(tmp_path))
+    downloader = PolygonHistoryDownloader(polygon)
+
+    first = downloader.download('AAPL', '2020-01-01', '2020-02-29')
+    second = downloader.download('AAPL', '2020-01-01', '2020-02-29')
+
+    assert len(client.requests) == 2
+    assert len(second.index) == len(first.index)
+    assert polygon.cache.get_stats()['hits'] == 2
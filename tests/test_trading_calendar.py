@@ -0,0 +1,45 @@
+import datetime as dt
+
+import pytest
+
+from flows.util.storage import Storage
+from flows.util.trading_calendar import TradingCalendar
+
+TRADE_DATES = ['2020-01-02', '2020-01-03', '2020-01-06', '2020-01-07']
+
+
+class FakeIEXClient:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.requests = 0
+
+    def get_trade_dates(self, direction, count, from_date):
+        self.requests += 1
+        if self.fail:
+            raise ConnectionError('IEX unavailable')
+        dates = [dt.date.fromisoformat(date) for date in TRADE_DATES]
+        return [date for date in dates if (date < from_date if direction == 'last' else date > from_date)]
+
+
+def test_edges_of_the_calendar():
+    calendar = TradingCalendar(TRADE_DATES)
+
+    assert not calendar.has_previous_trading_day('2020-01-02')
+    assert calendar.has_previous_trading_day('2020-01-03')
+    assert not calendar.has_next_trading_day('2020-01-07')
+    assert calendar.next_trading_day('2020-01-03') == dt.date(2020, 1, 6)
+    with pytest.raises(ValueError):
+        calendar.previous_trading_day('2020-01-02')
+
+
+def test_from_iex_caches_through_the_storage_layer():
+    storage = Storage.memory('calendar-test')
+    cache_path = storage.url('_metadata', 'trading_calendar.json')
+    client = FakeIEXClient()
+
+    first = TradingCalendar.from_iex(client, cache_path=cache_path, today=dt.date(2020, 1, 4))
+    second = TradingCalendar.from_iex(client, cache_path=cache_path, today=dt.date(2020, 1, 4))
+
+    assert client.requests == 2
+    assert list(second.trade_dates) == list(first.trade_dates)
+    assert storage.glob('_metadata/*') == [storage._fs_path('_metadata/trading_calendar.json')]
@@ -0,0 +1,24 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from flows.util.util import IEXUtil
+
+
+def test_convert_to_datetime64_parses_mixed_formats():
+    result = IEXUtil.convert_to_datetime64(['2020-01-02', '2020-01-03T15:30:00-05:00', None], 'ms')
+
+    assert result[0] == np.datetime64('2020-01-02T00:00', 'ms')
+    assert result[1] == np.datetime64('2020-01-03T20:30', 'ms')
+    assert np.isnat(result[2])
+
+
+@pytest.mark.parametrize('values', [[''], ['2020-01-02', ''], ['NaT'], ['not a date']])
+def test_convert_to_datetime64_raises_on_unparseable_strings(values):
+    with pytest.raises(ValueError):
+        IEXUtil.convert_to_datetime64(values)
+
+
+def test_convert_to_dates_keeps_missing_values():
+    assert IEXUtil.convert_to_dates(['2020-01-02', None]) == [dt.date(2020, 1, 2), None]
@@ -10,3 +10,17 @@ def rearrange_columns(df: pd.DataFrame, schema: Schema):
 def parse_dated_dataframe(df: pd.DataFrame):
     df['date'] = pd.to_datetime(df['date'], errors='coerce')  # convert date into datetime
     return df.set_index(['date'])  # reindex on date column
+
+
+def iter_csv_chunks(df: pd.DataFrame, chunk_size: int = 10000, index: bool = False, encoding: str = 'utf-8'):
+    '''
+    Encode a DataFrame as header-less CSV, chunk_size rows at a time
+    :param df: data to encode
+    :param chunk_size: number of rows rendered per chunk
+    :param index: include the DataFrame index as the first column
+    :param encoding: output encoding
+    :return: generator of bytes
+    '''
+    for start in range(0, len(df.index), chunk_size):
+        chunk = df.iloc[start:start + chunk_size]
+        yield chunk.to_csv(index=index, header=False).encode(encoding)
@@ -5,21 +5,46 @@ Created By Kenneth Nursalim on 12/13/2020
 """
 
 import base64
+import gzip
 import json
 import os
+import threading
 
 import logging
 
 from google.cloud import pubsub_v1
 
+DEFAULT_BATCH_MAX_MESSAGES = 100
+DEFAULT_BATCH_MAX_BYTES = 1024 * 1024
+DEFAULT_BATCH_MAX_LATENCY = 0.05  # seconds
+DEFAULT_MAX_OUTSTANDING = 1000
+
+CONTENT_ENCODING_GZIP = 'gzip'
+CONTENT_TYPE_NDJSON = 'application/x-ndjson'
+
+
 class GCPPublisherConnection:
-    def __init__(self, project_id: str, topic_id: str):
-        self.client = pubsub_v1.PublisherClient()
+    def __init__(self, project_id: str, topic_id: str, max_messages: int = DEFAULT_BATCH_MAX_MESSAGES,
+                 max_bytes: int = DEFAULT_BATCH_MAX_BYTES, max_latency: float = DEFAULT_BATCH_MAX_LATENCY,
+                 max_outstanding: int = DEFAULT_MAX_OUTSTANDING, client=None):
+        '''
+        :param max_messages: client batch size in messages
+        :param max_bytes: client batch size in bytes
+        :param max_latency: seconds the client waits to fill a batch
+        :param max_outstanding: publish_messages blocks while this many messages are unacknowledged
+        :param client: PublisherClient to use instead of creating one
+        '''
+        self.client = client or pubsub_v1.PublisherClient(batch_settings=pubsub_v1.types.BatchSettings(
+            max_messages=max_messages, max_bytes=max_bytes, max_latency=max_latency))
         self.project_id = project_id
         self.topic_id = topic_id
+        self.max_outstanding = max_outstanding
+        self._topic_path = None
 
     def get_topic_path(self):
-        return self.client.topic_path(self.project_id, self.topic_id)
+        if self._topic_path is None:
+            self._topic_path = self.client.topic_path(self.project_id, self.topic_id)
+        return self._topic_path
 
     def publish_message(self, data_dict: dict):
         data_bytes = GCPPublisherConnection._convert_data_dict_to_message_bytes(data_dict)
@@ -31,6 +56,77 @@ class GCPPublisherConnection:
             logging.error(e)
             return False
 
+    def publish_messages(self, data_dicts, compress: bool = False, ndjson_batch_size: int = None):
+        '''
+        Publish many messages without waiting on each one. Messages are handed to the client's batcher
+        as fast as the max_outstanding limit allows, and the call returns once all are acknowledged.
+        :param data_dicts: iterable of dicts
+        :param compress: gzip payloads, flagged with a content-encoding attribute
+        :param ndjson_batch_size: pack this many dicts per message as newline-delimited JSON
+        :return: list of bool, whether each dict was published
+        '''
+        results = []
+        errors = []
+        slots = threading.BoundedSemaphore(self.max_outstanding)
+
+        def on_done(future, indices):
+            try:
+                future.result()
+                for i in indices:
+                    results[i] = True
+            except Exception as e:
+                errors.append(e)
+            finally:
+                slots.release()
+
+        for indices, data_bytes, attributes in self._iter_payloads(data_dicts, compress, ndjson_batch_size):
+            results.extend([False] * len(indices))
+            slots.acquire()
+            try:
+                future = self.client.publish(self.get_topic_path(), data=data_bytes, **attributes)
+            except Exception as e:
+                errors.append(e)
+                slots.release()
+                continue
+            future.add_done_callback(lambda f, indices=indices: on_done(f, indices))
+
+        # Every slot is free again once the last outstanding message is acknowledged
+        for _ in range(self.max_outstanding):
+            slots.acquire()
+        for _ in range(self.max_outstanding):
+            slots.release()
+
+        for e in errors:
+            logging.error(e)
+        logging.info('published {} of {} messages to {}'.format(sum(results), len(results), self.topic_id))
+        return results
+
+    @staticmethod
+    def _iter_payloads(data_dicts, compress: bool, ndjson_batch_size: int = None):
+        '''
+        :return: generator of (indices of the dicts in the message, payload bytes, message attributes)
+        '''
+        attributes = {'content_encoding': CONTENT_ENCODING_GZIP} if compress else {}
+        if ndjson_batch_size:
+            attributes['content_type'] = CONTENT_TYPE_NDJSON
+        batch = []
+        for index, data_dict in enumerate(data_dicts):
+            if not ndjson_batch_size:
+                data_bytes = GCPPublisherConnection._convert_data_dict_to_message_bytes(data_dict)
+                yield [index], gzip.compress(data_bytes) if compress else data_bytes, attributes
+                continue
+            batch.append((index, data_dict))
+            if len(batch) == ndjson_batch_size:
+                yield GCPPublisherConnection._to_ndjson_payload(batch, compress) + (attributes,)
+                batch = []
+        if batch:
+            yield GCPPublisherConnection._to_ndjson_payload(batch, compress) + (attributes,)
+
+    @staticmethod
+    def _to_ndjson_payload(batch: list, compress: bool):
+        data_bytes = '\n'.join(json.dumps(data_dict) for _, data_dict in batch).encode('utf-8')
+        return [index for index, _ in batch], gzip.compress(data_bytes) if compress else data_bytes
+
     @staticmethod
     def _convert_data_dict_to_message_bytes(data_dict: dict):
         data_json = json.dumps(data_dict)
@@ -3,25 +3,49 @@ Class that will provide code utilities to interact with GCP
 """
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import google.api_core.exceptions as gcp_exception
 from google.cloud.storage.blob import Blob
 from google.cloud import storage
 
 class GCPStorageConnection:
-    def __init__(self):
-        self.storage_client = storage.Client()
+    def __init__(self, storage_client=None):
+        self.storage_client = storage_client or storage.Client()
 
     def list_objects(self, bucket: str = "", prefix: str = "", delimiter=None):
+        # The listing is lazy, NotFound only surfaces while iterating
         try:
-            blobs = self.storage_client.list_blobs(bucket, prefix=prefix, delimiter=delimiter)
+            return [blob.name for blob in self.storage_client.list_blobs(bucket, prefix=prefix, delimiter=delimiter)]
         except gcp_exception.NotFound:
             return []
 
-        blob_url_list = []
-        for blob in blobs:
-            blob_url_list.append(blob.name)
-        return blob_url_list
+    def list_prefixes(self, bucket: str = "", prefix: str = ""):
+        """
+        Immediate "sub-directories" of prefix, e.g. the symbol folders of a dataset
+        """
+        try:
+            blobs = self.storage_client.list_blobs(bucket, prefix=prefix, delimiter='/')
+            for _ in blobs.pages:
+                pass
+        except gcp_exception.NotFound:
+            return []
+        return sorted(blobs.prefixes)
+
+    def list_objects_sharded(self, bucket: str = "", prefix: str = "", max_workers: int = 8):
+        """
+        list_objects split by the sub-directories of prefix, which are listed concurrently
+        """
+        shards = self.list_prefixes(bucket, prefix)
+        # Blobs sitting directly under prefix are not in any shard
+        names = [name for name in self.list_objects(bucket, prefix, delimiter='/')]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for shard in executor.map(lambda shard: self.list_objects(bucket, shard), shards):
+                names.extend(shard)
+        return names
+
+    def blob_exists(self, bucket: str = "", blob_name: str = ""):
+        return Blob(blob_name, self.storage_client.bucket(bucket)).exists(self.storage_client)
 
     def get_gs_uri(self, bucket: str = "", blob_name: str = ""):
         return "gs://{}/{}".format(bucket, blob_name)
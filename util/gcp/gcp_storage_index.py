@@ -0,0 +1,125 @@
+"""
+In-memory index of the blobs under a bucket prefix, answering existence checks without a request per file
+"""
+
+import logging
+import threading
+import time
+
+from flows.util.gcp.gcp_storage_connection import GCPStorageConnection
+
+DEFAULT_TTL_SECONDS = 15 * 60
+
+
+class GCPStorageIndex:
+    def __init__(self, bucket: str, prefix: str = "", ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_workers: int = 8, connection: GCPStorageConnection = None):
+        '''
+        :param bucket: bucket name
+        :param prefix: only blobs under this prefix are indexed, e.g. the dataset root folder
+        :param ttl_seconds: the prefix is listed again once the index is older than this, None never expires
+        :param max_workers: number of symbol folders listed concurrently
+        :param connection: GCPStorageConnection to list with
+        '''
+        self.logger = logging.getLogger(str(self.__class__))
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.ttl_seconds = ttl_seconds
+        self.max_workers = max_workers
+        self.connection = connection or GCPStorageConnection()
+        self._names = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    @classmethod
+    def from_uri(cls, uri: str, **kwargs):
+        '''
+        :param uri: gs://bucket/prefix
+        '''
+        bucket, _, prefix = uri[len('gs://'):].partition('/')
+        return cls(bucket, prefix, **kwargs)
+
+    def _blob_name(self, path: str):
+        name = path
+        if path.startswith('gs://'):
+            bucket, _, name = path[len('gs://'):].partition('/')
+            if bucket != self.bucket:
+                raise ValueError('{} is not in bucket {}'.format(path, self.bucket))
+        return name.lstrip('/')
+
+    def is_stale(self):
+        return self._names is None or \
+            (self.ttl_seconds is not None and time.time() - self._loaded_at >= self.ttl_seconds)
+
+    def refresh(self):
+        start_time = time.time()
+        names = set(self.connection.list_objects_sharded(self.bucket, self.prefix, self.max_workers))
+        with self._lock:
+            self._names = names
+            self._loaded_at = time.time()
+        self.logger.info('indexed {} blobs under gs://{}/{} in {:.2f}s'.format(
+            len(names), self.bucket, self.prefix, time.time() - start_time))
+
+    def invalidate(self):
+        with self._lock:
+            self._names = None
+
+    def _ensure_fresh(self) -> set:
+        '''
+        :return: the indexed names, listed again first when stale. Iterate them under _lock,
+                 since add() and discard() modify the set in place.
+        '''
+        while True:
+            if self.is_stale():
+                # Concurrent callers wait for a single listing
+                with self._refresh_lock:
+                    if self.is_stale():
+                        self.refresh()
+            with self._lock:
+                # None when invalidate() ran since the listing
+                if self._names is not None:
+                    return self._names
+
+    def exists(self, path: str, confirm_missing: bool = False) -> bool:
+        '''
+        :param path: gs:// url or blob name
+        :param confirm_missing: check a blob missing from the index with a request, for callers that
+                                would overwrite it, since another writer may have created it after the listing
+        '''
+        name = self._blob_name(path)
+        if not name.startswith(self.prefix):
+            raise ValueError('{} is outside the indexed prefix {}'.format(name, self.prefix))
+        if name in self._ensure_fresh():
+            return True
+        if not confirm_missing:
+            return False
+        found = self.connection.blob_exists(self.bucket, name)
+        if found:
+            self.add(name)
+        return found
+
+    def add(self, path: str):
+        '''
+        Record a blob written after the listing, so the index stays valid until its TTL expires
+        '''
+        name = self._blob_name(path)
+        with self._lock:
+            if self._names is not None:
+                self._names.add(name)
+
+    def discard(self, path: str):
+        name = self._blob_name(path)
+        with self._lock:
+            if self._names is not None:
+                self._names.discard(name)
+
+    def list(self, prefix: str = "") -> list:
+        '''
+        Indexed blob names under prefix, relative to the bucket
+        '''
+        names = self._ensure_fresh()
+        prefix = self._blob_name(prefix) if prefix else self.prefix
+        with self._lock:
+            names = [name for name in names if name.startswith(prefix)]
+        return sorted(names)
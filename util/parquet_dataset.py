@@ -0,0 +1,101 @@
+"""
+Append-friendly parquet dataset: a base file plus delta files written next to it,
+merged on read and folded back into the base file by compaction
+"""
+import logging
+import os
+import posixpath
+import time
+import uuid
+
+import pandas as pd
+
+from flows.util.parquet_util import ParquetUtil
+from flows.util.storage import resolve, is_local
+from flows.util.parquet_profiles import get_profile
+
+
+class ParquetDataset:
+    DELTA_MARKER = '.delta-'
+
+    def __init__(self, base_path: str, engine='pyarrow', storage_options: dict = None, profile=None):
+        '''
+        :param base_path: location of the base file, local path or gs:// url
+        :param engine: parquet engine used for reading (pyarrow or fastparquet)
+        :param storage_options: extra arguments for the fsspec filesystem
+        :param profile: encoding profile of the base and delta files, see parquet_profiles
+        '''
+        self.base_path = base_path
+        self.engine = engine
+        self.profile = get_profile(profile)
+        self._fs, self._fs_path = resolve(base_path, storage_options)
+
+    def exists(self):
+        return self._fs.exists(self._fs_path)
+
+    def delta_paths(self):
+        '''
+        Delta files in the order they were written
+        '''
+        stem, ext = os.path.splitext(self._fs_path)
+        return sorted(self._fs.glob('{}{}*{}'.format(stem, self.DELTA_MARKER, ext)))
+
+    def _new_delta_path(self):
+        stem, ext = os.path.splitext(self._fs_path)
+        # Nanosecond timestamp first so that lexical order is write order
+        return '{}{}{:020d}-{}{}'.format(stem, self.DELTA_MARKER, time.time_ns(), uuid.uuid4().hex[:8], ext)
+
+    def append(self, data_frame: pd.DataFrame, base_exists: bool = None, index=None):
+        '''
+        Write data_frame as the base file if there is none yet, otherwise as a new delta file.
+        Existing data is never read or rewritten.
+        :param data_frame: new data
+        :param base_exists: skip the existence check when the caller already knows the answer
+        :param index: pandas DF index flag
+        :return: path written
+        '''
+        if base_exists is None:
+            base_exists = self.exists()
+        target = self._new_delta_path() if base_exists else self._fs_path
+        if not base_exists and is_local(self._fs):
+            self._fs.makedirs(posixpath.dirname(target), exist_ok=True)
+        logging.info('writing {} rows to {}'.format(len(data_frame.index), target))
+        self._write(data_frame, target, index)
+        return target
+
+    def read(self, columns=None) -> pd.DataFrame:
+        '''
+        Base file merged with all delta files, later writes win on duplicate index keys
+        '''
+        frames, _ = self._read_all(columns)
+        if not frames:
+            raise FileNotFoundError(self.base_path)
+        return ParquetUtil.merge_frames(frames)
+
+    def compact(self, index=None):
+        '''
+        Fold all delta files into the base file. Deltas are only removed after the new base file
+        has been written, and only the ones that were merged into it.
+        :return: number of delta files compacted
+        '''
+        frames, delta_paths = self._read_all()
+        if not delta_paths:
+            return 0
+        self._write(ParquetUtil.merge_frames(frames), self._fs_path, index)
+        self._fs.rm(delta_paths)
+        logging.info('compacted {} delta files into {}'.format(len(delta_paths), self.base_path))
+        return len(delta_paths)
+
+    def _read_all(self, columns=None):
+        delta_paths = self.delta_paths()
+        paths = ([self._fs_path] if self.exists() else []) + delta_paths
+        frames = [self._read(path, columns) for path in paths]
+        return frames, delta_paths
+
+    def _read(self, path, columns=None):
+        with self._fs.open(path, 'rb') as f:
+            return pd.read_parquet(f, engine=self.engine, columns=columns)
+
+    def _write(self, data_frame, path, index):
+        with self._fs.open(path, 'wb') as f:
+            self.profile.write(data_frame, f, index=index)
@@ -0,0 +1,99 @@
+"""
+Named parquet encoding profiles shared by every writer, all written with pyarrow
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+PROFILE_FAST = 'fast'
+PROFILE_COMPACT = 'compact'
+PROFILE_ARCHIVAL = 'archival'
+PROFILE_GZIP = 'gzip'
+
+DEFAULT_ROW_GROUP_SIZE = 128 * 1024
+DEFAULT_PROFILE = os.environ.get('PARQUET_PROFILE', PROFILE_COMPACT)
+
+
+class ParquetProfile:
+    def __init__(self, name: str, compression: str = 'snappy', compression_level: int = None,
+                 dictionary_columns=None, downcast_floats: bool = False,
+                 row_group_size: int = DEFAULT_ROW_GROUP_SIZE, sort_by: str = 'date'):
+        '''
+        :param compression: parquet codec, e.g. snappy, zstd, gzip
+        :param compression_level: codec level, None for the codec default
+        :param dictionary_columns: only these columns are dictionary-encoded, None for pyarrow's default of
+                                   every column (it falls back to plain encoding where the dictionary grows too large)
+        :param downcast_floats: store float64 columns as float32, halves price columns at ~7 significant digits
+        :param row_group_size: maximum rows per row group
+        :param sort_by: column (or index name) rows are sorted by, so row group statistics on it are tight
+        '''
+        self.name = name
+        self.compression = compression
+        self.compression_level = compression_level
+        self.dictionary_columns = list(dictionary_columns) if dictionary_columns is not None else None
+        self.downcast_floats = downcast_floats
+        self.row_group_size = row_group_size
+        self.sort_by = sort_by
+
+    def prepare(self, data_frame: pd.DataFrame) -> pd.DataFrame:
+        '''
+        Sorted and downcast copy of data_frame as it will be written
+        '''
+        if self.sort_by and self.sort_by in data_frame.columns:
+            if not data_frame[self.sort_by].is_monotonic_increasing:
+                data_frame = data_frame.sort_values(self.sort_by, kind='mergesort')
+        elif self.sort_by and self.sort_by in (data_frame.index.names or []) and data_frame.index.nlevels == 1:
+            if not data_frame.index.is_monotonic_increasing:
+                data_frame = data_frame.sort_index(kind='mergesort')
+        if self.downcast_floats:
+            floats = data_frame.select_dtypes(include=[np.float64]).columns
+            if len(floats):
+                data_frame = data_frame.astype({column: np.float32 for column in floats})
+        return data_frame
+
+    def write(self, data_frame: pd.DataFrame, where, index=None):
+        '''
+        :param where: path or writable binary file object
+        :param index: pandas DF index flag, same meaning as in DataFrame.to_parquet
+        '''
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pandas(self.prepare(data_frame), preserve_index=index)
+        use_dictionary = True
+        if self.dictionary_columns is not None:
+            use_dictionary = [column for column in self.dictionary_columns if column in table.column_names] or False
+        pq.write_table(
+            table, where,
+            compression=self.compression,
+            compression_level=self.compression_level,
+            use_dictionary=use_dictionary,
+            row_group_size=self.row_group_size,
+            write_statistics=True,
+        )
+
+
+PROFILES = {
+    # Cheapest to write and decode, for intermediate and frequently rewritten files
+    PROFILE_FAST: ParquetProfile(PROFILE_FAST, compression='snappy'),
+    # Good ratio at close to snappy decode speed, the default
+    PROFILE_COMPACT: ParquetProfile(PROFILE_COMPACT, compression='zstd', compression_level=3),
+    # Smallest files for history that is written once and rarely read
+    PROFILE_ARCHIVAL: ParquetProfile(PROFILE_ARCHIVAL, compression='zstd', compression_level=19,
+                                     row_group_size=1024 * 1024),
+    # The previous hard-coded behaviour
+    PROFILE_GZIP: ParquetProfile(PROFILE_GZIP, compression='gzip'),
+}
+
+
+def get_profile(profile=None) -> ParquetProfile:
+    '''
+    :param profile: ParquetProfile, name of one in PROFILES, or None for DEFAULT_PROFILE
+    '''
+    if isinstance(profile, ParquetProfile):
+        return profile
+    name = profile or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError("Unknown parquet profile '{}', expected one of {}".format(name, sorted(PROFILES)))
+    return PROFILES[name]
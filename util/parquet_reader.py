@@ -0,0 +1,189 @@
+"""
+Reader for the {root}/{symbol}/{year}/data.parquet layout written by ETLFetcher, reading only the
+partitions, row groups and columns a query needs
+"""
+
+import datetime as dt
+import logging
+import posixpath
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from flows.util.calendar_util import DateTimeRange, get_start_of_next_month, get_year_month
+from flows.util.parquet_util import ParquetUtil
+from flows.util.storage import resolve
+
+DEFAULT_FILENAME = 'data.parquet'
+DATE_COLUMN = 'date'
+
+
+class PartitionedParquetReader:
+    def __init__(self, root: str, filename: str = DEFAULT_FILENAME, date_column: str = DATE_COLUMN,
+                 max_workers: int = 8, storage_options: dict = None):
+        '''
+        :param root: dataset root, local path or gs:// url
+        :param filename: base file name of every partition, its delta files are read along with it
+        :param date_column: column (or index) the date range applies to
+        :param max_workers: number of symbols read concurrently
+        :param storage_options: extra arguments for the fsspec filesystem
+        '''
+        self.logger = logging.getLogger(str(self.__class__))
+        self.root = root
+        self.filename = filename
+        self.date_column = date_column
+        self.max_workers = max_workers
+        self._fs, self._root = resolve(root.rstrip('/'), storage_options)
+
+    @staticmethod
+    def get_date_bounds(date_range: DateTimeRange):
+        '''
+        :return: (first day of the start month, first day after the end month), None for a default range
+        '''
+        if date_range is None or date_range.is_default():
+            return None
+        start = get_year_month(date_range.start).date()
+        end = get_year_month(date_range.end)
+        return start, get_start_of_next_month(end.year, end.month)
+
+    def get_partitions(self, symbol: str, date_range: DateTimeRange = None) -> list:
+        '''
+        Partitions of symbol whose year overlaps date_range, found with one listing per symbol
+        :return: [(year, [base file and delta files in write order])]
+        '''
+        stem, ext = posixpath.splitext(self.filename)
+        pattern = posixpath.join(self._root, symbol, '*', '{}*{}'.format(stem, ext))
+        bounds = self.get_date_bounds(date_range)
+        partitions = {}
+        for path in sorted(self._fs.glob(pattern)):
+            year = posixpath.basename(posixpath.dirname(path))
+            if not year.isdigit():
+                continue
+            if bounds is not None and not bounds[0].year <= int(year) <= (bounds[1] - dt.timedelta(days=1)).year:
+                continue
+            partitions.setdefault(year, []).append(path)
+        base_name = posixpath.basename(self.filename)
+        # The base file is the oldest data, deltas sort by write time after it
+        return [(year, sorted(paths, key=lambda path: posixpath.basename(path) != base_name))
+                for year, paths in sorted(partitions.items())]
+
+    def read(self, symbols, date_range: DateTimeRange = None, columns: list = None) -> pd.DataFrame:
+        '''
+        :param symbols: symbols to read
+        :param date_range: months to read, None for everything
+        :param columns: columns to read besides the date, None for all
+        :return: one DataFrame with a symbol column, empty when nothing matches
+        '''
+        frames = [frame for _, frame in self.iter_symbols(symbols, date_range, columns) if len(frame.index)]
+        return pd.concat(frames) if frames else pd.DataFrame()
+
+    def iter_symbols(self, symbols, date_range: DateTimeRange = None, columns: list = None):
+        '''
+        Per-symbol frames in the order of symbols, read ahead by up to max_workers symbols
+        :return: generator of (symbol, DataFrame)
+        '''
+        start_time = time.time()
+        symbols = list(symbols)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+            for symbol in symbols:
+                pending.append((symbol, executor.submit(self.read_symbol, symbol, date_range, columns)))
+                if len(pending) >= self.max_workers:
+                    symbol, future = pending.popleft()
+                    yield symbol, future.result()
+            while pending:
+                symbol, future = pending.popleft()
+                yield symbol, future.result()
+        self.logger.info('read {} symbols from {} in {:.2f}s'.format(len(symbols), self.root, time.time() - start_time))
+
+    def read_symbol(self, symbol: str, date_range: DateTimeRange = None, columns: list = None) -> pd.DataFrame:
+        bounds = self.get_date_bounds(date_range)
+        frames = []
+        for _, paths in self.get_partitions(symbol, date_range):
+            partition_frames = [self._read_file(path, bounds, columns) for path in paths]
+            partition_frames = [frame for frame in partition_frames if frame is not None]
+            if len(partition_frames) > 1:
+                frames.append(self._merge_partition(partition_frames))
+            elif partition_frames:
+                frames.append(partition_frames[0])
+        if not frames:
+            return pd.DataFrame()
+        df = pd.concat(frames)
+        if 'symbol' not in df.columns:
+            df['symbol'] = symbol
+        return df
+
+    def _merge_partition(self, frames: list) -> pd.DataFrame:
+        '''
+        Base and delta frames of one partition, keeping the latest row per date. Rows are matched on
+        the date alone, so projected rows with equal values on different dates are all kept.
+        '''
+        if self.date_column in frames[0].columns:
+            return pd.concat(frames, ignore_index=True).drop_duplicates(subset=[self.date_column], keep='last')
+        return ParquetUtil.merge_frames(frames)
+
+    def _read_file(self, path: str, bounds, columns: list = None):
+        '''
+        Read the row groups of one file whose date statistics overlap bounds, then filter the rows
+        :return: DataFrame or None when no row group matches
+        '''
+        import pyarrow.parquet as pq
+        with self._fs.open(path, 'rb') as f:
+            parquet_file = pq.ParquetFile(f)
+            row_groups = self._select_row_groups(parquet_file.metadata, bounds)
+            if not row_groups:
+                return None
+            read_columns = None
+            if columns is not None:
+                read_columns = list(columns)
+                if self.date_column in parquet_file.schema_arrow.names and self.date_column not in read_columns:
+                    read_columns.append(self.date_column)
+            table = parquet_file.read_row_groups(row_groups, columns=read_columns, use_pandas_metadata=True)
+        df = table.to_pandas()
+        if bounds is not None:
+            df = df[self._date_mask(df, bounds)]
+        if columns is not None and self.date_column in df.columns and self.date_column not in columns:
+            df = df.set_index(self.date_column)
+        return df
+
+    def _select_row_groups(self, metadata, bounds) -> list:
+        if bounds is None:
+            return list(range(metadata.num_row_groups))
+        names = [metadata.schema.column(i).name for i in range(metadata.num_columns)]
+        if self.date_column not in names:
+            return list(range(metadata.num_row_groups))
+        position = names.index(self.date_column)
+        selected = []
+        for i in range(metadata.num_row_groups):
+            statistics = metadata.row_group(i).column(position).statistics
+            if statistics is None or not statistics.has_min_max or \
+                    self._overlaps(statistics.min, statistics.max, bounds):
+                selected.append(i)
+        return selected
+
+    @staticmethod
+    def _overlaps(minimum, maximum, bounds) -> bool:
+        start, end = bounds
+        if isinstance(minimum, bytes):
+            minimum, maximum = minimum.decode('utf-8'), maximum.decode('utf-8')
+        if isinstance(minimum, str):
+            # ISO date strings order the same way as the dates
+            return minimum < end.isoformat() and maximum >= start.isoformat()
+        minimum, maximum = pd.Timestamp(minimum), pd.Timestamp(maximum)
+        if minimum.tzinfo is not None:
+            minimum, maximum = minimum.tz_localize(None), maximum.tz_localize(None)
+        return minimum < pd.Timestamp(end) and maximum >= pd.Timestamp(start)
+
+    def _date_mask(self, df: pd.DataFrame, bounds):
+        start, end = bounds
+        if self.date_column in df.columns:
+            dates = pd.DatetimeIndex(pd.to_datetime(df[self.date_column]))
+        elif self.date_column in (df.index.names or []):
+            dates = pd.DatetimeIndex(pd.to_datetime(df.index.get_level_values(self.date_column)))
+        else:
+            return slice(None)
+        if dates.tz is not None:
+            dates = dates.tz_localize(None)
+        return (dates >= pd.Timestamp(start)) & (dates < pd.Timestamp(end))
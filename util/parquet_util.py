@@ -3,26 +3,36 @@ Util class to simplify saving and reading from parquets
 Created by Kenneth Nursalim on 12/15/2020
 """
 import logging
-from pathlib import Path
 import pandas as pd
 from namespace.constants import WriteMode
+from flows.util.storage import open_file
+from flows.util.parquet_profiles import get_profile
 
 
 class ParquetUtil:
     @staticmethod
     def save_dict_to_parquet(data_dict: dict, save_path: str, save_to_local_folder: bool = True, *args, **kwargs):
+        '''
+        :param save_to_local_folder: unused, local directories are created by the storage layer
+        :param profile: encoding profile keyword, see parquet_profiles
+        '''
+        profile = kwargs.pop('profile', None)
+        # Files are always written with pyarrow, see parquet_profiles
+        kwargs.pop('engine', None)
         df = pd.DataFrame(data_dict, *args, **kwargs)
-        engine = 'pyarrow'
-        if 'engine' in kwargs:
-            engine = kwargs['engine']
-
-        if save_to_local_folder:
-            save_path = Path(save_path)
-            save_path.parent.mkdir(parents=True, exist_ok=True)
-            save_path = save_path.absolute()
-        df.to_parquet(save_path, engine=engine, compression='gzip')
+        ParquetUtil.to_parquet(df, save_path, profile=profile)
         return True
 
+    @staticmethod
+    def to_parquet(data_frame, save_path: str, profile=None, index=None):
+        '''
+        Write data_frame to a local path or url with an encoding profile
+        :param profile: ParquetProfile or profile name, None for the default profile
+        :param index: pandas DF index flag
+        '''
+        with open_file(save_path, 'wb') as f:
+            get_profile(profile).write(data_frame, f, index=index)
+
     @staticmethod
     def load_dict_from_parquet(parquet_path: str, *args, **kwargs):
         try:
@@ -32,51 +42,83 @@ class ParquetUtil:
             return None
 
     @staticmethod
-    def read_parquet(parquet_path: str, engine='pyarrow', *args, **kwargs):
-        return pd.read_parquet(parquet_path, engine=engine, *args, **kwargs)
+    def read_parquet(parquet_path: str, engine='pyarrow', columns=None):
+        '''
+        Read a parquet file merged with the delta files appended next to it, see read_dataset
+        '''
+        return ParquetUtil.read_dataset(parquet_path, columns=columns, engine=engine)
 
     @staticmethod
-    def write_parquet(data_frame, save_path, mode: WriteMode = WriteMode.OVERWRITE, engine='pyarrow', index=None):
-        message = 'writing new file to {} in {} mode using {}'
-        logging.info(message.format(save_path, str(mode), engine))
+    def write_parquet(data_frame, save_path, mode: WriteMode = WriteMode.OVERWRITE, engine='pyarrow', index=None,
+                      profile=None):
+        '''
+        :param engine: parquet engine used to read existing data in APPEND and UPSERT modes
+        :param profile: encoding profile of the written file, see parquet_profiles
+        '''
+        message = 'writing new file to {} in {} mode using the {} profile'
+        logging.info(message.format(save_path, str(mode), get_profile(profile).name))
         if mode == WriteMode.OVERWRITE:
-            data_frame.to_parquet(
-                save_path,
-                index=index,
-                engine=engine,
-                compression='gzip'
-            )
+            ParquetUtil.to_parquet(data_frame, save_path, profile=profile, index=index)
         elif mode == WriteMode.APPEND:
-            ParquetUtil.append_file(data_frame, save_path, engine, index)
+            ParquetUtil.append_file(data_frame, save_path, engine, index, profile)
         else:
-            ParquetUtil.upsert_file(data_frame, save_path, engine, index)
+            ParquetUtil.upsert_file(data_frame, save_path, engine, index, profile)
         return True
 
     @staticmethod
-    def append_file(data_frame, save_path, engine, index):
+    def append_file(data_frame, save_path, engine, index, profile=None):
         '''
         Append new dataframe to existing dataframe at save_path
         :param data_frame: new data
         :param save_path: file location
         :param engine: parquet engine (pyarrow or fastparquet)
         :param index: pandas DF index flag
+        :param profile: encoding profile of the written file
         :return:
         '''
-        existing_df = pd.read_parquet(save_path, engine=engine)
+        existing_df = ParquetUtil.read_parquet(save_path, engine=engine)
         output_df = pd.concat([existing_df, data_frame])
-        output_df.to_parquet(save_path, engine=engine, compression='gzip', index=index)
+        ParquetUtil.to_parquet(output_df, save_path, profile=profile, index=index)
 
     @staticmethod
-    def upsert_file(data_frame, save_path, engine, index):
+    def upsert_file(data_frame, save_path, engine, index, profile=None):
         '''
-        Load existing data at save_path, concatenate with new data, and drop all duplicates
-        before writing back to the same location
+        Load existing data at save_path, concatenate with new data, keep the latest row for each index key
+        and write back to the same location
         :param data_frame: new data
         :param save_path: file location
         :param engine: parquet engine (pyarrow or fastparquet)
         :param index: pandas DF index flag
+        :param profile: encoding profile of the written file
+        '''
+        existing_df = ParquetUtil.read_parquet(save_path, engine=engine)
+        output_df = ParquetUtil.merge_frames([existing_df, data_frame])
+        ParquetUtil.to_parquet(output_df, save_path, profile=profile, index=index)
+
+    @staticmethod
+    def merge_frames(frames: list) -> pd.DataFrame:
+        '''
+        Concatenate frames oldest first and keep the latest row for each index key. Rows are matched
+        on the index alone, rows with equal values under different keys (e.g. dates) are all kept.
+        :param frames: list of DataFrames in write order
+        :return: merged DataFrame
+        '''
+        output_df = pd.concat(frames)
+        return output_df.loc[~output_df.index.duplicated(keep='last')]
+
+    @staticmethod
+    def read_dataset(base_path: str, columns=None, engine='pyarrow'):
+        '''
+        Read a base file together with its delta files, see ParquetDataset
+        '''
+        from flows.util.parquet_dataset import ParquetDataset
+        return ParquetDataset(base_path, engine=engine).read(columns=columns)
+
+    @staticmethod
+    def read_partitions(root: str, symbols, date_range=None, columns=None):
+        '''
+        Read only the symbol/year partitions, row groups and columns needed, see PartitionedParquetReader
+        :param date_range: DateTimeRange of months to read, None for everything
         '''
-        existing_df = pd.read_parquet(save_path, engine=engine)
-        output_df = pd.concat([existing_df, data_frame]).drop_duplicates()
-        output_df = output_df.loc[~output_df.index.duplicated(keep='last')]
-        output_df.to_parquet(save_path, engine=engine, compression='gzip', index=index)
+        from flows.util.parquet_reader import PartitionedParquetReader
+        return PartitionedParquetReader(root).read(symbols, date_range, columns)
@@ -1,24 +1,197 @@
+import datetime as dt
+import json
+import logging
 import os
+import threading
+import time
+from decimal import Decimal
 from flows.postgres.client import PostgresClient
 
-postgres_client = PostgresClient(
-    os.environ.get('POSTGRES_HOST', ''),
-    os.environ.get('POSTGRES_DATABASE', ''),
-    os.environ.get('POSTGRES_USERNAME', ''),
-    os.environ.get('POSTGRES_PASSWORD', ''),
-)
-
 SCHEMA = os.environ.get('POSTGRES_SCHEMA', '')
 SYMBOLS_TABLE_NAME = os.environ.get('POSTGRES_SYMBOLS_TABLE_NAME', '')
+SYMBOLS_WATERMARK_COLUMN = os.environ.get('POSTGRES_SYMBOLS_WATERMARK_COLUMN', '')
+SYMBOLS_CACHE_TTL_SECONDS = float(os.environ.get('SYMBOLS_CACHE_TTL_SECONDS', '3600'))
+SYMBOLS_SNAPSHOT_PATH = os.environ.get('SYMBOLS_SNAPSHOT_PATH', '')
 
 query = """
         SELECT symbol FROM {}.{}
         """.format(SCHEMA, SYMBOLS_TABLE_NAME)
 
+_postgres_client = None
+_postgres_client_lock = threading.Lock()
 
-def get_symbols_from_db():
-    if postgres_client.conn.closed:
-        postgres_client.reconnect()
-    result = postgres_client.query(query)
-    return [record[0] for record in result]
 
+def get_postgres_client():
+    '''
+    Shared client built from the POSTGRES_* environment variables on first use
+    '''
+    global _postgres_client
+    with _postgres_client_lock:
+        if _postgres_client is None:
+            _postgres_client = PostgresClient(
+                os.environ.get('POSTGRES_HOST', ''),
+                os.environ.get('POSTGRES_DATABASE', ''),
+                os.environ.get('POSTGRES_USERNAME', ''),
+                os.environ.get('POSTGRES_PASSWORD', ''),
+            )
+        return _postgres_client
+
+
+def __getattr__(name):
+    # Keeps `from flows.util.postgres_util import postgres_client` working without connecting at import
+    if name == 'postgres_client':
+        return get_postgres_client()
+    raise AttributeError("module {} has no attribute {}".format(__name__, name))
+
+
+class SymbolUniverseCache:
+    '''
+    In-memory symbol list that is loaded on first use and refreshed once it is older than the TTL.
+    Refreshes are incremental: with a watermark column only rows past the last seen watermark are
+    fetched, otherwise a count/md5 checksum query decides whether a full reload is needed.
+    Symbols deleted from the table are only noticed by the watermark mode after invalidate().
+    '''
+    def __init__(self, client_factory=get_postgres_client, schema=SCHEMA, table=SYMBOLS_TABLE_NAME,
+                 ttl_seconds=SYMBOLS_CACHE_TTL_SECONDS, watermark_column=SYMBOLS_WATERMARK_COLUMN,
+                 snapshot_path=SYMBOLS_SNAPSHOT_PATH):
+        '''
+        :param client_factory: callable returning a PostgresClient, only called when the table is queried
+        :param ttl_seconds: age after which the next call refreshes the list
+        :param watermark_column: monotonically increasing column (e.g. updated_at) for incremental refresh
+        :param snapshot_path: local JSON file used to start without querying Postgres while it is fresh
+        '''
+        self.logger = logging.getLogger(str(self.__class__))
+        self._client_factory = client_factory
+        self._table = '{}.{}'.format(schema, table)
+        self.ttl_seconds = ttl_seconds
+        self.watermark_column = watermark_column or None
+        self.snapshot_path = snapshot_path or None
+        self._symbols = None
+        self._watermark = None
+        self._checksum = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get_symbols(self) -> list:
+        with self._lock:
+            if self._symbols is None and not self._load_snapshot():
+                self._full_load()
+            elif time.time() - self._loaded_at >= self.ttl_seconds:
+                self._refresh()
+            return list(self._symbols)
+
+    def invalidate(self):
+        with self._lock:
+            self._symbols = None
+            self._watermark = None
+            self._checksum = None
+
+    def _query(self, query, params=None):
+        return self._client_factory().query(query, params)
+
+    def _full_load(self):
+        if self.watermark_column:
+            rows = self._query('SELECT symbol, {} FROM {}'.format(self.watermark_column, self._table))
+            self._symbols = sorted(set(row[0] for row in rows))
+            self._watermark = max((row[1] for row in rows if row[1] is not None), default=None)
+        else:
+            rows = self._query('SELECT symbol FROM {}'.format(self._table))
+            self._symbols = sorted(set(row[0] for row in rows))
+            self._checksum = self._fetch_checksum()
+        self.logger.info("Loaded {} symbols from {}".format(len(self._symbols), self._table))
+        self._mark_loaded()
+
+    def _refresh(self):
+        if self.watermark_column:
+            if self._watermark is None:
+                return self._full_load()
+            rows = self._query('SELECT symbol, {column} FROM {table} WHERE {column} > %s'.format(
+                column=self.watermark_column, table=self._table), (self._watermark,))
+            if rows:
+                self._symbols = sorted(set(self._symbols).union(row[0] for row in rows))
+                self._watermark = max([self._watermark] + [row[1] for row in rows if row[1] is not None])
+                self.logger.info("Refreshed {} symbols from {}".format(len(rows), self._table))
+            self._mark_loaded()
+        else:
+            checksum = self._fetch_checksum()
+            if checksum != self._checksum:
+                return self._full_load()
+            self._mark_loaded()
+
+    def _fetch_checksum(self):
+        rows = self._query("SELECT count(*), md5(string_agg(symbol, ',' ORDER BY symbol)) FROM {}".format(self._table))
+        return list(rows[0])
+
+    def _mark_loaded(self):
+        self._loaded_at = time.time()
+        self._save_snapshot()
+
+    def _load_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+        except ValueError:
+            self.logger.warning("Ignoring unreadable symbol snapshot {}".format(self.snapshot_path))
+            return False
+        if snapshot.get('table') != self._table:
+            return False
+        self._symbols = snapshot['symbols']
+        self._watermark = self._decode_watermark(snapshot.get('watermark'))
+        self._checksum = snapshot.get('checksum')
+        self._loaded_at = snapshot.get('loaded_at', 0.0)
+        if time.time() - self._loaded_at >= self.ttl_seconds:
+            self._refresh()
+        return True
+
+    def _save_snapshot(self):
+        if not self.snapshot_path:
+            return
+        snapshot = {
+            'table': self._table,
+            'symbols': self._symbols,
+            'watermark': self._encode_watermark(self._watermark),
+            'checksum': self._checksum,
+            'loaded_at': self._loaded_at,
+        }
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(temp_path, self.snapshot_path)
+
+    @staticmethod
+    def _encode_watermark(watermark):
+        '''
+        Watermark with its type, so a refresh after loading the snapshot compares like with like
+        '''
+        if watermark is None:
+            return None
+        if isinstance(watermark, dt.datetime):
+            return {'type': 'datetime', 'value': watermark.isoformat()}
+        if isinstance(watermark, dt.date):
+            return {'type': 'date', 'value': watermark.isoformat()}
+        if isinstance(watermark, Decimal):
+            return {'type': 'decimal', 'value': str(watermark)}
+        return {'type': 'json', 'value': watermark}
+
+    @staticmethod
+    def _decode_watermark(encoded):
+        # Snapshots written before watermarks carried their type hold a bare string, reload those in full
+        if not isinstance(encoded, dict):
+            return None
+        value = encoded.get('value')
+        if encoded.get('type') == 'datetime':
+            return dt.datetime.fromisoformat(value)
+        if encoded.get('type') == 'date':
+            return dt.date.fromisoformat(value)
+        if encoded.get('type') == 'decimal':
+            return Decimal(value)
+        return value
+
+
+symbol_universe_cache = SymbolUniverseCache()
+
+
+def get_symbols_from_db():
+    return symbol_universe_cache.get_symbols()
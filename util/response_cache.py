@@ -0,0 +1,214 @@
+"""
+Content-addressed cache for raw API responses (IEX, Polygon) with local disk and GCS backends,
+so re-running a failed job does not download everything again
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+IMMUTABLE = None  # TTL value for entries that never expire, e.g. closed historical ranges
+
+DEFAULT_TTL_RULES = {
+    'previous': 60 * 60,
+    'chart': 12 * 60 * 60,
+    'splits': 12 * 60 * 60,
+    'dividends': 12 * 60 * 60,
+    'trade-dates': 12 * 60 * 60,
+    # A batch holds the previous day's price, so it expires like 'previous'
+    'batch': 60 * 60,
+    'aggs': 12 * 60 * 60,
+}
+DEFAULT_TTL_SECONDS = 60 * 60
+
+_USE_RULES = object()
+
+
+class CachedResponse:
+    '''
+    Stand-in for requests.Response when the body comes from the cache
+    '''
+    def __init__(self, content: bytes, url: str = None, status_code: int = 200, encoding: str = 'utf-8'):
+        self.content = content
+        self.url = url
+        self.status_code = status_code
+        self.encoding = encoding
+        self.from_cache = True
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding)
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        pass
+
+
+class LocalDiskCacheBackend:
+    '''
+    One file per entry under root. Keeps an in-memory LRU index of entry sizes and evicts the least
+    recently used entries once the total exceeds max_bytes.
+    '''
+    def __init__(self, root: str, max_bytes: int = None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        os.makedirs(root, exist_ok=True)
+        files = []
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if name.endswith('.tmp') or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_atime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total_bytes += size
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        '''
+        :return: (data, stored_at epoch seconds) or None
+        '''
+        path = self._path(key)
+        try:
+            stored_at = os.path.getmtime(path)
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return data, stored_at
+
+    def put(self, key, data: bytes):
+        path = self._path(key)
+        temp_path = '{}.{}.tmp'.format(path, threading.get_ident())
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._evict()
+
+    def delete(self, key):
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        while self.max_bytes and self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+
+class GCSCacheBackend:
+    '''
+    One blob per entry under gs://bucket/prefix. Size bounds are left to the bucket's lifecycle rules.
+    '''
+    def __init__(self, bucket: str, prefix: str = '', client=None):
+        from google.cloud import storage
+        self._client = client or storage.Client()
+        self._bucket = self._client.bucket(bucket)
+        self.prefix = prefix.strip('/')
+
+    def _name(self, key):
+        return '/'.join([self.prefix, key]) if self.prefix else key
+
+    def get(self, key):
+        blob = self._bucket.get_blob(self._name(key))
+        if blob is None:
+            return None
+        return blob.download_as_bytes(), blob.updated.timestamp()
+
+    def put(self, key, data: bytes):
+        self._bucket.blob(self._name(key)).upload_from_string(data)
+
+    def delete(self, key):
+        from google.api_core.exceptions import NotFound
+        try:
+            self._bucket.blob(self._name(key)).delete()
+        except NotFound:
+            pass
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl_rules: dict = None, default_ttl=DEFAULT_TTL_SECONDS):
+        '''
+        :param backend: LocalDiskCacheBackend, GCSCacheBackend or anything with get/put/delete
+        :param ttl_rules: endpoint -> TTL in seconds, IMMUTABLE for entries that never expire
+        :param default_ttl: TTL of endpoints without a rule
+        '''
+        self.logger = logging.getLogger(str(self.__class__))
+        self.backend = backend
+        self.ttl_rules = dict(DEFAULT_TTL_RULES, **(ttl_rules or {}))
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(endpoint: str, symbol: str = None, range: str = None):
+        raw = '|'.join([endpoint, symbol or '', str(range or '')])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get_ttl(self, endpoint: str):
+        return self.ttl_rules.get(endpoint, self.default_ttl)
+
+    def get(self, endpoint: str, symbol: str = None, range: str = None, ttl=_USE_RULES):
+        '''
+        :param ttl: overrides the endpoint's TTL rule for this lookup
+        :return: cached bytes or None when missing or expired
+        '''
+        if ttl is _USE_RULES:
+            ttl = self.get_ttl(endpoint)
+        entry = self.backend.get(self.make_key(endpoint, symbol, range))
+        if entry is not None and (ttl is IMMUTABLE or time.time() - entry[1] < ttl):
+            self._count(hit=True)
+            return entry[0]
+        self._count(hit=False)
+        return None
+
+    def put(self, endpoint: str, symbol: str, range: str, data: bytes):
+        self.backend.put(self.make_key(endpoint, symbol, range), data)
+
+    def invalidate(self, endpoint: str, symbol: str = None, range: str = None):
+        self.backend.delete(self.make_key(endpoint, symbol, range))
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get_stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
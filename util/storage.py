@@ -0,0 +1,165 @@
+"""
+Single storage layer over local disk, GCS and memory through fsspec. Filesystem instances are pooled
+per protocol and options, local directories are created on write, and multi-file reads and writes
+run concurrently.
+"""
+
+import logging
+import os
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import fsspec
+from fsspec.core import split_protocol
+
+LOCAL_PROTOCOL = 'file'
+MEMORY_PROTOCOL = 'memory'
+DEFAULT_MAX_WORKERS = 8
+
+_filesystems = {}
+_filesystems_lock = threading.Lock()
+
+
+def get_filesystem(protocol: str = None, storage_options: dict = None):
+    '''
+    Shared filesystem instance for protocol and storage_options, so connections and credentials
+    are set up once per process
+    '''
+    protocol = protocol or LOCAL_PROTOCOL
+    options = storage_options or {}
+    key = (protocol, tuple(sorted((name, repr(value)) for name, value in options.items())))
+    with _filesystems_lock:
+        if key not in _filesystems:
+            _filesystems[key] = fsspec.filesystem(protocol, **options)
+        return _filesystems[key]
+
+
+def resolve(path: str, storage_options: dict = None):
+    '''
+    :return: (filesystem, path without protocol) for a local path or url
+    '''
+    protocol, _ = split_protocol(path)
+    fs = get_filesystem(protocol, storage_options)
+    return fs, fs._strip_protocol(path)
+
+
+def is_local(fs) -> bool:
+    return LOCAL_PROTOCOL in (fs.protocol if isinstance(fs.protocol, (tuple, list)) else [fs.protocol])
+
+
+def make_parent_dirs(path: str, storage_options: dict = None):
+    '''
+    Create the directory of a local path, object stores have no directories so nothing happens there
+    :return: path, absolute when local
+    '''
+    fs, fs_path = resolve(path, storage_options)
+    if not is_local(fs):
+        return path
+    fs.makedirs(posixpath.dirname(fs_path), exist_ok=True)
+    return fs_path
+
+
+def open_file(path: str, mode: str = 'rb', storage_options: dict = None):
+    '''
+    Open a local path or url, creating missing local directories when writing
+    '''
+    if 'r' not in mode:
+        make_parent_dirs(path, storage_options)
+    fs, fs_path = resolve(path, storage_options)
+    return fs.open(fs_path, mode)
+
+
+def exists(path: str, storage_options: dict = None) -> bool:
+    fs, fs_path = resolve(path, storage_options)
+    return fs.exists(fs_path)
+
+
+class Storage:
+    '''
+    A root location on one filesystem. Paths given to its methods are relative to the root.
+    '''
+    def __init__(self, root: str, storage_options: dict = None, max_workers: int = DEFAULT_MAX_WORKERS):
+        '''
+        :param root: local directory, gs://bucket/prefix or memory://prefix
+        :param storage_options: extra arguments for the fsspec filesystem
+        :param max_workers: concurrency of the multi-file operations
+        '''
+        self.logger = logging.getLogger(str(self.__class__))
+        protocol, _ = split_protocol(root)
+        if protocol is None:
+            root = os.path.abspath(root)
+        self.protocol = protocol or LOCAL_PROTOCOL
+        self.root = root.rstrip('/')
+        self.max_workers = max_workers
+        self.fs, self._fs_root = resolve(self.root, storage_options)
+
+    @classmethod
+    def memory(cls, root: str = 'flows', **kwargs):
+        '''
+        Storage kept in process memory, for tests and benchmarks
+        '''
+        return cls('{}://{}'.format(MEMORY_PROTOCOL, root.strip('/')), **kwargs)
+
+    @property
+    def is_local(self):
+        return self.protocol == LOCAL_PROTOCOL
+
+    def url(self, *parts) -> str:
+        '''
+        Full url (or absolute local path) of parts under the root
+        '''
+        return posixpath.join(self.root, *parts)
+
+    def _fs_path(self, path: str) -> str:
+        protocol, _ = split_protocol(path)
+        if protocol is not None or path.startswith(self._fs_root):
+            return self.fs._strip_protocol(path)
+        return posixpath.join(self._fs_root, path)
+
+    def exists(self, path: str) -> bool:
+        return self.fs.exists(self._fs_path(path))
+
+    def open(self, path: str, mode: str = 'rb'):
+        fs_path = self._fs_path(path)
+        if 'r' not in mode and self.is_local:
+            self.fs.makedirs(posixpath.dirname(fs_path), exist_ok=True)
+        return self.fs.open(fs_path, mode)
+
+    def read_bytes(self, path: str) -> bytes:
+        with self.open(path, 'rb') as f:
+            return f.read()
+
+    def write_bytes(self, path: str, data: bytes):
+        with self.open(path, 'wb') as f:
+            f.write(data)
+
+    def glob(self, pattern: str) -> list:
+        return sorted(self.fs.glob(self._fs_path(pattern)))
+
+    def rm(self, paths):
+        self.fs.rm([self._fs_path(path) for path in ([paths] if isinstance(paths, str) else paths)])
+
+    def mv(self, source: str, target: str):
+        self.fs.mv(self._fs_path(source), self._fs_path(target))
+
+    def cat(self, paths: list) -> dict:
+        '''
+        Read many files concurrently
+        :return: {path: bytes}
+        '''
+        fs_paths = [self._fs_path(path) for path in paths]
+        if getattr(self.fs, 'async_impl', False):
+            # gcsfs batches these requests on its own event loop
+            contents = self.fs.cat(fs_paths)
+            return {path: contents[fs_path] for path, fs_path in zip(paths, fs_paths)}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip(paths, executor.map(self.read_bytes, paths)))
+
+    def put(self, contents: dict):
+        '''
+        Write many files concurrently
+        :param contents: {path: bytes}
+        '''
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(lambda item: self.write_bytes(*item), contents.items()))
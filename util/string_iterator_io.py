@@ -5,18 +5,24 @@ class StringIteratorIO(io.TextIOBase):
     def __init__(self, iter: Iterator[str]):
         self._iter = iter
         self._buff = ''
+        self._pos = 0
 
     def readable(self) -> bool:
         return True
 
     def _read1(self, n: Optional[int] = None) -> str:
-        while not self._buff:
+        # Track a read position instead of re-slicing the remainder of the buffer on every call
+        while self._pos >= len(self._buff):
             try:
                 self._buff = next(self._iter)
+                self._pos = 0
             except StopIteration:
+                self._buff = ''
+                self._pos = 0
                 break
-        ret = self._buff[:n]
-        self._buff = self._buff[len(ret):]
+        end = len(self._buff) if n is None else self._pos + n
+        ret = self._buff[self._pos:end]
+        self._pos += len(ret)
         return ret
 
     def read(self, n: Optional[int] = None) -> str:
@@ -34,4 +40,50 @@ class StringIteratorIO(io.TextIOBase):
                     break
                 n -= len(m)
                 line.append(m)
-        return ''.join(line)
\ No newline at end of file
+        return ''.join(line)
+
+
+class BytesIteratorIO(io.RawIOBase):
+    '''
+    Binary counterpart of StringIteratorIO. Only one chunk from the iterator is held at a time,
+    so a producer that encodes its data lazily never has the whole payload in memory.
+    '''
+    def __init__(self, iter: Iterator[bytes]):
+        self._iter = iter
+        self._buff = b''
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def _fill(self) -> bool:
+        while self._pos >= len(self._buff):
+            try:
+                self._buff = next(self._iter)
+                self._pos = 0
+            except StopIteration:
+                self._buff = b''
+                self._pos = 0
+                return False
+        return True
+
+    def readinto(self, b) -> int:
+        if not self._fill():
+            return 0
+        size = min(len(b), len(self._buff) - self._pos)
+        b[:size] = memoryview(self._buff)[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def read(self, n: Optional[int] = -1) -> bytes:
+        if n is None or n < 0:
+            chunks = []
+            while self._fill():
+                chunks.append(self._buff[self._pos:])
+                self._pos = len(self._buff)
+            return b''.join(chunks)
+        if not self._fill():
+            return b''
+        ret = self._buff[self._pos:self._pos + n]
+        self._pos += len(ret)
+        return ret
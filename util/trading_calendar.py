@@ -0,0 +1,152 @@
+"""
+US trading calendar built from the IEX trade dates reference data, fetched once and cached in storage
+"""
+
+import datetime as dt
+import json
+import logging
+
+import numpy as np
+
+from flows.util.storage import exists, open_file, resolve
+from flows.util.util import IEXUtil
+
+DEFAULT_LOOKBACK_DAYS = 1300  # trading days, a little over 5 years
+DEFAULT_LOOKAHEAD_DAYS = 260  # trading days, about one year
+
+
+def _to_day(value) -> np.datetime64:
+    return np.datetime64(IEXUtil.convert_to_date(value), 'D')
+
+
+class TradingCalendar:
+    '''
+    Sorted datetime64[D] array of trade dates, lookups are binary searches over it.
+    Dates outside [first_date, last_date] are not covered and raise ValueError.
+    '''
+    def __init__(self, trade_dates):
+        self.trade_dates = np.unique(IEXUtil.convert_to_datetime64(list(trade_dates), 'D'))
+        if not len(self.trade_dates):
+            raise ValueError('TradingCalendar requires at least one trade date')
+
+    @property
+    def first_date(self) -> dt.date:
+        return self.trade_dates[0].item()
+
+    @property
+    def last_date(self) -> dt.date:
+        return self.trade_dates[-1].item()
+
+    def covers(self, date) -> bool:
+        return self.trade_dates[0] <= _to_day(date) <= self.trade_dates[-1]
+
+    def has_previous_trading_day(self, date) -> bool:
+        '''
+        True when previous_trading_day(date) can be answered, i.e. date is covered and after first_date
+        '''
+        return self.trade_dates[0] < _to_day(date) <= self.trade_dates[-1]
+
+    def has_next_trading_day(self, date) -> bool:
+        '''
+        True when next_trading_day(date) can be answered, i.e. date is covered and before last_date
+        '''
+        return self.trade_dates[0] <= _to_day(date) < self.trade_dates[-1]
+
+    def _check(self, day):
+        if not self.trade_dates[0] <= day <= self.trade_dates[-1]:
+            raise ValueError('{} is outside the calendar range {} - {}'.format(day, self.first_date, self.last_date))
+
+    def is_trading_day(self, date) -> bool:
+        day = _to_day(date)
+        self._check(day)
+        index = np.searchsorted(self.trade_dates, day)
+        return bool(self.trade_dates[index] == day)
+
+    def previous_trading_day(self, date) -> dt.date:
+        '''
+        Last trading day strictly before date
+        '''
+        return self.nth_trading_day(date, -1)
+
+    def next_trading_day(self, date) -> dt.date:
+        '''
+        First trading day strictly after date
+        '''
+        return self.nth_trading_day(date, 1)
+
+    def nth_trading_day(self, date, n: int) -> dt.date:
+        '''
+        :param n: n-th trading day after date when positive, before date when negative, date itself
+                  (or the next trading day) when 0
+        '''
+        day = _to_day(date)
+        self._check(day)
+        if n > 0:
+            index = np.searchsorted(self.trade_dates, day, side='right') + n - 1
+        else:
+            index = np.searchsorted(self.trade_dates, day, side='left') + n
+        if not 0 <= index < len(self.trade_dates):
+            raise ValueError('{} trading days from {} is outside the calendar range'.format(n, date))
+        return self.trade_dates[index].item()
+
+    def trading_days_between(self, start_date, end_date) -> np.ndarray:
+        '''
+        Trading days from start_date to end_date inclusive, as datetime64[D]
+        '''
+        start, end = _to_day(start_date), _to_day(end_date)
+        self._check(start)
+        self._check(end)
+        return self.trade_dates[np.searchsorted(self.trade_dates, start, side='left'):
+                                np.searchsorted(self.trade_dates, end, side='right')]
+
+    def count_trading_days(self, start_date, end_date) -> int:
+        return len(self.trading_days_between(start_date, end_date))
+
+    def save(self, path: str):
+        '''
+        :param path: local path or url, written to a temporary file first and then moved over the old one
+        '''
+        content = json.dumps({'trade_dates': np.datetime_as_string(self.trade_dates, unit='D').tolist()})
+        temp_path = path + '.tmp'
+        with open_file(temp_path, 'wb') as f:
+            f.write(content.encode('utf-8'))
+        fs, fs_path = resolve(temp_path)
+        fs.mv(fs_path, resolve(path)[1])
+
+    @classmethod
+    def load(cls, path: str):
+        '''
+        :param path: local path or url
+        :return: TradingCalendar or None when there is no readable cache at path
+        '''
+        if not exists(path):
+            return None
+        try:
+            with open_file(path, 'rb') as f:
+                return cls(json.loads(f.read().decode('utf-8'))['trade_dates'])
+        except (ValueError, KeyError):
+            logging.warning('Ignoring unreadable trading calendar {}'.format(path))
+            return None
+
+    @classmethod
+    def from_iex(cls, client, cache_path: str = None, lookback: int = DEFAULT_LOOKBACK_DAYS,
+                 lookahead: int = DEFAULT_LOOKAHEAD_DAYS, today: dt.date = None):
+        '''
+        Calendar around today from the IEX trade dates endpoints. The disk cache is reused as long
+        as it covers today, which holds for about a year with the default lookahead.
+        :param client: IEXClient
+        :param cache_path: JSON file for the trade dates, local path or url
+        '''
+        today = today or dt.date.today()
+        if cache_path:
+            calendar = cls.load(cache_path)
+            if calendar is not None and calendar.first_date < today <= calendar.last_date:
+                return calendar
+        # Both endpoints exclude the date they are given, counting forward from yesterday keeps today
+        yesterday = today - dt.timedelta(days=1)
+        calendar = cls(client.get_trade_dates('last', lookback, today) +
+                       client.get_trade_dates('next', lookahead, yesterday))
+        if cache_path:
+            calendar.save(cache_path)
+        logging.info('Loaded trading calendar {} - {} from IEX'.format(calendar.first_date, calendar.last_date))
+        return calendar
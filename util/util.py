@@ -4,24 +4,128 @@ Created by Kenneth Nursalim on 12/15/2020
 """
 
 import datetime as dt
+import warnings
+from functools import lru_cache
+
 import dateutil.parser
+import numpy as np
 import pandas as pd
 
+EPOCH_UNIT_MULTIPLIERS = {'s': 1000, 'ms': 1}
+
+
+@lru_cache(maxsize=65536)
+def _parse_datetime_str(data: str) -> dt.datetime:
+    # IEX dates are ISO-8601, only fall back to dateutil for anything else
+    try:
+        return dt.datetime.fromisoformat(data)
+    except ValueError:
+        return dateutil.parser.parse(data)
+
+
+@lru_cache(maxsize=65536)
+def _parse_datetime64_str(data: str) -> np.datetime64:
+    datetime = _parse_datetime_str(data)
+    if datetime.tzinfo is not None:
+        datetime = datetime.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return np.datetime64(datetime, 'ms')
+
+
 class IEXUtil:
     @staticmethod
     def convert_to_date(data) -> dt.date:
+        if isinstance(data, dt.date) and not isinstance(data, dt.datetime):
+            return data
         return IEXUtil.convert_to_datetime(data).date()
 
     @staticmethod
     def convert_to_datetime(data) -> dt.datetime:
         if isinstance(data, str):
-            datetime = dateutil.parser.parse(data)
+            datetime = _parse_datetime_str(data)
         elif isinstance(data, int) or isinstance(data, float):
             datetime = dt.datetime.fromtimestamp(data, tz=dt.timezone.utc)
         elif isinstance(data, pd.Timestamp):
             datetime = pd.to_datetime(data)
+        elif isinstance(data, dt.datetime):
+            datetime = data
+        elif isinstance(data, dt.date):
+            datetime = dt.datetime.combine(data, dt.time())
         elif data is None:
             datetime = datetime = dt.datetime.fromtimestamp(0, tz=dt.timezone.utc)  # Epoch 0
         else:
             raise Exception("Unknown datetime format")
         return datetime
+
+    @staticmethod
+    def convert_to_datetime64(values, unit: str = 'D', epoch_unit: str = 's') -> np.ndarray:
+        '''
+        Bulk conversion of a column of ISO-8601 strings, epoch numbers or dates. Timezone offsets
+        are converted to UTC and dropped, None becomes NaT. Empty or unparseable strings raise
+        ValueError, like convert_to_datetime.
+        :param values: list, array or Series
+        :param unit: datetime64 unit of the result, e.g. 'D' or 'ms'
+        :param epoch_unit: unit of numeric values, 's' or 'ms'
+        :return: numpy datetime64 array
+        '''
+        values = np.asarray(values)
+        dtype = 'datetime64[{}]'.format(unit)
+        if values.dtype.kind in 'iuf':
+            millis = np.rint(values.astype('float64') * EPOCH_UNIT_MULTIPLIERS[epoch_unit])
+            result = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[ms]')
+            valid = ~np.isnan(millis)
+            result[valid] = millis[valid].astype('int64').astype('datetime64[ms]')
+            return result.astype(dtype)
+        if values.dtype.kind == 'M':
+            return values.astype(dtype)
+        try:
+            # Strict ISO-8601 fast path, numpy refuses anything else
+            with warnings.catch_warnings():
+                warnings.simplefilter('error')
+                result = np.array(values, dtype=dtype)
+        except (ValueError, TypeError, DeprecationWarning, UserWarning):
+            pass
+        else:
+            # numpy reads '' and 'NaT' as NaT, only missing values may end up there
+            for value in values[np.isnat(result)].tolist():
+                if not IEXUtil._is_missing(value):
+                    raise ValueError("Unable to parse datetime from {!r}".format(value))
+            return result
+        return np.array([IEXUtil._to_datetime64(value, epoch_unit) for value in values], dtype='datetime64[ms]').astype(dtype)
+
+    @staticmethod
+    def _is_missing(value) -> bool:
+        return value is None or value is pd.NaT or (isinstance(value, float) and np.isnan(value))
+
+    @staticmethod
+    def _to_datetime64(value, epoch_unit: str = 's') -> np.datetime64:
+        if IEXUtil._is_missing(value):
+            return np.datetime64('NaT')
+        if isinstance(value, str):
+            return _parse_datetime64_str(value)
+        if isinstance(value, (int, float, np.integer, np.floating)):
+            return np.datetime64(int(round(value * EPOCH_UNIT_MULTIPLIERS[epoch_unit])), 'ms')
+        datetime = IEXUtil.convert_to_datetime(value)
+        if datetime.tzinfo is not None:
+            datetime = datetime.astimezone(dt.timezone.utc).replace(tzinfo=None)
+        return np.datetime64(datetime, 'ms')
+
+    @staticmethod
+    def convert_to_dates(values) -> list:
+        '''
+        Bulk counterpart of convert_to_date, NaT becomes None
+        '''
+        return IEXUtil.convert_to_datetime64(values, 'D').astype(object).tolist()
+
+    @staticmethod
+    def convert_dict_dates(records: list, keys: list) -> list:
+        '''
+        Copies of records with the date fields in keys converted in bulk to datetime.date,
+        records missing a key are left without it
+        '''
+        records = [dict(record) for record in records]
+        for key in keys:
+            positions = [i for i, record in enumerate(records) if key in record]
+            dates = IEXUtil.convert_to_dates([records[i][key] for i in positions])
+            for i, date in zip(positions, dates):
+                records[i][key] = date
+        return records